@@ -226,7 +226,9 @@ class _CompoundType(AST):
 
         # Add fake spids field.
         # TODO: Only do this if 'attributes' are set.
-        if self.fields:
+        # A type with a span_id, like token, already has a location, and there
+        # are many of them, so don't give each one a list.
+        if self.fields and not any(f.name == 'span_id' for f in self.fields):
           self.fields.append(Field('int', 'spids', seq=True))
 
         self.field_lookup = {f.name: f for f in self.fields}
@@ -0,0 +1,304 @@
+"""
+decode.py: Read the OHeap format written by encode.py back into Python objects.
+
+For speed, the Decoder compiles a function for each type in the schema, like
+collections.namedtuple() does.  Each function decodes one record, with one
+struct.unpack_from() call for all of its fields.
+
+The buffer can be a string or an mmap.  In lazy mode, records that point to
+other records are returned as proxies, which are subclasses of the generated
+classes.  Their fields are decoded from the buffer on first access, so only
+the parts of a tree that are used are ever materialized.
+"""
+
+import mmap
+import struct
+
+from asdl import asdl_ as asdl
+from asdl import const
+from asdl import py_meta
+
+
+class DecodeError(Exception):
+  pass
+
+
+_HEADER = b'OHP\x01'
+
+
+def _MakeClassLookup(root):
+  """Find the classes generated for a schema.
+
+  Args:
+    root: module with the generated classes, e.g. osh.ast_
+
+  Returns:
+    cls_lookup: Constructor or Product descriptor -> class
+    enum_lookup: simple Sum descriptor -> list of SimpleObj, by enum_id
+  """
+  cls_lookup = {}
+  enum_lookup = {}
+  for name in dir(root):
+    cls = getattr(root, name)
+    desc = getattr(cls, 'ASDL_TYPE', None)
+    if not isinstance(cls, type) or desc is None:
+      continue
+
+    if issubclass(cls, py_meta.SimpleObj):
+      values = [v for v in vars(cls).itervalues() if isinstance(v, cls)]
+      by_id = [None] * (len(values) + 1)
+      for v in values:
+        by_id[v.enum_id] = v
+      enum_lookup[desc] = by_id
+
+    elif isinstance(desc, (asdl.Constructor, asdl.Product)):
+      cls_lookup[desc] = cls
+
+  return cls_lookup, enum_lookup
+
+
+def _IntsFormat(n):
+  """struct format for n 24-bit integers, as (low 16 bits, high 8 bits)."""
+  return 'HB' * n
+
+
+_UNPACK_INT = struct.Struct('<' + _IntsFormat(1)).unpack_from
+
+
+_ARRAY_STRUCTS = {}  # length -> Struct for the length and items
+
+
+def _ReadArray(buf, pos):
+  """Return the integers of the array at a byte offset."""
+  lo, hi = _UNPACK_INT(buf, pos)
+  length = lo | (hi << 16)
+  if length == 0:
+    return []
+  try:
+    st = _ARRAY_STRUCTS[length]
+  except KeyError:
+    st = struct.Struct('<' + _IntsFormat(length + 1))
+    _ARRAY_STRUCTS[length] = st
+  parts = st.unpack_from(buf, pos)
+  return [lo | (hi << 16) for lo, hi in zip(parts[2::2], parts[3::2])]
+
+
+def _HasRecordFields(desc):
+  """Does a record point to other records?  If not, it's decoded eagerly."""
+  for _, d in desc.GetFields():
+    while isinstance(d, (asdl.MaybeType, asdl.ArrayType)):
+      d = d.desc
+    if isinstance(d, asdl.Product):
+      return True
+    if isinstance(d, asdl.Sum) and not asdl.is_simple(d):
+      return True
+  return False
+
+
+def _MakeLazyClass(cls, materialize):
+  """Make a subclass of cls whose fields are filled in by materialize(obj)."""
+
+  def __getattr__(self, name):
+    # Only called for attributes that aren't set.
+    if name.startswith('_') or self._ctx is None:
+      raise AttributeError(name)
+    materialize(self)
+    return getattr(self, name)
+
+  return type(cls.__name__, (cls,), {
+      '__slots__': ('_ctx', '_ref'), '__getattr__': __getattr__,
+      '__module__': cls.__module__,
+  })
+
+
+def MapFile(f):
+  """Map an open file read-only, to pass to DecodeRoot()."""
+  return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class Decoder(object):
+  """Decode an OHeap buffer, with the same parameters as encode.py.
+
+  Span IDs are relocated while decoding, because the decoded tree is put in an
+  arena where the spans of the encoded tree start at a different ID.
+  """
+
+  def __init__(self, root, user_types, lazy=False):
+    """
+    Args:
+      root: module with the generated classes, e.g. osh.ast_
+      user_types: dict of UserType class -> function from int to instance,
+        e.g. {Id: id_kind.IdInstance}
+      lazy: if True, decode records with record fields on first access
+    """
+    self.cls_lookup, self.enum_lookup = _MakeClassLookup(root)
+    self.user_types = user_types
+    self.lazy = lazy
+
+    # The globals of the compiled functions.  Each function takes a context
+    # tuple of (buf, base, align, delta) for the tree being decoded, so many
+    # trees can be decoded at once.
+    self.ns = {
+        'ReadArray': _ReadArray, 'NO_INTEGER': const.NO_INTEGER,
+    }
+    self.func_names = {}  # descriptor -> name of compiled function in ns
+
+  def _Global(self, value):
+    name = '_g%d' % len(self.ns)
+    self.ns[name] = value
+    return name
+
+  def _Expr(self, desc, field_name, n):
+    """Return a Python expression that decodes a field.
+
+    Args:
+      desc: field type
+      field_name: 'span_id' and 'spids' are relocated
+      n: expression for the integer or reference stored for the field
+    """
+    if isinstance(desc, asdl.MaybeType):
+      desc = desc.desc  # None is encoded as a 0 ref; see encode.py
+
+    if isinstance(desc, asdl.IntType):
+      if field_name in ('span_id', 'spids'):
+        return '(%s if %s == NO_INTEGER else %s + delta)' % (n, n, n)
+      return n
+
+    if isinstance(desc, asdl.BoolType):
+      return 'bool(%s)' % n
+
+    if isinstance(desc, asdl.StrType):
+      # mmap objects don't have index()
+      return ("buf[base + %s * align : buf.find('\\0', base + %s * align)]" %
+              (n, n))
+
+    if isinstance(desc, asdl.ArrayType):
+      item = self._Expr(desc.desc, field_name, 'i')
+      if item == 'i':  # integers
+        return 'ReadArray(buf, base + %s * align)' % n
+      return '[%s for i in ReadArray(buf, base + %s * align)]' % (item, n)
+
+    if isinstance(desc, asdl.UserType):
+      name = self._Global(self.user_types[desc.typ])
+      return '(%s(%s) if %s else None)' % (name, n, n)
+
+    if isinstance(desc, asdl.Sum) and asdl.is_simple(desc):
+      return '%s[%s]' % (self._Global(self.enum_lookup[desc]), n)
+
+    return '(%s(c, %s) if %s else None)' % (self._FuncName(desc), n, n)
+
+  def _DecodeFields(self, fields, tag):
+    """Return lines that set n0, n1, ... to the integers stored for fields.
+
+    The record starts at byte 'pos'.
+    """
+    if not fields:
+      return []
+    lines = []
+    parts = ', '.join('lo%d, hi%d' % (i, i) for i in xrange(len(fields)))
+    unpack = self._Global(
+        struct.Struct('<' + tag + _IntsFormat(len(fields))).unpack_from)
+    lines.append('  %s, = %s(buf, pos)' % (parts, unpack))
+    for i in xrange(len(fields)):
+      lines.append('  n%d = lo%d | (hi%d << 16)' % (i, i, i))
+    return lines
+
+  def _FuncName(self, desc):
+    """Return the name of the function that decodes a record of type desc.
+
+    It's compiled on first use.
+    """
+    try:
+      return self.func_names[desc]
+    except KeyError:
+      pass
+    name = '_f%d' % len(self.func_names)
+    self.func_names[desc] = name  # before compiling, for recursive types
+
+    if isinstance(desc, asdl.Sum):
+      # Dispatch on the tag byte.  The table is filled in below, after the
+      # constructors are compiled.
+      table_name = self._Global([None] * (len(desc.types) + 1))
+      code = ('def %s(c, ref):\n'
+              '  buf, base, align, _ = c\n'
+              '  return %s[ord(buf[base + ref * align])](c, ref)\n' %
+              (name, table_name))
+      exec code in self.ns
+      for i, cons in enumerate(desc.types):
+        self.ns[table_name][i + 1] = self.ns[self._FuncName(cons)]
+      return name
+
+    fields = list(desc.GetFields())
+    tag = 'x' if isinstance(desc, asdl.Constructor) else ''
+    cls = self.cls_lookup[desc]
+
+    if self.lazy and _HasRecordFields(desc):
+      self._CompileLazy(name, cls, fields, tag)
+      return name
+
+    lines = [
+        'def %s(c, ref):' % name,
+        '  buf, base, align, delta = c',
+        '  pos = base + ref * align',
+    ]
+    lines.extend(self._DecodeFields(fields, tag))
+    args = ', '.join(self._Expr(d, field_name, 'n%d' % i)
+                     for i, (field_name, d) in enumerate(fields))
+    lines.append('  return %s(%s)' % (self._Global(cls), args))
+
+    exec '\n'.join(lines) + '\n' in self.ns
+    return name
+
+  def _CompileLazy(self, name, cls, fields, tag):
+    """Compile a function that returns a proxy, and one that fills it in."""
+    m_name = name.replace('_f', '_m')
+    # DebugCompoundObj checks types in __setattr__, so bypass it.
+    if cls.__setattr__ is object.__setattr__:
+      assign = '  obj.%s = %s'
+    else:
+      assign = '  setattr_(obj, %r, %s)'
+      self.ns['setattr_'] = object.__setattr__
+
+    lazy_cls = _MakeLazyClass(cls, lambda obj: self.ns[m_name](obj))
+    set_ctx = self._Global(lazy_cls._ctx.__set__)
+    set_ref = self._Global(lazy_cls._ref.__set__)
+
+    lines = [
+        'def %s(obj):' % m_name,
+        '  c = obj._ctx',
+        '  buf, base, align, delta = c',
+        '  pos = base + obj._ref * align',
+    ]
+    lines.extend(self._DecodeFields(fields, tag))
+    for i, (field_name, d) in enumerate(fields):
+      lines.append(assign % (field_name, self._Expr(d, field_name, 'n%d' % i)))
+    lines.append('  %s(obj, None)' % set_ctx)  # release the buffer
+    exec '\n'.join(lines) + '\n' in self.ns
+
+    code = ('def %s(c, ref):\n'
+            '  obj = %s(%s)\n'
+            '  %s(obj, c)\n'
+            '  %s(obj, ref)\n'
+            '  return obj\n' % (name, self._Global(cls.__new__),
+                                self._Global(lazy_cls), set_ctx, set_ref))
+    exec code in self.ns
+
+  def DecodeRoot(self, buf, root_desc, span_delta=0, offset=0):
+    """
+    Args:
+      buf: string or mmap with the output of encode.EncodeRoot()
+      root_desc: descriptor of the root type, e.g. the 'command' Sum
+      span_delta: added to 'span_id' fields and the elements of 'spids'
+      offset: where the OHeap data starts in buf
+
+    Returns:
+      The root object.  In lazy mode, it refers to buf until it and all its
+      descendants are materialized.
+    """
+    if buf[offset : offset + 4] != _HEADER:
+      raise DecodeError('Invalid OHeap header %r' % buf[offset : offset + 4])
+    func = self.ns[self._FuncName(root_desc)]
+
+    lo, hi = _UNPACK_INT(buf, offset + 5)
+    c = (buf, offset, ord(buf[offset + 4]), span_delta)
+    return func(c, lo | (hi << 16))
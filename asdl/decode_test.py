@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+decode_test.py: Tests for decode.py
+"""
+
+import cStringIO
+import os
+import unittest
+
+from asdl import const
+from asdl import encode
+from asdl import decode  # module under test
+
+from asdl import arith_ast
+
+ArithVar = arith_ast.ArithVar
+ArithBinary = arith_ast.ArithBinary
+Const = arith_ast.Const
+FuncCall = arith_ast.FuncCall
+Slice = arith_ast.Slice
+op_id_e = arith_ast.op_id_e
+
+
+def _Encode(obj):
+  f = cStringIO.StringIO()
+  encode.EncodeRoot(obj, encode.Params(), encode.BinOutput(f))
+  return f.getvalue()
+
+
+def _RoundTrip(obj, type_name, span_delta=0, lazy=False):
+  dec = decode.Decoder(arith_ast, {}, lazy=lazy)
+  root_desc = arith_ast.type_lookup.ByTypeName(type_name)
+  return dec.DecodeRoot(_Encode(obj), root_desc, span_delta=span_delta)
+
+
+def _MakeExpr():
+  return ArithBinary(
+      op_id_e.Plus, Const(1),
+      FuncCall('f', [ArithVar('x'), Slice(ArithVar('a'), Const(0))]))
+
+
+class DecoderTest(unittest.TestCase):
+
+  def testRoundTrip(self):
+    obj = _MakeExpr()
+    obj2 = _RoundTrip(obj, 'arith_expr')
+    self.assertEqual(repr(obj), repr(obj2))
+    self.assertEqual(None, obj2.right.args[1].end)  # Maybe
+    self.assertIs(op_id_e.Plus, obj2.op_id)
+
+    obj = arith_ast.assign('x', ['-r', ''])
+    obj2 = _RoundTrip(obj, 'assign')
+    self.assertEqual(['-r', ''], obj2.flags)
+
+  def testSpanDelta(self):
+    t = arith_ast.token(5, 'x', 10)
+    t2 = _RoundTrip(t, 'token', span_delta=100)
+    self.assertEqual(5, t2.id)
+    self.assertEqual(110, t2.span_id)
+
+    # Invalid span IDs are not relocated
+    t = arith_ast.token(5, 'x', const.NO_INTEGER)
+    t2 = _RoundTrip(t, 'token', span_delta=100)
+    self.assertEqual(const.NO_INTEGER, t2.span_id)
+
+  def testLazy(self):
+    obj = _MakeExpr()
+    obj2 = _RoundTrip(obj, 'arith_expr', lazy=True)
+    self.assertTrue(isinstance(obj2, ArithBinary))
+    self.assertEqual(arith_ast.arith_expr_e.ArithBinary, obj2.tag)
+    self.assertNotEqual(None, obj2._ctx)  # not decoded yet
+
+    self.assertEqual(None, obj2.right.args[1].end)
+    self.assertEqual(None, obj2._ctx)  # decoded on first access
+    self.assertRaises(AttributeError, getattr, obj2, 'bad')
+
+    self.assertEqual(repr(obj), repr(obj2))
+
+  def testLazyMappedFile(self):
+    path = '_tmp/decode_test.oheap'
+    with open(path, 'wb') as f:
+      f.write('padding' + _Encode(_MakeExpr()))
+    dec = decode.Decoder(arith_ast, {}, lazy=True)
+    root_desc = arith_ast.type_lookup.ByTypeName('arith_expr')
+    with open(path, 'rb') as f:
+      buf = decode.MapFile(f)
+    os.remove(path)  # the mapping stays valid
+
+    obj = dec.DecodeRoot(buf, root_desc, offset=len('padding'))
+    self.assertEqual('f', obj.right.name)
+    self.assertEqual(repr(_MakeExpr()), repr(obj))
+
+  def testInvalidHeader(self):
+    dec = decode.Decoder(arith_ast, {})
+    root_desc = arith_ast.type_lookup.ByTypeName('token')
+    self.assertRaises(decode.DecodeError, dec.DecodeRoot, 'XXX\x01', root_desc)
+
+
+if __name__ == '__main__':
+  unittest.main()
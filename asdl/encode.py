@@ -87,7 +87,7 @@ class Params:
     if n < 0:
       raise EncodeError(
           "ASDL can't currently encode negative numbers.  Got %d" % n)
-    if n > self.max_int:
+    if n >= self.max_int:
       raise EncodeError(
           '%d is too big to fit in %d bytes' % (n, self.int_width))
 
@@ -112,6 +112,8 @@ class Params:
     # pre-compute and store a hash value.  They will be looked up in the stack
     # and so forth.
     # - You could also return a obj number or object ID.
+    if b'\0' in s:
+      raise EncodeError("Strings can't contain NUL bytes: %r" % s)
     chunk.extend(s)
     chunk.append(0)  # NUL terminator
 
@@ -169,6 +171,11 @@ def EncodeArray(obj_list, item_desc, enc, out):
     for item in obj_list:
       enc.Int(item.enum_id, array_chunk)
 
+  elif isinstance(item_desc, asdl.UserType):
+    # Assume Id for now
+    for item in obj_list:
+      enc.Int(item.enum_value, array_chunk)
+
   else:
     # A simple value is either an int, enum, or pointer.  (Later: Iter<Str>
     # might be possible for locality.)
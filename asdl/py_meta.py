@@ -27,6 +27,7 @@ put: an op is Add() and not Add, an instance of a class, not an integer value.
 """
 
 import io
+import os
 import sys
 
 from asdl import asdl_ as asdl
@@ -35,6 +36,13 @@ from asdl import format as fmt
 from core import util
 
 
+# osh/ast_.py and core/runtime.py use the classes generated by gen_python.py,
+# which have __slots__ and no type checks.  Set OSH_DEBUG_ASDL=1 to create
+# DebugCompoundObj classes with MakeTypes() instead, which check the type of
+# every field assignment.
+DEBUG_TYPES = bool(os.getenv('OSH_DEBUG_ASDL'))
+
+
 def _CheckType(value, expected_desc):
   """Is value of type expected_desc?
 
@@ -106,12 +114,18 @@ class Obj(object):
   # runtime after metaprogramming.
   ASDL_TYPE = None  # Used for type checking
 
+  # Generated classes have __slots__, so instances have no __dict__.
+  # DebugCompoundObj doesn't, because it stores fields in __dict__.
+  __slots__ = ()
+
 
 class SimpleObj(Obj):
   """An enum value.
 
   Other simple objects: int, str, maybe later a float.
   """
+  __slots__ = ('enum_id', 'name')
+
   def __init__(self, enum_id, name):
     self.enum_id = enum_id
     self.name = name
@@ -126,6 +140,8 @@ class CompoundObj(Obj):
   # types.  Never set for product types.
   tag = None
 
+  __slots__ = ()
+
   # NOTE: SimpleObj could share this.
   def __repr__(self):
     ast_f = fmt.TextOutput(util.Buffer())  # No color by default.
@@ -262,7 +278,8 @@ def MakeTypes(module, root, type_lookup):
 
         # e.g. for arith_expr
         # Should this be arith_expr_t?  It is in C++.
-        base_class = type(defn.name, (DebugCompoundObj, ), {})
+        base_class = type(defn.name, (DebugCompoundObj, ),
+                          {'ASDL_TYPE': sum_type})
         setattr(root, defn.name, base_class)
 
         # Make a type and a enum tag for each alternative.
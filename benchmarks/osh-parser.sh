@@ -259,6 +259,146 @@ EOF
 EOF
 }
 
+#
+# Lexer comparisons
+#
+
+# Compare lexing one token per fastlex call with lexing a batch of tokens per
+# call (see LineLexer in core/lexer.py).  Writes a CSV with one row per file
+# and variant.
+#
+# Usage:
+#   benchmarks/osh-parser.sh compare-batch-lex [files.txt]
+compare-batch-lex() {
+  local files=${1:-benchmarks/osh-parser-files.txt}
+  local out_dir=$BASE_DIR/batch-lex
+  local times_out=$out_dir/times.csv
+
+  mkdir -p $out_dir
+  echo 'status,elapsed_secs,lexer,path' > $times_out
+
+  local path
+  for path in $(grep -v '^#' $files); do
+    echo "--- $path ---"
+    OSH_NO_BATCH_LEX=1 benchmarks/time.py \
+      --output $times_out --field 'per-token' --field "$path" -- \
+      bin/osh -n --ast-format none $path || echo FAILED
+    benchmarks/time.py \
+      --output $times_out --field 'batch' --field "$path" -- \
+      bin/osh -n --ast-format none $path || echo FAILED
+  done
+
+  # Print the per-file speedup.
+  awk -F , '
+    NR == 1 { next }
+    $3 == "per-token" { slow[$4] = $2 }
+    $3 == "batch" { fast[$4] = $2 }
+    END {
+      print "path,per_token_secs,batch_secs,speedup"
+      for (p in slow) {
+        printf "%s,%s,%s,%.2f\n", p, slow[p], fast[p], slow[p] / fast[p]
+      }
+    }' $times_out | sort > $out_dir/speedup.csv
+
+  cat $out_dir/speedup.csv
+}
+
+# Compare running 'source' on each file with an empty parse cache (cold) and
+# a filled one (warm).  See core/parse_cache.py.
+#
+# Usage:
+#   benchmarks/osh-parser.sh compare-parse-cache [files.txt]
+compare-parse-cache() {
+  local files=${1:-benchmarks/osh-parser-files.txt}
+  local out_dir=$BASE_DIR/parse-cache
+  local cache_dir=$out_dir/cache
+  local times_out=$out_dir/times.csv
+
+  mkdir -p $out_dir
+  echo 'status,elapsed_secs,cache,path' > $times_out
+
+  local path
+  for path in $(grep -v '^#' $files); do
+    echo "--- $path ---"
+    # Define the file's commands in a function that's never called, so that
+    # only parsing is measured.
+    local script=$out_dir/$(basename $path).sh
+    { echo 'f() {'; cat $path; echo; echo '}'; } > $script
+
+    rm -r -f $cache_dir
+    benchmarks/time.py \
+      --output $times_out --field 'cold' --field "$path" -- \
+      bin/osh --parse-cache $cache_dir -c "source $script" || echo FAILED
+    benchmarks/time.py \
+      --output $times_out --field 'warm' --field "$path" -- \
+      bin/osh --parse-cache $cache_dir -c "source $script" || echo FAILED
+  done
+
+  # Print the per-file speedup.
+  awk -F , '
+    NR == 1 { next }
+    $3 == "cold" { cold[$4] = $2 }
+    $3 == "warm" { warm[$4] = $2 }
+    END {
+      print "path,cold_secs,warm_secs,speedup"
+      for (p in cold) {
+        printf "%s,%s,%s,%.2f\n", p, cold[p], warm[p], cold[p] / warm[p]
+      }
+    }' $times_out | sort > $out_dir/speedup.csv
+
+  cat $out_dir/speedup.csv
+}
+
+# Compare the generated ASDL classes, which have __slots__, with the
+# DebugCompoundObj classes that check types (OSH_DEBUG_ASDL=1).  Writes parse
+# times, and the peak RSS after parsing each file.
+#
+# Usage:
+#   benchmarks/osh-parser.sh compare-asdl-classes [files.txt]
+compare-asdl-classes() {
+  local files=${1:-benchmarks/osh-parser-files.txt}
+  local out_dir=$BASE_DIR/asdl-classes
+  local times_out=$out_dir/times.csv
+
+  mkdir -p $out_dir
+  echo 'status,elapsed_secs,classes,path' > $times_out
+  echo 'classes,path,VmHWM_kb' > $out_dir/rss.csv
+
+  local path classes
+  for path in $(grep -v '^#' $files); do
+    echo "--- $path ---"
+    for classes in slots debug; do
+      local debug=''
+      test $classes = debug && debug=1
+      local mem_out=$out_dir/$classes.$(basename $path).txt
+
+      OSH_DEBUG_ASDL=$debug benchmarks/time.py \
+        --output $times_out --field $classes --field "$path" -- \
+        bin/osh -n --ast-format none --parser-mem-dump $mem_out $path \
+        || echo FAILED
+      awk -v c=$classes -v p=$path \
+        '$1 == "VmHWM:" { print c "," p "," $2 }' $mem_out >> $out_dir/rss.csv
+    done
+  done
+
+  cat $times_out $out_dir/rss.csv
+}
+
+# Parse all files in one process with 'osh -n --batch'.  Writes a CSV with
+# the status, parse time, and number of tokens and nodes of each file.  See
+# osh/syntax_check.py.
+#
+# Usage:
+#   benchmarks/osh-parser.sh batch-parse [files.txt]
+batch-parse() {
+  local files=${1:-benchmarks/osh-parser-files.txt}
+  local out_dir=$BASE_DIR/batch
+  mkdir -p $out_dir
+
+  bin/osh -n --batch --manifest $files > $out_dir/times.csv
+  cat $out_dir/times.csv
+}
+
 time-test() {
   benchmarks/time.py \
     --field bash --field foo.txt --output _tmp/bench.csv \
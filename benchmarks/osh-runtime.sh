@@ -339,6 +339,300 @@ abuild-h() {
   done
 }
 
+# Run an external command many times with a large environment, which stresses
+# what's done before each fork().  /bin/true is used because 'true' is a
+# builtin.
+spawn-loop() {
+  local n=${1:-10000}
+  local num_vars=${2:-250}
+
+  local i
+  for i in $(seq $num_vars); do
+    export SPAWN_LOOP_VAR_$i=$i
+  done
+  for sh_path in bash dash $OSH; do
+    echo $sh_path
+    time $sh_path -c "for i in \$(seq $n); do /bin/true; done"
+  done
+}
+
+# Compare starting external programs with posix_spawn() and fork().  A large
+# array makes the heap bigger, which makes fork() slower.
+spawn-vs-fork() {
+  local n=${1:-2000}
+  local heap_size=${2:-200000}
+
+  local code="a=( \$(seq $heap_size) )
+for i in \$(seq $n); do /bin/true; done"
+
+  echo 'spawn'
+  time $OSH -c "$code"
+  echo 'fork'
+  time OSH_ALWAYS_FORK=1 $OSH -c "$code"
+}
+
+# A pipeline ending in a builtin, with and without shopt -s lastpipe.
+lastpipe() {
+  local n=${1:-1000}
+  local code="for i in \$(seq $n); do /bin/echo \$i | read x; done"
+
+  echo 'fork'
+  time $OSH -c "$code"
+  echo 'lastpipe'
+  time $OSH -c "shopt -s lastpipe; $code"
+}
+
+# Start 1000 background jobs, and count zombies while the shell is busy
+# without calling wait().
+background-jobs() {
+  local n=${1:-1000}
+  local out_dir=_tmp/osh-runtime
+  mkdir -p $out_dir
+
+  cat > $out_dir/background-jobs.sh <<EOF
+for i in \$(seq $n); do /bin/true & done
+i=0; while test \$i -lt 3000; do i=\$((i+1)); done
+awk -v p=\$\$ '\$4 == p && \$3 == "Z"' /proc/[0-9]*/stat > $out_dir/zombies.txt &
+i=0; while test \$i -lt 3000; do i=\$((i+1)); done
+wait
+echo zombies=\$(wc -l < $out_dir/zombies.txt)
+EOF
+
+  for sh_path in bash dash $OSH; do
+    echo $sh_path
+    time $sh_path $out_dir/background-jobs.sh 2>/dev/null
+  done
+}
+
+# Read a file line by line with the read builtin.  The default is a 100 MB
+# file.
+read-lines() {
+  local num_lines=${1:-2000000}
+  local out_dir=_tmp/osh-runtime
+  mkdir -p $out_dir
+
+  local file=$out_dir/read-lines.txt
+  seq $num_lines | sed 's/$/ a line of a log file, padded to about 50 bytes/' \
+    > $file
+  ls -l $file
+
+  local code="n=0; while read -r line; do n=\$((n+1)); done < $file; echo \$n"
+  for sh_path in bash dash $OSH; do
+    echo $sh_path
+    time $sh_path -c "$code"
+  done
+}
+
+# Print lines with echo, to a file and to a pipe.
+echo-lines() {
+  local n=${1:-1000000}
+  local out_dir=_tmp/osh-runtime
+  mkdir -p $out_dir
+
+  local code="for i in \$(seq $n); do echo \$i; done"
+  for sh_path in bash dash $OSH; do
+    echo "$sh_path (file)"
+    time $sh_path -c "$code" > $out_dir/echo-lines.txt
+    echo "$sh_path (pipe)"
+    time $sh_path -c "$code" | wc -l
+  done
+}
+
+# Variable lookup with many frames on the stack: recursive fib, and reading
+# variables defined 20 frames up.
+# Field splitting of a big command sub.  The IFS splitter is native when
+# fastsplit.so is built; compare against the pure Python version by removing
+# it.
+ifs-split() {
+  local num_lines=${1:-20000}
+  local out_dir=_tmp/osh-runtime
+  mkdir -p $out_dir
+
+  local file=$out_dir/ifs-split.txt
+  seq $num_lines | sed 's/$/ some words:to split on IFS, about 50 bytes/' \
+    > $file
+  ls -l $file
+
+  local code="set -- \$(cat $file); echo \$#"
+  for sh_path in bash dash $OSH; do
+    echo $sh_path
+    time $sh_path -c "$code"
+  done
+}
+
+# case arms go through the compiled glob cache.
+case-dispatch() {
+  local n=${1:-100000}
+
+  local code='
+  n=0
+  for (( i = 0; i < '$n'; i++ )); do
+    case $i in
+      *[13579]) n=$((n+1)) ;;
+      [[:digit:]]0) ;;
+      *) ;;
+    esac
+  done
+  echo $n'
+  for sh_path in bash $OSH; do
+    echo $sh_path
+    time $sh_path -c "$code"
+  done
+}
+
+# Globs over a tree of 100 directories with 1000 files each.  OSH caches the
+# directory listings, so the later iterations don't re-read them.
+glob-tree() {
+  local iters=${1:-100}
+  local tree=_tmp/osh-runtime/glob-tree
+  if ! test -d $tree/d99; then
+    for d in $(seq 0 99); do
+      mkdir -p $tree/d$d
+      (cd $tree/d$d && seq 0 999 | sed 's/$/.c/' | xargs touch)
+    done
+  fi
+
+  local code='
+  for (( i = 0; i < '$iters'; i++ )); do
+    set -- '$tree'/*/*5.c; n=$#
+  done
+  shopt -s globstar
+  set -- '$tree'/**/*7?.c
+  echo $n $#'
+  for sh_path in bash $OSH; do
+    echo $sh_path
+    time $sh_path -c "$code"
+  done
+}
+
+# An option parser with many literal arms, which are looked up in a dict.
+case-literals() {
+  local n=${1:-20000}
+  local out_dir=_tmp/osh-runtime
+  mkdir -p $out_dir
+
+  local file=$out_dir/case-literals.sh
+  {
+    echo 'parse() {'
+    echo '  case "$1" in'
+    for i in $(seq 80); do
+      echo "    --opt$i) n=\$((n+$i)) ;;"
+    done
+    echo '    *) echo "unknown $1" ;;'
+    echo '  esac'
+    echo '}'
+    echo "n=0; for (( i = 0; i < $n; i++ )); do parse --opt\$((i % 80 + 1)); done"
+    echo 'echo $n'
+  } > $file
+
+  for sh_path in bash $OSH; do
+    echo $sh_path
+    time $sh_path $file
+  done
+}
+
+# Shortest prefix and longest suffix that only match at the end of the string.
+# These used to call fnmatch() on every prefix or suffix.
+strip-long() {
+  local n=${1:-5000}
+  local code='x=$(seq '$n' | tr "\n" /)a; y=${x#*[!0-9/]}; z=${x%%/*[!0-9/]}
+  echo ${#x} ${#y} ${#z}'
+  for sh_path in bash $OSH; do
+    echo $sh_path
+    time $sh_path -c "$code"
+  done
+}
+
+# A for loop over a big brace range.  The range is expanded as the loop runs,
+# so peak memory (VmHWM) shouldn't grow with n.
+brace-range() {
+  local n=${1:-1000000}
+  local code='for i in {1..'$n'}; do :; done
+  echo $i; grep VmHWM /proc/$$/status'
+  for sh_path in bash $OSH; do
+    echo $sh_path
+    time $sh_path -c "$code"
+  done
+}
+
+dynamic-scope() {
+  local out_dir=_tmp/osh-runtime
+  mkdir -p $out_dir
+
+  cat > $out_dir/fib.sh <<'EOF'
+fib() {
+  local n=$1
+  if test $n -lt 2; then
+    result=$n
+    return
+  fi
+  fib $((n - 1))
+  local a=$result
+  fib $((n - 2))
+  result=$((a + result))
+}
+fib 18
+echo $result
+EOF
+
+  cat > $out_dir/deep-call.sh <<'EOF'
+outer_var=x
+f() {
+  local depth=$1
+  if test $depth -eq 0; then
+    local i=0 s=''
+    while test $i -lt 10000; do
+      s=$outer_var$top_local
+      i=$((i + 1))
+    done
+    echo $s
+    return
+  fi
+  f $((depth - 1))
+}
+g() {
+  local top_local=y
+  f 20
+}
+g
+EOF
+
+  for script in fib.sh deep-call.sh; do
+    for sh_path in bash dash $OSH; do
+      echo "$sh_path $script"
+      time $sh_path $out_dir/$script
+    done
+  done
+}
+
+# Command subs that only call shell functions and builtins run without
+# forking.  Compare with OSH_ALWAYS_FORK_COMMAND_SUB, which always forks.
+command-sub() {
+  local n=${1:-1000}
+  local out_dir=_tmp/osh-runtime
+  mkdir -p $out_dir
+
+  cat > $out_dir/command-sub.sh <<EOF
+basename_like() {
+  local p=\$1
+  echo \${p##*/}
+}
+i=0
+while test \$i -lt $n; do
+  x=\$(basename_like "/usr/lib/foo\$i.so")
+  i=\$((i + 1))
+done
+echo \$x
+EOF
+
+  for sh_path in bash dash $OSH; do
+    echo $sh_path
+    time $sh_path $out_dir/command-sub.sh
+  done
+  echo "$OSH with OSH_ALWAYS_FORK_COMMAND_SUB"
+  time OSH_ALWAYS_FORK_COMMAND_SUB=1 $OSH $out_dir/command-sub.sh
+}
+
 #
 # Misc
 #
@@ -125,6 +125,19 @@ import-stats() {
   strace python -c 'import nonexistent___' 2>&1 | grep nonexistent___ | wc -l
 }
 
+# Count the execve() calls made to run external commands in a loop.  Without
+# the 'hash' table, each child tries every directory in $PATH before the one
+# with the command.
+exec-strace() {
+  local n=${1:-100}
+  local path=/nonexistent/1:/nonexistent/2:/nonexistent/3:$PATH
+  for sh in bash dash bin/osh; do
+    echo $sh
+    PATH=$path strace -f -e trace=execve $sh -c \
+      "for i in \$(seq $n); do expr 1 >/dev/null; done" 2>&1 | grep -c execve
+  done
+}
+
 make-zip() {
   rm -r -f _tmp/app
   rm -f _tmp/app.zip
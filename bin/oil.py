@@ -65,6 +65,7 @@ from osh import cmd_parse  # for tracing
 
 from osh import ast_ as ast
 from osh import parse_lib
+from osh import syntax_check
 
 from core import alloc
 from core import args
@@ -73,6 +74,7 @@ from core import cmd_exec
 from core.id_kind import Id
 from core import legacy
 from core import lexer  # for tracing
+from core import parse_cache
 from core import process
 from core import reader
 from core import state
@@ -102,7 +104,17 @@ def InteractiveLoop(opts, ex, c_parser, w_parser, line_reader):
   else:
     ast_f = None
 
+  arena = ex.arena
   while True:
+    # Lines and spans of each command are freed after it runs, unless it
+    # defined a function or trap that still refers to them.
+    mark = arena.Mark()
+    num_kept_nodes = ex.num_kept_nodes
+
+    # Tell the user about background jobs that finished.
+    ex.waiter.Reap()
+    ex.job_state.ReportDone()
+
     try:
       w = c_parser.Peek()
     except KeyboardInterrupt:
@@ -131,10 +143,19 @@ def InteractiveLoop(opts, ex, c_parser, w_parser, line_reader):
         ast.PrettyPrint(node)
 
       status = ex.Execute(node)
+      sys.stdout.flush()  # builtins don't flush their output
 
       if opts.print_status:
         print('STATUS', repr(status))
 
+    ex.ClearNodeCaches()
+    if ex.num_kept_nodes == num_kept_nodes:
+      arena.Release(mark)
+    if opts.print_status:
+      # The arena should stay the same size over many commands.
+      print('ARENA lines=%d spans=%d' % (arena.next_line_id,
+                                         arena.next_span_id))
+
     # Reset prompt to PS1.
     line_reader.Reset()
 
@@ -146,10 +167,84 @@ def InteractiveLoop(opts, ex, c_parser, w_parser, line_reader):
     c_parser.Reset()
 
 
+def ParseAndEvalLoop(ex, c_parser, w_parser):
+  """Parse and execute one top-level command at a time.
+
+  Used for scripts and stdin.  Unlike ParseWholeFile(), the first command runs
+  before the rest of the input is read, and the LST of each command is freed
+  after it runs.
+
+  Returns:
+    status: exit code of the last command, or 2 on a parse error.
+  """
+  arena = ex.arena
+  status = 0
+  try:
+    while True:
+      # Like InteractiveLoop.  Keep the lines and spans if a function or trap
+      # still refers to them.
+      mark = arena.Mark()
+      num_kept_nodes = ex.num_kept_nodes
+
+      try:
+        w = c_parser.Peek()
+        if w is None:
+          c_id = None
+          node = None
+        else:
+          c_id = word.CommandId(w)
+          if c_id == Id.Eof_Real:
+            break
+          if c_id == Id.Op_Newline:  # blank line or comment
+            node = None
+          else:
+            node = c_parser.ParseCommandLine()
+      except util.ParseError as e:
+        ui.PrettyPrintError(e, arena, sys.stderr)
+        print('parse error: %s' % e.UserErrorString(), file=sys.stderr)
+        return 2
+
+      if node is None and c_id != Id.Op_Newline:
+        # TODO: Remove this older form of error handling.
+        err = c_parser.Error()
+        ui.PrintErrorStack(err, arena, sys.stderr)
+        return 2  # parse error is code 2
+
+      if node is not None:
+        is_fatal, status = ex.ExecuteAndCatch(node)
+        node = None
+        ex.ClearNodeCaches()
+        if is_fatal:
+          break
+
+      if ex.num_kept_nodes == num_kept_nodes:
+        arena.Release(mark)
+
+      # Throw away the newline, and start the next command on a fresh line.
+      w_parser.Reset()
+      c_parser.Reset()
+  finally:
+    ex.RunExitTrap()
+
+  return status
+
+
 # bash --noprofile --norc uses 'bash-4.3$ '
 OSH_PS1 = 'osh$ '
 
 
+def _WriteProcStatus(out_path, flag_name):
+  # This might be superstition, but we want to let the value stabilize
+  # after parsing.  bash -c 'cat /proc/$$/status' gives different results
+  # with a sleep.
+  time.sleep(0.001)
+  input_path = '/proc/%d/status' % os.getpid()
+  with open(input_path) as f, open(out_path, 'w') as f2:
+    contents = f.read()
+    f2.write(contents)
+    log('Wrote %s to %s (%s)', input_path, out_path, flag_name)
+
+
 def _ShowVersion():
   loader = util.GetResourceLoader()
   f = loader.open('oil-version.txt')
@@ -193,6 +288,12 @@ def OshMain(argv, login_shell):
   spec.LongFlag('--print-status')
   spec.LongFlag('--trace', ['cmd-parse', 'word-parse', 'lexer'])  # NOTE: can only trace one now
   spec.LongFlag('--hijack-shebang')
+  spec.LongFlag('--parse-cache', args.Str)  # directory; see core/parse_cache.py
+
+  # osh -n --batch: parse many files, see osh/syntax_check.py
+  spec.LongFlag('--batch')
+  spec.LongFlag('--manifest', args.Str)  # file with a list of paths
+  spec.LongFlag('--jobs', args.Int)
 
   # For benchmarks/*.sh
   spec.LongFlag('--parser-mem-dump', args.Str)
@@ -233,7 +334,7 @@ def OshMain(argv, login_shell):
   # It uses a different memory-management model.  It's a batch program and not
   # an interactive program.
 
-  pool = alloc.Pool()
+  pool = alloc.Pool(compact=True, lazy_lines=True)
   arena = pool.NewArena()
 
   # TODO: Maybe wrap this initialization sequence up in an oil_State, like
@@ -252,9 +353,26 @@ def OshMain(argv, login_shell):
   exec_opts = state.ExecOpts(mem)
   builtin.SetExecOpts(exec_opts, opts.opt_changes)
 
+  if opts.batch:
+    if not exec_opts.noexec:
+      util.usage('--batch requires -n')
+      return 2
+    paths = argv[opt_index:]
+    if opts.manifest:
+      with open(opts.manifest) as f:
+        paths.extend(syntax_check.ReadManifest(f))
+    return syntax_check.CheckFiles(paths, sys.stdout, jobs=opts.jobs)
+
+  cache_dir = opts.parse_cache or os.getenv('OSH_PARSE_CACHE')
+  if cache_dir:
+    cache = parse_cache.ParseCache(cache_dir)
+  else:
+    cache = None
+
+  process.InitOutputBuffer()
   fd_state = process.FdState()
   ex = cmd_exec.Executor(mem, fd_state, status_lines, funcs, completion,
-                         comp_lookup, exec_opts, arena)
+                         comp_lookup, exec_opts, arena, parse_cache=cache)
 
   # NOTE: The rc file can contain both commands and functions... ideally we
   # would only want to save nodes/lines for the functions.
@@ -262,7 +380,7 @@ def OshMain(argv, login_shell):
     rc_path = 'oilrc'
     arena.PushSource(rc_path)
     with open(rc_path) as f:
-      rc_line_reader = reader.FileLineReader(f, arena)
+      rc_line_reader = reader.FileLineReader(f, arena, path=rc_path)
       _, rc_c_parser = parse_lib.MakeParser(rc_line_reader, arena)
       try:
         rc_node = rc_c_parser.ParseWholeFile()
@@ -280,6 +398,7 @@ def OshMain(argv, login_shell):
     if e.errno != errno.ENOENT:
       raise
 
+  cache_key = None  # Set if the script can be loaded from the parse cache
   if opts.c is not None:
     arena.PushSource('<command string>')
     line_reader = reader.StringLineReader(opts.c, arena)
@@ -307,7 +426,9 @@ def OshMain(argv, login_shell):
       except OSError as e:
         util.error("Couldn't open %r: %s", script_name, os.strerror(e.errno))
         return 1
-      line_reader = reader.FileLineReader(f, arena)
+      if cache:
+        cache_key = cache.MakeKey(f, script_name)
+      line_reader = reader.FileLineReader(f, arena, path=script_name)
       interactive = False
 
   # TODO: assert arena.NumSourcePaths() == 1
@@ -328,29 +449,44 @@ def OshMain(argv, login_shell):
     # TODO: status should be last command.  Start bash, type "f() { return 33;
     # }; f"
     status = 0
+  elif (opts.c is None and not opts.fix and not exec_opts.noexec and
+        not opts.show_ast and not opts.parser_mem_dump and not cache_key):
+    # Scripts and stdin are executed as they're parsed.  These options, and
+    # the parse cache, need the whole LST.
+    _tlog('ParseAndEvalLoop')
+    status = ParseAndEvalLoop(ex, c_parser, w_parser)
+
+    if opts.runtime_mem_dump:
+      _WriteProcStatus(opts.runtime_mem_dump, '--runtime-mem-dump')
   else:
     # Parse the whole thing up front
     #print('Parsing file')
 
-    _tlog('ParseWholeFile')
-    # TODO: Do I need ParseAndEvalLoop?  How is it different than
-    # InteractiveLoop?
-    try:
-      node = c_parser.ParseWholeFile()
-    except util.ParseError as e:
-      ui.PrettyPrintError(e, arena, sys.stderr)
-      print('parse error: %s' % e.UserErrorString(), file=sys.stderr)
-      return 2
-    else:
-      # TODO: Remove this older form of error handling.
-      if not node:
-        err = c_parser.Error()
-        ui.PrintErrorStack(err, arena, sys.stderr)
-        return 2  # parse error is code 2
+    node = None
+    if cache_key:
+      _tlog('ParseCache.Load')
+      node = cache.Load(cache_key, arena)
+
+    if node is None:
+      _tlog('ParseWholeFile')
+      mark = arena.Mark()
+      try:
+        node = c_parser.ParseWholeFile()
+      except util.ParseError as e:
+        ui.PrettyPrintError(e, arena, sys.stderr)
+        print('parse error: %s' % e.UserErrorString(), file=sys.stderr)
+        return 2
+      else:
+        # TODO: Remove this older form of error handling.
+        if not node:
+          err = c_parser.Error()
+          ui.PrintErrorStack(err, arena, sys.stderr)
+          return 2  # parse error is code 2
+      if cache_key:
+        cache.Save(cache_key, arena, mark, node)
 
     do_exec = True
     if opts.fix:
-      #log('SPANS: %s', arena.spans)
       osh2oil.PrintAsOil(arena, node, opts.debug_spans)
       do_exec = False
     if exec_opts.noexec:
@@ -359,16 +495,7 @@ def OshMain(argv, login_shell):
     # Do this after parsing the entire file.  There could be another option to
     # do it before exiting runtime?
     if opts.parser_mem_dump:
-      # This might be superstition, but we want to let the value stabilize
-      # after parsing.  bash -c 'cat /proc/$$/status' gives different results
-      # with a sleep.
-      time.sleep(0.001)
-      input_path = '/proc/%d/status' % os.getpid()
-      with open(input_path) as f, open(opts.parser_mem_dump, 'w') as f2:
-        contents = f.read()
-        f2.write(contents)
-        log('Wrote %s to %s (--parser-mem-dump)', input_path,
-            opts.parser_mem_dump)
+      _WriteProcStatus(opts.parser_mem_dump, '--parser-mem-dump')
 
     # -n prints AST, --show-ast prints and executes
     if exec_opts.noexec or opts.show_ast:
@@ -411,16 +538,7 @@ def OshMain(argv, login_shell):
       # We only do this in the "happy" case for now.  ex.Execute() can raise
       # exceptions.
       if opts.runtime_mem_dump:
-        # This might be superstition, but we want to let the value stabilize
-        # after parsing.  bash -c 'cat /proc/$$/status' gives different results
-        # with a sleep.
-        time.sleep(0.001)
-        input_path = '/proc/%d/status' % os.getpid()
-        with open(input_path) as f, open(opts.runtime_mem_dump, 'w') as f2:
-          contents = f.read()
-          f2.write(contents)
-          log('Wrote %s to %s (--runtime-mem-dump)', input_path,
-              opts.runtime_mem_dump)
+        _WriteProcStatus(opts.runtime_mem_dump, '--runtime-mem-dump')
 
     else:
       status = 0
@@ -485,7 +603,8 @@ def OilMain(argv):
 
 def main(argv):
   try:
-    sys.exit(OilMain(argv))
+    status = OilMain(argv)
+    sys.exit(process.FlushBeforeExit(status))
   except NotImplementedError as e:
     raise
   except OilUsageError as e:
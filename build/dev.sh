@@ -80,8 +80,13 @@ fastlex() {
   PYTHONPATH=. native/fastlex_test.py
 }
 
+fastsplit() {
+  py-ext fastsplit build/setup_fastsplit.py
+  PYTHONPATH=. native/fastsplit_test.py
+}
+
 clean() {
-  rm -f --verbose libc.so fastlex.so
+  rm -f --verbose libc.so fastlex.so fastsplit.so
   rm -r -f --verbose _devbuild/py-ext
 }
 
@@ -95,6 +100,7 @@ minimal() {
   gen-osh-asdl
   gen-runtime-asdl
   pylibc
+  fastsplit
 }
 
 # Prerequisites: build/codegen.sh {download,install}-re2c
@@ -0,0 +1,13 @@
+#!/usr/bin/env python
+from distutils.core import setup, Extension
+
+# https://stackoverflow.com/questions/4541565/how-can-i-assert-from-python-c-code
+module = Extension('fastsplit',
+                    sources = ['native/fastsplit.c'],
+                    undef_macros = ['NDEBUG']
+                    )
+
+setup(name = 'fastsplit',
+      version = '1.0',
+      description = 'Module to speed up IFS splitting',
+      ext_modules = [module])
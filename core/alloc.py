@@ -11,9 +11,15 @@ Arena, and the entire Arena can be discarded at once.
 Also, we don't want to save comment lines.
 """
 
+import array
+import collections
+import mmap
+import os
+
 from asdl import const
 
 from core import util
+from osh import ast_ as ast
 
 
 class Arena(object):
@@ -27,7 +33,7 @@ class Arena(object):
      of this is not to penalize big comment blocks in .rc files and completion
      files!
   """
-  def __init__(self, arena_id):
+  def __init__(self, arena_id, lazy_lines=False):
     self.arena_id = arena_id  # an integer stored in tokens
 
     # Could be std::vector<char *> pointing into a std::string.
@@ -37,6 +43,14 @@ class Arena(object):
     self.lines = []
     self.next_line_id = 0
 
+    # If lazy_lines is set, AddLazyLine() stores None in self.lines, and the
+    # (file ID, byte offset) of the line in these columns.  GetLine() re-reads
+    # it from disk.  The file ID is -1 for lines stored in self.lines.
+    self.lazy_lines = lazy_lines
+    self.lazy_files = []  # file ID -> _LazyFile
+    self.line_file_ids = array.array('i')
+    self.line_offsets = array.array('l')
+
     # first real span is 1.  0 means undefined.
     self.spans = []
     self.next_span_id = 0
@@ -62,32 +76,106 @@ class Arena(object):
   def PopSource(self):
     self.src_id_stack.pop()
 
+  def _AddDebugInfo(self, line_num):
+    self.debug_info.append((self.src_id_stack[-1], line_num))
+
   def AddLine(self, line, line_num):
     """
     Args:
       line: string
       line_num: physical line number, for printing
-
-    TODO: Add an option of whether to save the line?  You can retrieve it on
-    disk in many cases.  (But not in the stdin, '-c', 'eval' case)
     """
     line_id = self.next_line_id
     self.lines.append(line)
+    if self.lazy_lines:
+      self.line_file_ids.append(-1)
+      self.line_offsets.append(0)
     self.next_line_id += 1
-    self.debug_info.append((self.src_id_stack[-1], line_num))
+    self._AddDebugInfo(line_num)
+    return line_id
+
+  def AddLazyFile(self, path, st):
+    """Register a regular file whose lines can be re-read from disk.
+
+    Args:
+      path: absolute path
+      st: result of os.fstat() on the open file
+
+    Returns:
+      A file ID for AddLazyLine()
+    """
+    file_id = len(self.lazy_files)
+    self.lazy_files.append(_LazyFile(path, st.st_size, st.st_mtime))
+    return file_id
+
+  def AddLazyLine(self, file_id, offset, line_num):
+    """Like AddLine(), but don't keep the line in memory.
+
+    This is for the script and files that are sourced, but not stdin, -c or
+    eval, which can't be read again.
+
+    Args:
+      file_id: from AddLazyFile()
+      offset: byte offset of the line in the file
+      line_num: physical line number, for printing
+    """
+    assert self.lazy_lines
+    line_id = self.next_line_id
+    self.lines.append(None)
+    self.line_file_ids.append(file_id)
+    self.line_offsets.append(offset)
+    self.next_line_id += 1
+    self._AddDebugInfo(line_num)
     return line_id
 
   def ClearLastLine(self):
     """Call if it was a comment."""
     pass
 
+  def Mark(self):
+    """Return a mark for Release().
+
+    Like setstackmark() in dash.  The top-level loop marks the arena before
+    parsing a command, and releases everything the command added after
+    executing it, unless a function or trap still refers to its spans.
+    """
+    return (self.next_line_id, self.next_span_id, len(self.src_paths),
+            len(self.lazy_files))
+
+  def Release(self, mark):
+    """Free the lines, spans, and source paths added since Mark().
+
+    Line and span IDs are then reused, so nothing may refer to them.
+    """
+    line_id, span_id, num_paths, num_files = mark
+    assert not self.src_id_stack or self.src_id_stack[-1] < num_paths, \
+        self.src_id_stack
+
+    del self.lines[line_id:]
+    del self.line_file_ids[line_id:]
+    del self.line_offsets[line_id:]
+    self._ReleaseSpansAndDebugInfo(line_id, span_id)
+    self.next_line_id = line_id
+    self.next_span_id = span_id
+
+    del self.src_paths[num_paths:]
+    del self.lazy_files[num_files:]
+
+  def _ReleaseSpansAndDebugInfo(self, line_id, span_id):
+    del self.debug_info[line_id:]
+    del self.spans[span_id:]
+
   def GetLine(self, line_id):
     """
     Given an line ID, return the actual filename, physical line number, and
     line contents.
     """
     assert line_id >= 0, line_id
-    return self.lines[line_id]
+    line = self.lines[line_id]
+    if line is None:
+      lazy_file = self.lazy_files[self.line_file_ids[line_id]]
+      line = _MAPPED_FILES.ReadLine(lazy_file, self.line_offsets[line_id])
+    return line
 
   def AddLineSpan(self, line_span):
     """
@@ -99,6 +187,41 @@ class Arena(object):
     self.next_span_id += 1
     return span_id
 
+  def AddSpan(self, line_id, col, length):
+    """Like AddLineSpan(), but the CompactArena doesn't allocate an object."""
+    return self.AddLineSpan(ast.line_span(line_id, col, length))
+
+  def GetSpanColumns(self, span_id, line_delta=0):
+    """Return the spans added since span_id, for the parse cache.
+
+    Args:
+      span_id: first span to return
+      line_delta: added to each line ID
+
+    Returns:
+      Three arrays of integers: line IDs, columns, and lengths.
+    """
+    line_ids = array.array('i')
+    cols = array.array('i')
+    lengths = array.array('i')
+    for span in self.spans[span_id:]:
+      line_ids.append(span.line_id + line_delta)
+      cols.append(span.col)
+      lengths.append(span.length)
+    return line_ids, cols, lengths
+
+  def AddSpanColumns(self, line_ids, cols, lengths, line_delta=0):
+    """Add spans returned by GetSpanColumns().
+
+    Returns:
+      The span ID of the first one.
+    """
+    first_span_id = self.next_span_id
+    for line_id, col, length in zip(line_ids, cols, lengths):
+      self.spans.append(ast.line_span(line_id + line_delta, col, length))
+    self.next_span_id += len(line_ids)
+    return first_span_id
+
   def GetLineSpan(self, span_id):
     assert span_id != const.NO_INTEGER, span_id
     try:
@@ -119,6 +242,156 @@ class Arena(object):
     return path, line_num
 
 
+_LazyFile = collections.namedtuple('_LazyFile', 'path size mtime')
+
+
+class _MappedFileCache(object):
+  """A small LRU cache of mmapped source files, for Arena.GetLine().
+
+  Lines are only re-read for error messages and osh2oil, so we don't need to
+  keep many files mapped.
+  """
+  def __init__(self, max_files):
+    self.max_files = max_files
+    self.files = collections.OrderedDict()  # _LazyFile -> mmap or None
+
+  def _Open(self, lazy_file):
+    """Returns an mmap, or None if the file changed since it was parsed."""
+    try:
+      fd = os.open(lazy_file.path, os.O_RDONLY)
+    except OSError:
+      return None
+    try:
+      st = os.fstat(fd)
+      if (st.st_size != lazy_file.size or st.st_mtime != lazy_file.mtime or
+          st.st_size == 0):
+        return None
+      return mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    finally:
+      os.close(fd)
+
+  def _Get(self, lazy_file):
+    try:
+      m = self.files.pop(lazy_file)
+    except KeyError:
+      m = self._Open(lazy_file)
+      if len(self.files) >= self.max_files:
+        _, evicted = self.files.popitem(last=False)  # least recently used
+        if evicted is not None:
+          evicted.close()
+    self.files[lazy_file] = m  # most recently used is last
+    return m
+
+  def ReadLine(self, lazy_file, offset):
+    """Return the line at the given offset, including its newline.
+
+    Returns an empty string if the file was changed or removed.
+    """
+    m = self._Get(lazy_file)
+    if m is None:
+      return ''
+    end = m.find('\n', offset)
+    end = len(m) if end == -1 else end + 1
+    return m[offset:end]
+
+
+_MAPPED_FILES = _MappedFileCache(8)
+
+
+class _LineSpanView(object):
+  """A read-only line_span returned by CompactArena.GetLineSpan()."""
+  __slots__ = ('line_id', 'col', 'length')
+
+  def __init__(self, line_id, col, length):
+    self.line_id = line_id
+    self.col = col
+    self.length = length
+
+  def __repr__(self):
+    return '(line_span line_id:%d col:%d length:%d)' % (
+        self.line_id, self.col, self.length)
+
+
+class CompactArena(Arena):
+  """An Arena that stores spans and debug info in parallel arrays of integers.
+
+  Arena keeps one line_span object per token and one tuple per line alive for
+  the whole run, which is a lot of small objects for big scripts.  This class
+  has the same API, but GetLineSpan() returns a _LineSpanView.
+  """
+  def __init__(self, arena_id, lazy_lines=False):
+    Arena.__init__(self, arena_id, lazy_lines=lazy_lines)
+    self.spans = None  # not used
+    self.debug_info = None  # not used
+
+    # Columns indexed by span_id
+    self.span_line_ids = array.array('i')
+    self.span_cols = array.array('i')
+    self.span_lengths = array.array('i')
+
+    # Columns indexed by line_id
+    self.line_src_ids = array.array('i')
+    self.line_nums = array.array('i')
+
+  def _AddDebugInfo(self, line_num):
+    self.line_src_ids.append(self.src_id_stack[-1])
+    self.line_nums.append(line_num)
+
+  def _ReleaseSpansAndDebugInfo(self, line_id, span_id):
+    del self.line_src_ids[line_id:]
+    del self.line_nums[line_id:]
+    del self.span_line_ids[span_id:]
+    del self.span_cols[span_id:]
+    del self.span_lengths[span_id:]
+
+  def AddLineSpan(self, line_span):
+    span_id = self.next_span_id
+    self.span_line_ids.append(line_span.line_id)
+    self.span_cols.append(line_span.col)
+    self.span_lengths.append(line_span.length)
+    self.next_span_id += 1
+    return span_id
+
+  def AddSpan(self, line_id, col, length):
+    span_id = self.next_span_id
+    self.span_line_ids.append(line_id)
+    self.span_cols.append(col)
+    self.span_lengths.append(length)
+    self.next_span_id += 1
+    return span_id
+
+  def GetSpanColumns(self, span_id, line_delta=0):
+    line_ids = self.span_line_ids[span_id:]
+    if line_delta:
+      line_ids = array.array('i', (i + line_delta for i in line_ids))
+    return line_ids, self.span_cols[span_id:], self.span_lengths[span_id:]
+
+  def AddSpanColumns(self, line_ids, cols, lengths, line_delta=0):
+    first_span_id = self.next_span_id
+    if line_delta:
+      self.span_line_ids.extend(i + line_delta for i in line_ids)
+    else:
+      self.span_line_ids.extend(line_ids)
+    self.span_cols.extend(cols)
+    self.span_lengths.extend(lengths)
+    self.next_span_id += len(line_ids)
+    return first_span_id
+
+  def GetLineSpan(self, span_id):
+    assert span_id != const.NO_INTEGER, span_id
+    try:
+      return _LineSpanView(self.span_line_ids[span_id], self.span_cols[span_id],
+                           self.span_lengths[span_id])
+    except IndexError:
+      util.log('Span ID out of range: %d', span_id)
+      raise
+
+  def GetDebugInfo(self, line_id):
+    assert line_id != const.NO_INTEGER, line_id
+    path = self.src_paths[self.line_src_ids[line_id]]
+    return path, self.line_nums[line_id]
+
+
 def CompletionArena(pool):
   """A temporary arena that only exists for a function call?"""
   arena = pool.NewArena()
@@ -141,6 +414,9 @@ def PluginArena(source_name):
 # InteractiveLineReader only needs to save a line if it contains a function.
 # The parser needs to set a flag if it contains a function!
 
+_EMPTY_MARK = (0, 0, 0, 0)  # Arena.Mark() of a new arena
+
+
 class Pool(object):
   """Owns source lines plus debug info.
 
@@ -154,7 +430,15 @@ class Pool(object):
   want to clean up in embedded mode.  the oil_Init() and oil_Destroy() methods
   of the API should do this.
   """
-  def __init__(self):
+  def __init__(self, compact=False, lazy_lines=False):
+    """
+    Args:
+      compact: If True, create CompactArena instances, which use less memory.
+      lazy_lines: If True, arenas re-read lines of regular files from disk
+        instead of keeping them.  See Arena.AddLazyLine().
+    """
+    self.compact = compact
+    self.lazy_lines = lazy_lines
     self.arenas = []
     self.next_arena_id = 0
 
@@ -165,7 +449,8 @@ class Pool(object):
   # only destroy the top/last arena.
   def NewArena(self):
     """Call this after parsing anything that you might want to destroy."""
-    a = Arena(self.next_arena_id)
+    arena_class = CompactArena if self.compact else Arena
+    a = arena_class(self.next_arena_id, lazy_lines=self.lazy_lines)
     self.next_arena_id += 1
     self.arenas.append(a)
     return a
@@ -177,8 +462,9 @@ class Pool(object):
     definitions that need to be executed later.
     """
     a = self.arenas.pop()
-    # This removes lines and spans?
-    del a
+    # Free lines and spans even if something still refers to the arena.
+    del a.src_id_stack[:]
+    a.Release(_EMPTY_MARK)
 
   def IsComplete(self):
     """Return whether we have one arena that was never destroyed?"""
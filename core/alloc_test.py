@@ -5,6 +5,8 @@ alloc_test.py: Tests for alloc.py
 
 import unittest
 
+from osh import ast_ as ast
+
 import alloc  # module under test
 
 
@@ -50,6 +52,88 @@ class AllocTest(unittest.TestCase):
     self.assertEqual(('two.oil', 2), arena.GetDebugInfo(id2))
     self.assertEqual(('one.oil', 3), arena.GetDebugInfo(id3))
 
+  def testMarkAndRelease(self):
+    arena = self.arena
+    arena.PushSource('one.oil')
+    arena.AddLine('f() { echo hi; }', 1)
+    mark = arena.Mark()
+
+    # Memory stays flat if every command is released.
+    for i in xrange(100000):
+      line_id = arena.AddLine('echo %d' % i, i + 2)
+      arena.AddLineSpan(ast.line_span(line_id, 0, 4))
+      arena.PushSource('sourced.oil')
+      arena.PopSource()
+      arena.Release(mark)
+
+    self.assertEqual(1, arena.next_line_id)
+    self.assertEqual(0, arena.next_span_id)
+    self.assertEqual(1, len(arena.lines))
+    self.assertEqual(['one.oil'], arena.src_paths)
+
+    # IDs are reused.
+    line_id = arena.AddLine('echo again', 2)
+    self.assertEqual(1, line_id)
+    self.assertEqual(('one.oil', 2), arena.GetDebugInfo(line_id))
+
+  def testDestroyLastArena(self):
+    p = alloc.Pool()
+    a1 = p.NewArena()
+    a2 = alloc.CompletionArena(p)
+    a2.AddLine('echo hi', 1)
+
+    p.DestroyLastArena()
+    self.assertEqual([a1], p.arenas)
+    self.assertEqual([], a2.lines)
+    self.assertEqual(0, a2.next_line_id)
+
+
+class CompactArenaTest(AllocTest):
+  """Run the same tests against CompactArena."""
+
+  def setUp(self):
+    p = alloc.Pool(compact=True)
+    self.arena = p.NewArena()
+
+  def testPool(self):
+    # Like AllocTest.testPool, but with a real span, since a CompactArena
+    # stores span fields rather than objects.
+    arena = self.arena
+    arena.PushSource('one.oil')
+
+    line_id = arena.AddLine('line 1', 1)
+    self.assertEqual(0, line_id)
+    line_id = arena.AddLine('line 2', 2)
+    self.assertEqual(1, line_id)
+
+    span_id = arena.AddLineSpan(ast.line_span(line_id, 0, 4))
+    self.assertEqual(0, span_id)
+
+    arena.PopSource()
+
+    self.assertEqual(('one.oil', 1), arena.GetDebugInfo(0))
+    self.assertEqual(('one.oil', 2), arena.GetDebugInfo(1))
+
+  def testLineSpans(self):
+    arena = self.arena
+    self.assertTrue(isinstance(arena, alloc.CompactArena))
+    arena.PushSource('one.oil')
+    line_id = arena.AddLine('echo hi', 1)
+
+    span_id = arena.AddLineSpan(ast.line_span(line_id, 0, 4))
+    self.assertEqual(0, span_id)
+    span_id = arena.AddSpan(line_id, 5, 2)
+    self.assertEqual(1, span_id)
+
+    span = arena.GetLineSpan(1)
+    self.assertEqual(line_id, span.line_id)
+    self.assertEqual(5, span.col)
+    self.assertEqual(2, span.length)
+    self.assertEqual('hi', alloc.SpanValue(span, arena))
+
+    self.assertEqual(('one.oil', 1), arena.GetDebugInfo(line_id))
+    self.assertRaises(IndexError, arena.GetLineSpan, 2)
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -13,9 +13,13 @@ Possible optimization flags for CompoundWord:
   - if it does, then do the expansion
 - has Lit_Star, ?, [ ] -- globbing?
   - but after expansion do you still have those flags?
+
+Expansion is lazy: BraceExpandWords() is a generator, and ranges like
+{1..1000000} are never materialized as a list.  So 'for i in {1..1000000}'
+runs in constant memory (see EvalWordSequenceIter in word_eval.py).
 """
 
-import sys
+import re
 
 from core.id_kind import Id
 from osh import ast_ as ast
@@ -23,14 +27,84 @@ from osh import ast_ as ast
 word_part_e = ast.word_part_e
 word_e = ast.word_e
 
+# The inside of {1..10} and {1..10..2}.  The lexer returns it as one token.
+_INT_RANGE_RE = re.compile(r'^(-?[0-9]+)\.\.(-?[0-9]+)(?:\.\.(-?[0-9]+))?$')
+# The inside of {a..e} and {a..e..2}.
+_CHAR_RANGE_RE = re.compile(r'^([a-zA-Z])\.\.([a-zA-Z])(?:\.\.(-?[0-9]+))?$')
+
+# Like bash, a range with a number that doesn't fit in an intmax_t is literal.
+_INT_MIN = -(1 << 63)
+_INT_MAX = (1 << 63) - 1
+
 
 class _StackFrame:
-  def __init__(self, cur_parts):
+  def __init__(self, cur_parts, lbrace):
     self.cur_parts = cur_parts
+    self.lbrace = lbrace  # LiteralPart for {, in case it's not an expansion
     self.alt_part = ast.BracedAltPart()
     self.saw_comma = False
 
 
+def _IsZeroPadded(s):
+  """Does a range endpoint like 01 or -01 ask for a fixed width?"""
+  digits = s[1:] if s.startswith('-') else s
+  return len(digits) > 1 and digits[0] == '0'
+
+
+def _InRange(*nums):
+  return all(_INT_MIN <= n <= _INT_MAX for n in nums)
+
+
+def _RangeStep(step_str):
+  if step_str is None:
+    return None
+  n = int(step_str)
+  return ast.braced_step(abs(n), int(n < 0))
+
+
+def _RangeDetect(parts):
+  """Detect the inside of {1..10..2} or {a..e}.
+
+  Args:
+    parts: the parts between { and }
+
+  Returns:
+    BracedIntRangePart, BracedCharRangePart, or None
+  """
+  if len(parts) != 1:
+    return None
+  part = parts[0]
+  if part.tag != word_part_e.LiteralPart:
+    return None
+  s = part.token.val
+
+  m = _INT_RANGE_RE.match(s)
+  if m:
+    start, end, step = m.groups()
+    if not _InRange(int(start), int(end), int(step or 0)):
+      return None
+    # Like bash, the widest endpoint determines the width of all numbers.
+    if _IsZeroPadded(start) or _IsZeroPadded(end):
+      width = max(len(start), len(end))
+    else:
+      width = 0
+    range_part = ast.BracedIntRangePart(int(start), int(end), _RangeStep(step),
+                                        width)
+    range_part.spids.append(part.token.span_id)
+    return range_part
+
+  m = _CHAR_RANGE_RE.match(s)
+  if m:
+    start, end, step = m.groups()
+    if not _InRange(int(step or 0)):
+      return None
+    range_part = ast.BracedCharRangePart(start, end, _RangeStep(step))
+    range_part.spids.append(part.token.span_id)
+    return range_part
+
+  return None
+
+
 def _BraceDetect(w):
   """
   Args:
@@ -74,7 +148,8 @@ def _BraceDetect(w):
   # Errors:
   # }a{    - stack depth dips below 0
   # {a,b}{ - Stack depth doesn't end at 0
-  # {a}    - no comma, and also not an numeric range
+  # {a}    - no comma, and also not an numeric range.  This one isn't fatal;
+  #          the braces are literal, like in bash.
 
   cur_parts = []
   stack = []
@@ -87,11 +162,10 @@ def _BraceDetect(w):
       id_ = part.token.id
       if id_ == Id.Lit_LBrace:
         # Save prefix parts.  Start new parts list.
-        new_frame = _StackFrame(cur_parts)
+        new_frame = _StackFrame(cur_parts, part)
         stack.append(new_frame)
         cur_parts = []
         append = False
-        found = True  # assume found, but can early exit with None later
 
       elif id_ == Id.Lit_Comma:
         # Append a new alternative.
@@ -110,26 +184,26 @@ def _BraceDetect(w):
           append = False
 
       elif id_ == Id.Lit_RBrace:
-        # TODO:
-        # - Detect lack of , -- abort the whole thing
-        # - Detect {1..10} and {1..10..2}
-        #   - bash and zsh only -- this is NOT implemented by mksh
-        #   - Use a regex on the middle part:
-        #     - digit+ '..' digit+  ( '..' digit+ )?
-        # - Char ranges are bash only!
-        #
-        # ast.BracedIntRangePart()
-        # ast.CharRangePart()
-
         if not stack:  # e.g. echo }  -- unbalancd {
           return None
-        if not stack[-1].saw_comma:  # {foo} is not a real alternative
-          return None
-        stack[-1].alt_part.words.append(ast.CompoundWord(cur_parts))
 
         frame = stack.pop()
+        if frame.saw_comma:
+          frame.alt_part.words.append(ast.CompoundWord(cur_parts))
+          frame.cur_parts.append(frame.alt_part)
+          found = True
+        else:
+          # {1..10} and {a..e} are bash and zsh only.  mksh doesn't have them.
+          range_part = _RangeDetect(cur_parts)
+          if range_part:
+            frame.cur_parts.append(range_part)
+            found = True
+          else:
+            # {foo} is not a real alternative.  Keep the braces literally.
+            frame.cur_parts.append(frame.lbrace)
+            frame.cur_parts.extend(cur_parts)
+            frame.cur_parts.append(part)
         cur_parts = frame.cur_parts
-        cur_parts.append(frame.alt_part)
         append = False
 
     if append:
@@ -156,114 +230,120 @@ def BraceDetectAll(words):
   return out
 
 
-# Possible optmization for later:
-def _TreeCount(tree_word):
-  """Count output size for allocation purposes.
-
-  We can count the number of words expanded into, and the max number of parts
-  in a word.
+def _RangeStrings(part):
+  """Yield the strings in {1..10..2} or {a..e}, one at a time."""
+  # Like bash, the sign of the step is ignored, and the direction comes from
+  # the endpoints.  A step of 0 is the same as 1.
+  step = part.step.val if part.step and part.step.val else 1
 
-  Every word can have a differnt number of parts, e.g. -{'a'b,c}- expands into
-  words of 4 parts, then 3 parts.
-  """
-  # TODO: Copy the structure of _BraceExpand and _BraceExpandOne.
-  for part in tree_word.parts:
-    if part.tag == word_part_e.BracedAltPart:
-      for word in part.words:
-        pass
-  num_results = 2
-  max_parts = 5
-  return num_results, max_parts
+  if part.tag == word_part_e.BracedIntRangePart:
+    start, end = part.start, part.end
+    fmt = '%0*d'
+    width = part.width
+  else:
+    start, end = ord(part.start), ord(part.end)
+
+  # Not xrange(), which overflows on end + 1 near the C long limits.
+  if start > end:
+    step = -step
+  n = start
+  while (n <= end) if step > 0 else (n >= end):
+    if part.tag == word_part_e.BracedIntRangePart:
+      yield fmt % (width, n)
+    else:
+      yield chr(n)
+    n += step
 
 
-def _BraceExpandOne(parts, first_alt_index, suffixes):
-  """Helper for _BraceExpand.
+def _ExpandPart(part):
+  """Yield lists of parts that a single BracedAltPart or range expands to."""
+  if part.tag == word_part_e.BracedAltPart:
+    # Need to call _BraceExpand on each of the inner words too!
+    for w in part.words:
+      for alt_parts in _BraceExpand(w.parts):
+        yield alt_parts
+  else:
+    span_id = part.spids[0] if part.spids else -1
+    for s in _RangeStrings(part):
+      yield [ast.LiteralPart(ast.token(Id.Lit_Chars, s, span_id))]
 
-  Args:
-    parts: input parts
-    first_alt_index: index of the first BracedAltPart
-    suffixes: List of suffixes to append.
-  """
-  out = []
 
-  # Need to call _BraceExpand on each of the inner words too!
-  first_alt = parts[first_alt_index]
-  expanded_alts = []
-  for w in first_alt.words:
-    expanded_alts.extend(_BraceExpand(w.parts))
-
-  prefix = parts[ : first_alt_index]
-  for alt_parts in expanded_alts:
-    for suffix in suffixes:
-      out_parts = []
-      out_parts.extend(prefix)
-      out_parts.extend(alt_parts)
-      out_parts.extend(suffix)
-      # TODO: Do we need to preserve flags?
-      out.append(out_parts)
-  return out
+_BRACED_PARTS = (
+    word_part_e.BracedAltPart, word_part_e.BracedIntRangePart,
+    word_part_e.BracedCharRangePart
+)
 
 
 def _BraceExpand(parts):
-  num_alts = 0
-  first_alt_index = -1
+  """Yield lists of parts, one for each word that the parts expand to.
+
+  Nothing is materialized.  Instead of computing the suffixes once, we
+  re-expand the tail for every alternative, which trades a little time for
+  constant memory.
+  """
+  first_index = -1
   for i, part in enumerate(parts):
-    if part.tag == word_part_e.BracedAltPart:
-      num_alts += 1
-      if num_alts == 1:
-        first_alt_index = i
-      elif num_alts == 2:
-        break  # don't need to count anymore
+    if part.tag in _BRACED_PARTS:
+      first_index = i
+      break
+
+  if first_index == -1:
+    yield parts
+    return
 
   # NOTE: There are TWO recursive calls here, not just one -- one for
   # nested {}, and one for adjacent {}.  Thus it's hard to do iteratively.
-  if num_alts == 0:
-    return [parts]
-
-  elif num_alts == 1:
-    out = []
-    suffix = parts[first_alt_index+1 : ]
-    return _BraceExpandOne(parts, first_alt_index, [suffix])
-
-  else:
-    # Now call it on the tail
-    tail_parts = parts[first_alt_index+1 : ]
-    suffixes = _BraceExpand(tail_parts)  # recursive call
-    return _BraceExpandOne(parts, first_alt_index, suffixes)
+  prefix = parts[:first_index]
+  tail_parts = parts[first_index+1:]
+  for alt_parts in _ExpandPart(parts[first_index]):
+    for suffix in _BraceExpand(tail_parts):
+      # TODO: Do we need to preserve flags?
+      yield prefix + alt_parts + suffix
 
 
 def BraceExpandWords(words):
-  out = []
+  """Yield CompoundWords, expanding each BracedWordTree lazily."""
   for w in words:
     if w.tag == word_e.BracedWordTree:
-      parts_list = _BraceExpand(w.parts)
-      out.extend(ast.CompoundWord(p) for p in parts_list)
+      for parts in _BraceExpand(w.parts):
+        yield ast.CompoundWord(parts)
     else:
-      out.append(w)
-  return out
+      yield w
 
 
-def _Cartesian(tuples):
-  if len(tuples) == 1:
-    for x in tuples[0]:
-      yield (x,)
-  else:
-    for x in tuples[0]:
-      for y in _Cartesian(tuples[1:]):
-        yield (x,) + y  # join tuples
+def _IsStaticPart(part):
+  """Does the part evaluate to a constant string that's never globbed?"""
+  if part.tag == word_part_e.LiteralPart:
+    # Conservative: [ and ] may be in different tokens, and ~ may be expanded
+    # after brace expansion.
+    if part.token.id == Id.Lit_Tilde:
+      return False
+    return not any(c in part.token.val for c in '*?[]')
+
+  if part.tag in (word_part_e.EscapedLiteralPart,
+                  word_part_e.SingleQuotedPart):
+    return True
+
+  if part.tag == word_part_e.DoubleQuotedPart:
+    return all(
+        p.tag in (word_part_e.LiteralPart, word_part_e.EscapedLiteralPart)
+        for p in part.parts)
 
+  if part.tag == word_part_e.BracedAltPart:
+    return all(_IsStaticPart(p) for w in part.words for p in w.parts)
 
-def main(argv):
-  for t in _Cartesian([('a', 'b')]):
-    print(t)
-  print('--')
-  for t in _Cartesian([('a', 'b'), ('c', 'd', 'e'), ('f', 'g')]):
-    print(t)
+  if part.tag in (word_part_e.BracedIntRangePart,
+                  word_part_e.BracedCharRangePart):
+    return True
 
+  return False
 
-if __name__ == '__main__':
-  try:
-    main(sys.argv)
-  except RuntimeError as e:
-    print('FATAL: %s' % e, file=sys.stderr)
-    sys.exit(1)
+
+def IsStaticWord(w):
+  """Can the word be brace expanded and evaluated without a word evaluator?
+
+  That is, it has no substitutions, no globs, and nothing that is split.
+  """
+  if w.tag not in (word_e.CompoundWord, word_e.BracedWordTree):
+    return False
+  return all(_IsStaticPart(p) for p in w.parts)
@@ -8,6 +8,7 @@ import sys
 import unittest
 
 from core import braces  # module under test
+from core import word
 from osh import word_parse_test
 from osh import ast_ as ast
 
@@ -105,7 +106,7 @@ class BracesTest(unittest.TestCase):
 
   def testBraceExpand(self):
     w = _assertReadWord(self, 'hi')
-    results = braces._BraceExpand(w.parts)
+    results = list(braces._BraceExpand(w.parts))
     self.assertEqual(1, len(results))
     for parts in results:
       _ColorPrint(ast.CompoundWord(parts))
@@ -116,7 +117,7 @@ class BracesTest(unittest.TestCase):
     self.assertEqual(3, len(tree.parts))
     pprint(tree)
 
-    results = braces._BraceExpand(tree.parts)
+    results = list(braces._BraceExpand(tree.parts))
     self.assertEqual(2, len(results))
     for parts in results:
       _ColorPrint(ast.CompoundWord(parts))
@@ -127,7 +128,7 @@ class BracesTest(unittest.TestCase):
     self.assertEqual(3, len(tree.parts))
     pprint(tree)
 
-    results = braces._BraceExpand(tree.parts)
+    results = list(braces._BraceExpand(tree.parts))
     self.assertEqual(5, len(results))
     for parts in results:
       _ColorPrint(ast.CompoundWord(parts))
@@ -138,12 +139,101 @@ class BracesTest(unittest.TestCase):
     self.assertEqual(5, len(tree.parts))
     pprint(tree)
 
-    results = braces._BraceExpand(tree.parts)
+    results = list(braces._BraceExpand(tree.parts))
     self.assertEqual(4, len(results))
     for parts in results:
       _ColorPrint(ast.CompoundWord(parts))
       print('')
 
+  def testBraceDetectLiteral(self):
+    # {x} isn't an expansion, but a later one in the same word is.
+    w = _assertReadWord(self, '{x}_{a,b}')
+    tree = braces._BraceDetect(w)
+    self.assertEqual(['{x}_a', '{x}_b'], _ExpandStrings(tree))
+
+    w = _assertReadWord(self, '{x}')
+    self.assertEqual(None, braces._BraceDetect(w))
+
+  def testRangeDetect(self):
+    w = _assertReadWord(self, '-{1..10..-2}-')
+    tree = braces._BraceDetect(w)
+    self.assertEqual(3, len(tree.parts))
+    part = tree.parts[1]
+    self.assertEqual(word_part_e.BracedIntRangePart, part.tag)
+    self.assertEqual(1, part.start)
+    self.assertEqual(10, part.end)
+    self.assertEqual(2, part.step.val)
+    self.assertEqual(1, part.step.negated)
+    self.assertEqual(0, part.width)
+
+    w = _assertReadWord(self, '{a..e}')
+    tree = braces._BraceDetect(w)
+    part = tree.parts[0]
+    self.assertEqual(word_part_e.BracedCharRangePart, part.tag)
+    self.assertEqual('a', part.start)
+    self.assertEqual('e', part.end)
+    self.assertEqual(None, part.step)
+
+    # Not ranges
+    for s in ['{1..}', '{1...3}', '{a..3}', '{ab..c}', '{1..3..x}',
+              # Too big for an intmax_t, like bash
+              '{1..99999999999999999999}', '{1..3..99999999999999999999}',
+              '{a..c..99999999999999999999}']:
+      w = _assertReadWord(self, s)
+      self.assertEqual(None, braces._BraceDetect(w), s)
+
+  def testRangeExpand(self):
+    CASES = [
+        ('{1..5}', ['1', '2', '3', '4', '5']),
+        ('{1..8..3}', ['1', '4', '7']),
+        ('{1..8..-3}', ['1', '4', '7']),
+        ('{8..1..3}', ['8', '5', '2']),
+        ('{3..-1}', ['3', '2', '1', '0', '-1']),
+        ('{1..3..0}', ['1', '2', '3']),
+        ('{01..3}', ['01', '02', '03']),
+        ('{01..003}', ['001', '002', '003']),
+        ('{-01..1}', ['-01', '000', '001']),
+        ('{a..e..2}', ['a', 'c', 'e']),
+        ('{e..a..-2}', ['e', 'c', 'a']),
+        ('x{1..2}{a,b}', ['x1a', 'x1b', 'x2a', 'x2b']),
+        ('{a,{1..3}}', ['a', '1', '2', '3']),
+        ('{9223372036854775806..9223372036854775807}',
+         ['9223372036854775806', '9223372036854775807']),
+        ('{1..3..9223372036854775807}', ['1']),
+    ]
+    for s, expected in CASES:
+      w = _assertReadWord(self, s)
+      tree = braces._BraceDetect(w)
+      self.assertEqual(expected, _ExpandStrings(tree), s)
+
+  def testExpandIsLazy(self):
+    w = _assertReadWord(self, '{1..100000000}')
+    tree = braces._BraceDetect(w)
+    it = braces.BraceExpandWords([tree])
+    self.assertEqual('1', word.StaticEval(next(it))[1])
+    self.assertEqual('2', word.StaticEval(next(it))[1])
+
+  def testIsStaticWord(self):
+    for s in ['a', "'*'", '"x"', '{1..3}', 'x{a,b}', '\\*']:
+      w = _assertReadWord(self, s)
+      w = braces._BraceDetect(w) or w
+      self.assertEqual(True, braces.IsStaticWord(w), s)
+
+    for s in ['*', 'x{a,*}', '$x', '"$x"', '{a,$x}', '~', '~/{a,b}',
+              '{~,a}', '$(echo)']:
+      w = _assertReadWord(self, s)
+      w = word.TildeDetectAll([braces._BraceDetect(w) or w])[0]
+      self.assertEqual(False, braces.IsStaticWord(w), s)
+
+
+def _ExpandStrings(tree):
+  out = []
+  for w in braces.BraceExpandWords([tree]):
+    ok, s, _ = word.StaticEval(w)
+    assert ok, w
+    out.append(s)
+  return out
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -27,6 +27,7 @@ http://pubs.opengroup.org/onlinepubs/9699919799/utilities/V3_chap02.html#tag_18_
 """
 
 import os
+import stat
 import sys
 
 from core import args
@@ -57,12 +58,12 @@ NONE READ ECHO SHIFT
 CD PUSHD POPD DIRS
 EXPORT UNSET SET SHOPT
 TRAP UMASK
-EXIT SOURCE DOT EVAL EXEC WAIT JOBS
+EXIT SOURCE DOT EVAL EXEC WAIT JOBS PARALLEL_LIMIT
 COMPLETE COMPGEN DEBUG_LINE
 TRUE FALSE
 COLON
 TEST BRACKET GETOPTS
-COMMAND TYPE HELP
+COMMAND TYPE HASH HELP
 DECLARE TYPESET
 """.split())
 
@@ -109,6 +110,7 @@ _NORMAL_BUILTINS = {
     "umask": EBuiltin.UMASK,
     "wait": EBuiltin.WAIT,
     "jobs": EBuiltin.JOBS,
+    "parallel-limit": EBuiltin.PARALLEL_LIMIT,
 
     "shopt": EBuiltin.SHOPT,
     "complete": EBuiltin.COMPLETE,
@@ -124,6 +126,7 @@ _NORMAL_BUILTINS = {
 
     "command": EBuiltin.COMMAND,
     "type": EBuiltin.TYPE,
+    "hash": EBuiltin.HASH,
 
     "declare": EBuiltin.DECLARE,
     "typeset": EBuiltin.TYPESET,
@@ -213,10 +216,7 @@ def Echo(argv):
         # Unusual behavior: '\c' prints what is there and aborts processing!
         if p is None:
           new_argv.append(''.join(parts))
-          for i, a in enumerate(new_argv):
-            if i != 0:
-              sys.stdout.write(' ')  # arg separator
-            sys.stdout.write(a)
+          sys.stdout.write(' '.join(new_argv))
           return 0  # EARLY RETURN
 
         parts.append(p)
@@ -226,22 +226,12 @@ def Echo(argv):
     argv = new_argv
 
   #log('echo argv %s', argv)
-  for i, a in enumerate(argv):
-    if i != 0:
-      sys.stdout.write(' ')  # arg separator
-    sys.stdout.write(a)
-  if not arg.n:
-    sys.stdout.write('\n')
-
-  # Do I need the flush?  Had a problem here under load, but it might not have
-  # been because of that.
-  # File "/home/andy/git/oil/bin/../core/cmd_exec.py", line 251, in _RunBuiltin
-  #   status = builtin.Echo(argv)
-  # File "/home/andy/git/oil/bin/../core/builtin.py", line 431, in Echo
-  #   sys.stdout.flush()
-  # IOError: [Errno 32] Broken pipe
-
-  sys.stdout.flush()
+  # One write, and no flush.  The sys.stdout buffer is flushed before a
+  # fork(), exec(), redirect, or blocking wait.  See process.py.
+  if arg.n:
+    sys.stdout.write(' '.join(argv))
+  else:
+    sys.stdout.write(' '.join(argv) + '\n')
   return 0
 
 
@@ -305,24 +295,29 @@ def Wait(argv, waiter, job_state, mem):
       raise AssertionError
 
   if opt_n:
-    # wait -n returns the exit status of the process.  But how do you know
-    # WHICH process?  That doesn't seem useful.
-    log('wait next')
-    if waiter.Wait():
-      return waiter.last_status
-    else:
-      return 127  # nothing to wait for
+    # Return the status of the job that finished first, which may have been
+    # reaped already.  Unlike bash, a job that finished before 'wait -n' isn't
+    # lost, so a loop can collect the status of every job.
+    waiter.Reap()
+    while True:
+      jid = job_state.PopNotWaited()
+      if jid != -1:
+        return job_state.jobs[jid].status
+      if job_state.num_running == 0:
+        return 127  # nothing to wait for
+      if not waiter.Wait():
+        return 127
 
   if not args:
     log('wait all')
     # TODO: get all background jobs from JobState?
     i = 0
-    while True:
+    # Jobs may have been reaped already, e.g. by Waiter.Reap().
+    while not job_state.AllDone():
       if not waiter.Wait():
         break  # nothing to wait for
       i += 1
-      if job_state.AllDone():
-        break
+    del job_state.not_waited[:]
 
     log('waited for %d processes', i)
     return 0
@@ -346,6 +341,7 @@ def Wait(argv, waiter, job_state, mem):
       return 127
 
     st = job.WaitUntilDone(waiter)
+    job_state.PopNotWaited(pid=jid)
     if isinstance(st, list):
       status = st[-1]
       state.SetGlobalArray(mem, 'PIPESTATUS', [str(p) for p in st])
@@ -355,8 +351,34 @@ def Wait(argv, waiter, job_state, mem):
   return status
 
 
-def Jobs(argv, job_state):
+def ParallelLimit(argv, job_state):
+  """
+  parallel-limit [N]
+
+  When N background jobs are running, make & wait for one to finish before
+  starting another.  0 means no limit.  With no argument, print the limit.
+  """
+  if not argv:
+    print(job_state.limit)
+    return 0
+  if len(argv) > 1:
+    util.error('parallel-limit: too many arguments')
+    return 2
+  try:
+    n = int(argv[0])
+  except ValueError:
+    util.error('parallel-limit: invalid number %r', argv[0])
+    return 2
+  if n < 0:
+    util.error('parallel-limit: invalid number %r', argv[0])
+    return 2
+  job_state.limit = n
+  return 0
+
+
+def Jobs(argv, waiter, job_state):
   """List jobs."""
+  waiter.Reap()  # so the states are up to date
   job_state.List()
   return 0
 
@@ -442,11 +464,49 @@ READ_SPEC.ShortFlag('-r')
 READ_SPEC.ShortFlag('-n', args.Int)
 
 
+# Bytes to read at once when stdin is a regular file.
+_READ_CHUNK_SIZE = 4096
+
+
+def _ReadLineFromFile():
+  """Read a line from a regular file on stdin, a chunk at a time.
+
+  Then seek back to just after the newline, so the offset is right for
+  another 'read', or a child process that shares the descriptor.  bash does
+  the same thing.
+  """
+  chunks = []
+  while True:
+    chunk = os.read(0, _READ_CHUNK_SIZE)
+    if not chunk:
+      break
+
+    i = chunk.find('\n')
+    if i != -1:
+      num_extra = len(chunk) - i - 1
+      if num_extra:
+        os.lseek(0, -num_extra, os.SEEK_CUR)
+      chunks.append(chunk[:i+1])
+      break
+
+    chunks.append(chunk)
+  return ''.join(chunks)
+
+
 # sys.stdin.readline() in Python has buffering!  TODO: Rewrite this tight loop
 # in C?  Less garbage probably.
 # NOTE that dash, mksh, and zsh all read a single byte at a time.  It appears
 # to be required by POSIX?  Could try libc getline and make this an option.
 def ReadLineFromStdin():
+  # We can read ahead in a regular file, because we can seek back.  We can't
+  # in a pipe or terminal, because the bytes after the newline would be lost.
+  try:
+    is_file = stat.S_ISREG(os.fstat(0).st_mode)
+  except OSError:  # e.g. stdin is closed; the read below reports it
+    is_file = False
+  if is_file:
+    return _ReadLineFromFile()
+
   chars = []
   while True:
     c = os.read(0, 1)
@@ -461,6 +521,7 @@ def ReadLineFromStdin():
 
 def Read(argv, splitter, mem):
   arg, i = READ_SPEC.Parse(argv)
+  sys.stdout.flush()  # e.g. a prompt from echo -n
 
   names = argv[i:]
   if arg.n is not None:  # read a certain number of bytes
@@ -599,8 +660,6 @@ def _PrintDirStack(dir_stack, style, home_dir):
     print(' '.join(_FormatDir(entry, home_dir)
         for entry in dir_stack.Iter()))
 
-  sys.stdout.flush()
-
 
 def _FormatDir(dir_name, home_dir):
   if home_dir and home_dir.tag == value_e.Str and (
@@ -846,12 +905,7 @@ def Unset(argv, mem, funcs):
   return 0
 
 
-def _ResolveNames(names, funcs, path_val):
-  if path_val.tag == value_e.Str:
-    path_list = path_val.s.split(':')
-  else:
-    path_list = []  # treat as empty path
-
+def _ResolveNames(names, funcs, cmd_hash):
   results = []
   for name in names:
     if name in funcs:
@@ -866,14 +920,10 @@ def _ResolveNames(names, funcs, path_val):
       kind = ('keyword', name)
     else:
       # Now look for files.
-      found = False
-      for path_dir in path_list:
-        full_path = os.path.join(path_dir, name)
-        if os.path.exists(full_path):
-          kind = ('file', full_path)
-          found = True
-          break
-      if not found:  # Nothing printed, but status is 1.
+      full_path = cmd_hash.Lookup(name)
+      if full_path is not None:
+        kind = ('file', full_path)
+      else:  # Nothing printed, but status is 1.
         kind = (None, None)
     results.append(kind)
 
@@ -885,11 +935,11 @@ COMMAND_SPEC.ShortFlag('-v')
 COMMAND_SPEC.ShortFlag('-V')
 
 
-def Command(argv, funcs, path_val):
+def Command(argv, funcs, cmd_hash):
   arg, i = COMMAND_SPEC.Parse(argv)
   status = 0
   if arg.v:
-    for kind, arg in _ResolveNames(argv[i:], funcs, path_val):
+    for kind, arg in _ResolveNames(argv[i:], funcs, cmd_hash):
       if kind is None:
         status = 1  # nothing printed, but we fail
       else:
@@ -906,11 +956,11 @@ TYPE_SPEC = _Register('type')
 TYPE_SPEC.ShortFlag('-t')
 
 
-def Type(argv, funcs, path_val):
+def Type(argv, funcs, cmd_hash):
   arg, i = TYPE_SPEC.Parse(argv)
 
   status = 0
-  for kind, name in _ResolveNames(argv[i:], funcs, path_val):
+  for kind, name in _ResolveNames(argv[i:], funcs, cmd_hash):
     if kind is None:
       status = 1  # nothing printed, but we fail
     else:
@@ -926,9 +976,47 @@ def Type(argv, funcs, path_val):
           # bash prints the function body, busybox ash doesn't.
           pass
 
-  # REQUIRED because of Python's buffering.  A command sub may give the wrong
-  # result otherwise.
-  sys.stdout.flush()
+  return status
+
+
+HASH_SPEC = _Register('hash')
+HASH_SPEC.ShortFlag('-r')
+HASH_SPEC.ShortFlag('-p', args.Str)
+
+
+def Hash(argv, cmd_hash):
+  arg, i = HASH_SPEC.Parse(argv)
+  names = argv[i:]
+
+  if arg.r:
+    cmd_hash.Clear()
+
+  if arg.p is not None:
+    if not names:
+      raise args.UsageError('hash: -p requires a name')
+    for name in names:
+      cmd_hash.Remember(name, arg.p)
+    return 0
+
+  if not names:
+    if arg.r:
+      return 0
+    items = cmd_hash.Items()
+    if not items:
+      util.error('hash: hash table empty')
+      return 0
+    print('hits\tcommand')
+    for name, full_path, hits in items:
+      print('%4d\t%s' % (hits, full_path))
+    return 0
+
+  status = 0
+  for name in names:
+    if '/' in name:  # Not looked up in $PATH
+      continue
+    if cmd_hash.Lookup(name) is None:
+      util.error('hash: %r not found', name)
+      status = 1
   return status
 
 
@@ -976,7 +1064,6 @@ def DeclareTypeset(argv, mem, funcs):
   else:
     raise NotImplementedError
 
-  sys.stdout.flush()
   return status
 
 
@@ -1056,7 +1143,6 @@ def Trap(argv, traps, ex):
       print(value)
       print()
 
-    sys.stdout.flush()
     return 0
 
   if arg.l:  # List valid signals and hooks
@@ -1068,7 +1154,6 @@ def Trap(argv, traps, ex):
     for name, int_val in ordered:
       print('%2d %s' % (int_val, name))
 
-    sys.stdout.flush()
     return 0
 
   try:
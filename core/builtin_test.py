@@ -3,10 +3,14 @@
 builtin_test.py: Tests for builtin.py
 """
 
+import os
 import unittest
 
 from core import legacy
 from core import lexer
+from core import process
+from core import runtime
+from core.id_kind import Id
 from core import builtin  # module under test
 
 
@@ -18,6 +22,24 @@ class BuiltinTest(unittest.TestCase):
     print list(lex.Tokens(r'unicode \u0065 \U00000065'))
     print list(lex.Tokens(r'\d \e \f \g'))
 
+  def testReadLineFromStdin(self):
+    path = '_tmp/read-lines.txt'
+    with open(path, 'w') as f:
+      f.write('one\n' + 'x' * 5000 + '\nthree')
+
+    fd_state = process.FdState()
+    r = runtime.PathRedirect(Id.Redir_Less, 0, path)
+    fd_state.Push([r], process.Waiter())
+    try:
+      self.assertEqual('one\n', builtin.ReadLineFromStdin())
+      # It read ahead, but seeked back to the start of the next line.
+      self.assertEqual(4, os.lseek(0, 0, os.SEEK_CUR))
+      self.assertEqual('x' * 5000 + '\n', builtin.ReadLineFromStdin())
+      self.assertEqual('three', builtin.ReadLineFromStdin())
+      self.assertEqual('', builtin.ReadLineFromStdin())
+    finally:
+      fd_state.Pop()
+
   def testAppendParts(self):
     # allow_escape is True by default, but False when the user passes -r.
     CASES =  [
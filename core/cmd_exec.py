@@ -27,6 +27,7 @@ from core import alloc
 from core import args
 from core import braces
 from core import expr_eval
+from core import glob_
 from core import legacy
 from core import reader
 from core import test_builtin
@@ -44,11 +45,6 @@ from core import word_compile
 from osh import ast_ as ast
 from osh import parse_lib
 
-try:
-  import libc  # for fnmatch
-except ImportError:
-  from benchmarks import fake_libc as libc
-
 EBuiltin = builtin.EBuiltin
 
 command_e = ast.command_e
@@ -64,6 +60,73 @@ var_flags_e = runtime.var_flags_e
 log = util.log
 e_die = util.e_die
 
+# For comparing the two ways of running command subs in benchmarks.
+_ALWAYS_FORK_COMMAND_SUB = bool(os.getenv('OSH_ALWAYS_FORK_COMMAND_SUB'))
+
+# Builtins whose only effects are on variables, $@, and stdout.  A command sub
+# that only uses them and shell functions can run without forking, because
+# Mem.PopUndoLog() reverts the variables and FdState.PopCapture() collects
+# stdout.
+_IN_PROCESS_BUILTINS = frozenset([
+    EBuiltin.ECHO, EBuiltin.TRUE, EBuiltin.FALSE, EBuiltin.COLON,
+    EBuiltin.TEST, EBuiltin.BRACKET, EBuiltin.SHIFT, EBuiltin.GETOPTS,
+    EBuiltin.TYPE, EBuiltin.EXPORT, EBuiltin.DECLARE, EBuiltin.TYPESET,
+])
+
+
+def _StaticCommandNames(node, in_func):
+  """Find the commands that an LST may run.
+
+  Args:
+    node: the body of a command sub or function
+    in_func: whether 'return' is OK
+
+  Returns:
+    A list of names, or None if it has something other than simple commands,
+    assignments, and compound commands, e.g. a pipeline or a dynamic command
+    name like $cmd.
+  """
+  names = []
+  stack = [node]
+  while stack:
+    node = stack.pop()
+    tag = node.tag
+    if tag == command_e.SimpleCommand:
+      if node.words:
+        ok, name, _ = word.StaticEval(node.words[0])
+        if not ok:
+          return None
+        names.append(name)
+    elif tag == command_e.Sentence:
+      stack.append(node.child)
+    elif tag in (command_e.CommandList, command_e.AndOr, command_e.BraceGroup,
+                 command_e.DoGroup):
+      stack.extend(node.children)
+    elif tag in (command_e.While, command_e.Until):
+      stack.extend(node.cond)
+      stack.append(node.body)
+    elif tag == command_e.ForEach:
+      stack.append(node.body)
+    elif tag == command_e.ForExpr:
+      if node.body:
+        stack.append(node.body)
+    elif tag == command_e.If:
+      for arm in node.arms:
+        stack.extend(arm.cond)
+        stack.extend(arm.action)
+      stack.extend(node.else_action)
+    elif tag == command_e.Case:
+      for arm in node.arms:
+        stack.extend(arm.action)
+    elif tag in (command_e.Assignment, command_e.DParen, command_e.DBracket,
+                 command_e.NoOp):
+      pass
+    elif tag == command_e.ControlFlow and in_func:
+      pass
+    else:
+      return None
+  return names
+
 
 class _ControlFlow(RuntimeError):
   """Internal execption for control flow.
@@ -103,7 +166,7 @@ class Executor(object):
   CompoundWord/WordPart.
   """
   def __init__(self, mem, fd_state, status_lines, funcs, completion,
-               comp_lookup, exec_opts, arena):
+               comp_lookup, exec_opts, arena, parse_cache=None):
     """
     Args:
       mem: Mem instance for storing variables
@@ -114,6 +177,7 @@ class Executor(object):
       comp_lookup: completion pattern/action
       exec_opts: ExecOpts
       arena: for printing error locations
+      parse_cache: optional ParseCache for sourced files
     """
     self.mem = mem
     self.fd_state = fd_state
@@ -126,6 +190,7 @@ class Executor(object):
     # This is for shopt and set -o.  They are initialized by flags.
     self.exec_opts = exec_opts
     self.arena = arena
+    self.parse_cache = parse_cache
 
     self.splitter = legacy.SplitContext(self.mem)
     self.word_ev = word_eval.NormalWordEvaluator(
@@ -135,6 +200,17 @@ class Executor(object):
 
     self.traps = {}  # signal/hook name -> callable
     self.dir_stack = state.DirStack()
+    self.cmd_hash = state.CommandHash(mem)  # for external commands
+    # LST -> list of command names or None, for in-process command subs.
+    # Cleared by ClearNodeCaches() so freed LSTs aren't kept alive.
+    self.static_names = {}
+    # Case LST -> (literals, others) from _CaseTable().  Also cleared.
+    self.case_tables = {}
+
+    # Incremented when a function or trap is defined.  They refer to spans in
+    # the arena after the command that defined them finishes, so the
+    # top-level loop must not Release() the arena.
+    self.num_kept_nodes = 0
 
     # TODO: Pass these in from main()
     self.aliases = {}  # alias name -> string
@@ -178,18 +254,26 @@ class Executor(object):
   def _CompGen(self, argv):
     raise NotImplementedError
 
-  def _EvalHelper(self, c_parser, source_name):
+  def _EvalHelper(self, c_parser, source_name, cache_key=None):
     self.arena.PushSource(source_name)
     try:
-      node = c_parser.ParseWholeFile()
-      # NOTE: We could model a parse error as an exception, like Python, so we
-      # get a traceback.  (This won't be applicable for a static module
-      # system.)
-      if not node:
-        util.error('Parse error in %r:', source_name)
-        err = c_parser.Error()
-        ui.PrintErrorStack(err, self.arena, sys.stderr)
-        return 1
+      node = None
+      if cache_key:
+        node = self.parse_cache.Load(cache_key, self.arena)
+
+      if node is None:
+        mark = self.arena.Mark()
+        node = c_parser.ParseWholeFile()
+        # NOTE: We could model a parse error as an exception, like Python, so
+        # we get a traceback.  (This won't be applicable for a static module
+        # system.)
+        if not node:
+          util.error('Parse error in %r:', source_name)
+          err = c_parser.Error()
+          ui.PrintErrorStack(err, self.arena, sys.stderr)
+          return 1
+        if cache_key:
+          self.parse_cache.Save(cache_key, self.arena, mark, node)
 
       status = self._Execute(node)
       return status
@@ -224,6 +308,7 @@ class Executor(object):
     finally:
       self.arena.PopSource()
 
+    self.num_kept_nodes += 1
     return node
 
   def _Source(self, argv):
@@ -242,9 +327,12 @@ class Executor(object):
       return 1
 
     try:
-      line_reader = reader.FileLineReader(f, self.arena)
+      cache_key = None
+      if self.parse_cache:
+        cache_key = self.parse_cache.MakeKey(f, path)
+      line_reader = reader.FileLineReader(f, self.arena, path=path)
       _, c_parser = parse_lib.MakeParser(line_reader, self.arena)
-      return self._EvalHelper(c_parser, path)
+      return self._EvalHelper(c_parser, path, cache_key=cache_key)
 
     except _ControlFlow as e:
       if e.IsReturn():
@@ -259,7 +347,9 @@ class Executor(object):
     # NOTE: Redirects were processed earlier.
     if argv:
       environ = self.mem.GetExported()
-      process.ExecExternalProgram(argv, environ)  # never returns
+      full_path = self._LookupExternal(argv[0])
+      process.ExecExternalProgram(argv, environ, full_path=full_path)
+      # never returns
     else:
       return 0
 
@@ -308,7 +398,10 @@ class Executor(object):
       status = builtin.Wait(argv, self.waiter, self.job_state, self.mem)
 
     elif builtin_id == EBuiltin.JOBS:
-      status = builtin.Jobs(argv, self.job_state)
+      status = builtin.Jobs(argv, self.waiter, self.job_state)
+
+    elif builtin_id == EBuiltin.PARALLEL_LIMIT:
+      status = builtin.ParallelLimit(argv, self.job_state)
 
     elif builtin_id == EBuiltin.PUSHD:
       status = builtin.Pushd(argv, self.mem.GetVar('HOME'), self.dir_stack)
@@ -356,12 +449,13 @@ class Executor(object):
       status = builtin.GetOpts(argv, self.mem)
 
     elif builtin_id == EBuiltin.COMMAND:
-      path = self.mem.GetVar('PATH')
-      status = builtin.Command(argv, self.funcs, path)
+      status = builtin.Command(argv, self.funcs, self.cmd_hash)
 
     elif builtin_id == EBuiltin.TYPE:
-      path = self.mem.GetVar('PATH')
-      status = builtin.Type(argv, self.funcs, path)
+      status = builtin.Type(argv, self.funcs, self.cmd_hash)
+
+    elif builtin_id == EBuiltin.HASH:
+      status = builtin.Hash(argv, self.cmd_hash)
 
     elif builtin_id in (EBuiltin.DECLARE, EBuiltin.TYPESET):
       # These are synonyms
@@ -561,15 +655,28 @@ class Executor(object):
       return status
 
     environ = self.mem.GetExported()  # Include temporary variables
+    full_path = self._LookupExternal(arg0)
 
     if fork_external:
-      thunk = process.ExternalThunk(argv, environ)
+      thunk = process.ExternalThunk(argv, environ, full_path=full_path)
       p = process.Process(thunk)
       status = p.Run(self.waiter)
       return status
 
     # NOTE: Never returns!
-    process.ExecExternalProgram(argv, environ)
+    process.ExecExternalProgram(argv, environ, full_path=full_path)
+
+  def _LookupExternal(self, arg0):
+    """Return the path the child should execve(), or None to search $PATH.
+
+    The search is done here rather than in the child, so its result is
+    remembered.
+    """
+    if '/' in arg0:
+      return arg0
+    if not self.exec_opts.hashall:  # set +h
+      return None
+    return self.cmd_hash.Lookup(arg0, count_hit=True)
 
   def _MakePipeline(self, node, job_state=None):
     # NOTE: First or last one could use the "main" shell thread.  Doesn't have
@@ -584,9 +691,17 @@ class Executor(object):
     return pi
 
   def _RunPipeline(self, node):
-    pi = self._MakePipeline(node)
+    if self.exec_opts.lastpipe and len(node.children) > 1:
+      # Run the last part in this process, so e.g. 'seq 3 | while read x'
+      # can set variables, and we save a fork().
+      pi = process.Pipeline()
+      for child in node.children[:-1]:
+        pi.Add(self._MakeProcess(child))
+      pi.AddLast((self, node.children[-1]))
+    else:
+      pi = self._MakePipeline(node)
 
-    pipe_status = pi.Run(self.waiter)
+    pipe_status = pi.Run(self.waiter, self.fd_state)
     state.SetGlobalArray(self.mem, 'PIPESTATUS', [str(p) for p in pipe_status])
 
     if self.exec_opts.pipefail:
@@ -609,6 +724,13 @@ class Executor(object):
     #  ancestor of all the other processes in that group. The sample shell
     #  program presented in this chapter uses the first approach because it
     #  makes bookkeeping somewhat simpler."
+    self.waiter.InstallSigChld()
+    self.waiter.Reap()  # Don't let finished jobs pile up as zombies
+    # parallel-limit: block until a job finishes.
+    while self.job_state.AtLimit():
+      if not self.waiter.Wait():
+        break
+
     if node.tag == command_e.Pipeline:
       pi = self._MakePipeline(node, job_state=self.job_state)
       job_id = pi.Start(self.waiter)
@@ -617,9 +739,8 @@ class Executor(object):
       log('Started background pipeline with job ID %d', job_id)
 
     else:
-      # Problem: to get the 'set -b' behavior of immediate notifications, we
-      # have to register SIGCHLD.  But then that introduces race conditions.
-      # If we haven't called Register yet, then we won't know who to notify.
+      # NOTE: There's no race with SIGCHLD, because the handler only sets a
+      # flag.  Processes are reaped later, after Register().
 
       #log('job state %s', self.job_state)
       p = self._MakeProcess(node, job_state=self.job_state)
@@ -634,7 +755,6 @@ class Executor(object):
     # TODO: This API should be simplified
     line_span = self.arena.GetLineSpan(span_id)
     line_id = line_span.line_id
-    line = self.arena.GetLine(line_id)
     source_name, line_num = self.arena.GetDebugInfo(line_id)
     self.mem.SetSourceLocation(source_name, line_num)
 
@@ -644,6 +764,64 @@ class Executor(object):
     # TODO: Share with tracing (SetSourceLocation) and _CheckStatus
     return node.spids[0]
 
+  def _CaseTable(self, node):
+    """Split the patterns of a case statement into a dispatch table.
+
+    Returns:
+      (literals, others).  literals is a dict from a constant pattern to the
+      index of the first arm it appears in.  others is a list of (arm index,
+      matcher, word) for the remaining patterns, in order.  matcher is None
+      if the word has to be evaluated every time, e.g. $pat.
+
+    A constant pattern after a dynamic one in the same arm, like 'a' in
+    $((n+=1))|a, stays in others, so the dynamic word is still evaluated
+    first.
+    """
+    try:
+      return self.case_tables[node]
+    except KeyError:
+      pass
+
+    literals = {}
+    others = []
+    for i, arm in enumerate(node.arms):
+      saw_dynamic = False
+      for pat_word in arm.pat_list:
+        ok, _, _ = word.StaticEval(pat_word)
+        if not ok:
+          others.append((i, None, pat_word))
+          saw_dynamic = True
+          continue
+
+        # Static words evaluate the same way every time.
+        pat_val = self.word_ev.EvalWordToString(pat_word, do_fnmatch=True)
+        m = glob_.CompileGlob(pat_val.s)
+        if m.fixed is None or saw_dynamic:
+          others.append((i, m, pat_word))
+        elif m.fixed not in literals:
+          literals[m.fixed] = i
+
+    table = literals, others
+    self.case_tables[node] = table
+    return table
+
+  def _MatchCase(self, node, to_match):
+    """Returns the index of the first arm that matches, or -1."""
+    literals, others = self._CaseTable(node)
+    first = literals.get(to_match, len(node.arms))
+
+    # Patterns before the literal match still take precedence.
+    for i, m, pat_word in others:
+      if i >= first:
+        break
+      if m is None:
+        pat_val = self.word_ev.EvalWordToString(pat_word, do_fnmatch=True)
+        m = glob_.CompileGlob(pat_val.s)
+      if m.Matches(to_match):
+        return i
+
+    return -1 if first == len(node.arms) else first
+
   def _Dispatch(self, node, fork_external):
     # If we call RunCommandSub in a recursive call to the executor, this will
     # be set true (if strict-errexit is false).  But it only lasts for one
@@ -876,7 +1054,7 @@ class Executor(object):
       else:
         # Only print warnings, never fatal.
         # Bash oddly only exits 1 for 'return', but no other shell does.
-        ui.PrintFilenameAndLine(tok.span_id, self.arena)
+        ui.PrintFilenameAndLine(tok.span_id, self.arena, f=sys.stderr)
         util.warn(msg)
         status = 0
 
@@ -968,11 +1146,11 @@ class Executor(object):
       if node.do_arg_iter:
         iter_list = self.mem.GetArgv()
       else:
-        words = braces.BraceExpandWords(node.iter_words)
-        iter_list = self.word_ev.EvalWordSequence(words)
-        # We need word splitting and so forth
+        # We need word splitting and so forth.  Words without substitutions
+        # or globs, like {1..1000000}, are expanded while the loop runs.
         # NOTE: This expands globs too.  TODO: We should pass in a Globber()
         # object.
+        iter_list = self.word_ev.EvalWordSequenceIter(node.iter_words)
 
       status = 0  # in case we don't loop
       self.loop_level += 1
@@ -1031,6 +1209,7 @@ class Executor(object):
       # NOTE: Would it make sense to evaluate the redirects BEFORE entering?
       # It will save time on function calls.
       self.funcs[node.name] = node
+      self.num_kept_nodes += 1
       status = 0
 
     elif node.tag == command_e.If:
@@ -1058,19 +1237,11 @@ class Executor(object):
       to_match = val.s
 
       status = 0  # If there are no arms, it should be zero?
-      done = False
 
-      for arm in node.arms:
-        for pat_word in arm.pat_list:
-          # NOTE: Is it OK that we're evaluating these as we go?
-          pat_val = self.word_ev.EvalWordToString(pat_word, do_fnmatch=True)
-          #log('Matching word %r against pattern %r', to_match, pat_val.s)
-          if libc.fnmatch(pat_val.s, to_match):
-            status = self._ExecuteList(arm.action)
-            done = True  # TODO: Parse ;;& and for fallthrough and such?
-            break  # Only execute action ONCE
-        if done:
-          break
+      # TODO: Parse ;;& and for fallthrough and such?
+      i = self._MatchCase(node, to_match)
+      if i != -1:
+        status = self._ExecuteList(node.arms[i].action)
 
     elif node.tag == command_e.TimeBlock:
       # TODO:
@@ -1139,6 +1310,8 @@ class Executor(object):
     else:  # No redirects
       status, check_errexit = self._Dispatch(node, fork_external)
 
+    # Builtin output may fail to be written after the builtin returns.
+    status = process.CheckWriteError(status)
     self.mem.last_status = status
 
     # NOTE: Bash says that 'set -e' checking is done after each 'pipeline'.
@@ -1183,30 +1356,142 @@ class Executor(object):
     Returns:
       status: numeric exit code
     """
+    try:
+      _, status = self.ExecuteAndCatch(node, fork_external=fork_external)
+    finally:
+      if run_exit_trap:
+        self.RunExitTrap()
+
+    # Other exceptions: SystemExit for sys.exit()
+    return status
+
+  def ExecuteAndCatch(self, node, fork_external=True):
+    """Like Execute(), but tell the caller whether to stop executing.
+
+    The top-level ParseAndEvalLoop calls this for each command, and stops
+    after a fatal error or a top-level return.
+
+    Returns:
+      (is_fatal, status)
+    """
+    is_fatal = False
     try:
       status = self._Execute(node, fork_external=fork_external)
     except _ControlFlow as e:
       # Return at top level is OK, unlike in bash.
       if e.IsReturn():
         status = e.ReturnValue()
+        is_fatal = True  # Like the end of the script
       else:
         raise
     except util.FatalRuntimeError as e:
-      ui.PrettyPrintError(e, self.arena)
+      # Not the default argument, because sys.stderr is replaced at startup.
+      # See process.InitOutputBuffer().
+      ui.PrettyPrintError(e, self.arena, sys.stderr)
       print('osh failed: %s' % e.UserErrorString(), file=sys.stderr)
       status = e.exit_status if e.exit_status is not None else 1
+      is_fatal = True
       # TODO: dump self.mem if requested.  Maybe speify with OIL_DUMP_PREFIX.
-    finally:
-      if run_exit_trap:
-        # NOTE: The trap itself can call exit!
-        thunk = self.traps.get('EXIT')
-        if thunk:
-          thunk.Run()
 
-    # Other exceptions: SystemExit for sys.exit()
-    return status
+    return is_fatal, status
 
-  def RunCommandSub(self, node):
+  def RunExitTrap(self):
+    # NOTE: The trap itself can call exit!
+    thunk = self.traps.get('EXIT')
+    if thunk:
+      thunk.Run()
+
+  def ClearNodeCaches(self):
+    """Forget what was cached for each LST node.
+
+    Called after each top-level command, since the caches would otherwise keep
+    the LST of every command alive.  Function bodies are analyzed again the
+    next time they're called.
+    """
+    self.static_names.clear()
+    self.case_tables.clear()
+
+  def _StaticNames(self, node, in_func):
+    try:
+      return self.static_names[node]
+    except KeyError:
+      names = _StaticCommandNames(node, in_func)
+      self.static_names[node] = names
+      return names
+
+  def _RunsInProcess(self, name, seen_funcs):
+    """Can the command 'name' be run in a command sub without forking?
+
+    Resolved in the same order as _RunSimpleCommand().
+    """
+    builtin_id = builtin.ResolveSpecial(name)
+    if builtin_id != EBuiltin.NONE:
+      return builtin_id in _IN_PROCESS_BUILTINS
+
+    func_node = self.funcs.get(name)
+    if func_node is not None:
+      if func_node in seen_funcs:  # recursive
+        return True
+      seen_funcs.add(func_node)
+      # Look at the callees every time, since they may be redefined.
+      names = self._StaticNames(func_node.body, True)
+      if names is None:
+        return False
+      return all(self._RunsInProcess(n, seen_funcs) for n in names)
+
+    builtin_id = builtin.Resolve(name)
+    if builtin_id != EBuiltin.NONE:
+      return builtin_id in _IN_PROCESS_BUILTINS
+
+    return False  # external command
+
+  def _CanRunInProcess(self, node):
+    if _ALWAYS_FORK_COMMAND_SUB:
+      return False
+    names = self._StaticNames(node, False)
+    if names is None:
+      return False
+    seen_funcs = set()
+    return all(self._RunsInProcess(n, seen_funcs) for n in names)
+
+  def _RunCommandSubInProcess(self, node):
+    """Emulate a subshell by undoing changes to variables.
+
+    Returns:
+      (status, stdout)
+    """
+    errexit = self.exec_opts.errexit
+    saved_errexit = errexit.errexit, list(errexit.stack)
+    if not self.exec_opts.strict_errexit:
+      errexit.Disable()  # Like SubProgramThunk
+
+    self.mem.PushUndoLog()
+    try:
+      if self.fd_state.PushCapture(self.waiter):
+        try:
+          _, status = self.ExecuteAndCatch(node)
+        except SystemExit as e:
+          # e.g. ${x?} exits the shell.  Here it only exits the subshell we're
+          # emulating.
+          if e.code is None:
+            status = 0
+          elif isinstance(e.code, int):
+            status = e.code
+          else:
+            status = 1
+      else:
+        status = 1
+    finally:
+      stdout = self.fd_state.PopCapture()
+      self.mem.PopUndoLog()
+      errexit.errexit, errexit.stack[:] = saved_errexit
+    return status, stdout
+
+  def _RunCommandSubInChild(self, node):
+    """
+    Returns:
+      (status, stdout)
+    """
     p = self._MakeProcess(node,
                           disable_errexit=not self.exec_opts.strict_errexit)
 
@@ -1226,6 +1511,15 @@ class Executor(object):
     os.close(r)
 
     status = p.WaitUntilDone(self.waiter)
+    return status, ''.join(chunks)
+
+  def RunCommandSub(self, node):
+    # Forking is expensive, so avoid it when the command sub has no effects
+    # that we can't undo.
+    if self._CanRunInProcess(node):
+      status, stdout = self._RunCommandSubInProcess(node)
+    else:
+      status, stdout = self._RunCommandSubInChild(node)
 
     # OSH has the concept of aborting in the middle of a WORD.  We're not
     # waiting until the command is over!
@@ -1247,7 +1541,7 @@ class Executor(object):
     # Runtime errors test case: # $("echo foo > $@")
     # Why rstrip()?
     # https://unix.stackexchange.com/questions/17747/why-does-shell-command-substitution-gobble-up-a-trailing-newline-char
-    return ''.join(chunks).rstrip('\n')
+    return stdout.rstrip('\n')
 
   def RunProcessSub(self, node, op_id):
     """Process sub creates a forks a process connected to a pipe.
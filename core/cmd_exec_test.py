@@ -138,6 +138,141 @@ class ExecutorTest(unittest.TestCase):
   def testBuiltin(self):
     print(ParseAndExecute('echo hi'))
 
+  def testLastPipe(self):
+    from osh.word_parse import WordParser
+    from osh.cmd_parse import CommandParser
+    ex = InitExecutor()
+    code_str = 'shopt -s lastpipe; /bin/echo hi | read x'
+    line_reader, lexer = parse_lib.InitLexer(code_str, ex.arena)
+    w_parser = WordParser(lexer, line_reader)
+    c_parser = CommandParser(w_parser, lexer, line_reader, ex.arena)
+    node = c_parser.ParseWholeFile()
+
+    self.assertEqual(0, ex.Execute(node))
+    # The read builtin ran in this process.
+    self.assertEqual('hi', ex.mem.GetVar('x').s)
+    self.assertEqual(['0', '0'], ex.mem.GetVar('PIPESTATUS').strs)
+
+
+  def testCaseTable(self):
+    from osh.word_parse import WordParser
+    from osh.cmd_parse import CommandParser
+    ex = InitExecutor()
+    code_str = """
+    case $x in
+      -a|--all) ;;
+      --v*) ;;
+      "--verbose"|-a) ;;
+      $pat) ;;
+    esac
+    """
+    line_reader, lexer = parse_lib.InitLexer(code_str, ex.arena)
+    w_parser = WordParser(lexer, line_reader)
+    c_parser = CommandParser(w_parser, lexer, line_reader, ex.arena)
+    node = c_parser.ParseWholeFile()
+    if node.tag == command_e.CommandList:
+      node = node.children[0]
+
+    literals, others = ex._CaseTable(node)
+    # -a is only in the first arm it appears in
+    self.assertEqual({'-a': 0, '--all': 0, '--verbose': 2}, literals)
+    self.assertEqual([1, 3], [i for i, _, _ in others])
+    self.assertEqual(None, others[1][1])  # $pat is evaluated every time
+
+    self.assertEqual(0, ex._MatchCase(node, '-a'))
+    # --v* comes before the literal --verbose
+    self.assertEqual(1, ex._MatchCase(node, '--verbose'))
+    self.assertEqual(-1, ex._MatchCase(node, '-b'))
+
+    # A literal after a dynamic pattern in the same arm isn't in the dict, so
+    # the arithmetic is still evaluated.
+    code_str = 'case $x in $((n+=1))|a) ;; b) ;; esac'
+    line_reader, lexer = parse_lib.InitLexer(code_str, ex.arena)
+    w_parser = WordParser(lexer, line_reader)
+    c_parser = CommandParser(w_parser, lexer, line_reader, ex.arena)
+    node = c_parser.ParseWholeFile()
+    if node.tag == command_e.CommandList:
+      node = node.children[0]
+
+    literals, others = ex._CaseTable(node)
+    self.assertEqual({'b': 1}, literals)
+    self.assertEqual([0, 0], [i for i, _, _ in others])
+    self.assertEqual(0, ex._MatchCase(node, 'a'))
+    self.assertEqual('1', ex.mem.GetVar('n').s)
+
+    ex.ClearNodeCaches()
+    self.assertEqual({}, ex.case_tables)
+
+
+class CommandSubTest(unittest.TestCase):
+
+  def _Parse(self, ex, code_str):
+    from osh.word_parse import WordParser
+    from osh.cmd_parse import CommandParser
+    line_reader, lexer = parse_lib.InitLexer(code_str, ex.arena)
+    w_parser = WordParser(lexer, line_reader)
+    c_parser = CommandParser(w_parser, lexer, line_reader, ex.arena)
+    return c_parser.ParseWholeFile()
+
+  def _FuncDef(self, ex, code_str):
+    return self._Parse(ex, code_str).children[0]
+
+  def _CommandSub(self, ex, code_str):
+    """Run a command sub that shouldn't fork."""
+    node = self._Parse(ex, code_str)
+    self.assertEqual(True, ex._CanRunInProcess(node))
+    return ex.RunCommandSub(node)
+
+  def testStaticCommandNames(self):
+    def Names(code_str, in_func=False):
+      node = InitCommandParser(code_str).ParseWholeFile()
+      return cmd_exec._StaticCommandNames(node, in_func)
+
+    self.assertEqual(['echo', 'f'], sorted(Names('x=1; f "$x" && echo hi')))
+    self.assertEqual(['echo', 'true'], sorted(Names('if true; then echo; fi')))
+    self.assertEqual(None, Names('echo hi | cat'))
+    self.assertEqual(None, Names('$cmd'))
+    self.assertEqual(None, Names('f() { echo; }'))
+    self.assertEqual(None, Names('return 1'))
+    self.assertEqual([], Names('return 1', in_func=True))
+
+  def testInProcess(self):
+    ex = InitExecutor()
+    state.SetGlobalString(ex.mem, 'x', 'outer')
+    ex.mem.SetArgv(['a', 'b'])
+    ex.funcs['f'] = self._FuncDef(
+        ex, 'f() { local y=2; x=changed; echo "f $1"; }')
+
+    out = self._CommandSub(ex, 'f 1; shift; export z=3; echo $x $#')
+    self.assertEqual('f 1\nchanged 1', out)
+    # Like a subshell, the changes aren't visible.
+    self.assertEqual('outer', ex.mem.GetVar('x').s)
+    self.assertEqual(value_e.Undef, ex.mem.GetVar('z').tag)
+    self.assertEqual(['a', 'b'], ex.mem.GetArgv())
+
+    # Nested
+    out = self._CommandSub(ex, 'x=1; echo $(x=2; echo $x) $x')
+    self.assertEqual('2 1', out)
+
+    # External commands need a process.  (Forking in a unit test isn't safe.)
+    ex.funcs['g'] = self._FuncDef(ex, 'g() { f; ls; }')
+    self.assertEqual(False, ex._CanRunInProcess(self._Parse(ex, 'g')))
+    self.assertEqual(True, ex._CanRunInProcess(self._Parse(ex, 'f')))
+
+    # The cache doesn't keep LSTs alive after the top-level command.
+    self.assertNotEqual({}, ex.static_names)
+    ex.ClearNodeCaches()
+    self.assertEqual({}, ex.static_names)
+
+  def testInProcessExit(self):
+    ex = InitExecutor()
+    # ${x?} calls sys.exit(), which only exits the emulated subshell.
+    node = self._Parse(ex, 'echo ${undef?boom}')
+    self.assertEqual(True, ex._CanRunInProcess(node))
+    status, out = ex._RunCommandSubInProcess(node)
+    self.assertEqual(33, status)
+    self.assertEqual('', out)
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -597,9 +597,12 @@ class RootCompleter(object):
 
   def Matches(self, buf, status_out):
     arena = alloc.CompletionArena(self.pool)
-    w_parser, c_parser = parse_lib.MakeParserForCompletion(buf, arena)
-    comp_type, prefix, comp_words = _GetCompletionType(
-        w_parser, c_parser, self.ev, status_out)
+    try:
+      w_parser, c_parser = parse_lib.MakeParserForCompletion(buf, arena)
+      comp_type, prefix, comp_words = _GetCompletionType(
+          w_parser, c_parser, self.ev, status_out)
+    finally:
+      self.pool.DestroyLastArena()  # the parsed buffer isn't needed anymore
 
     comp_type, prefix, comp_words = _GetCompletionType1(self.parser, buf)
 
@@ -143,6 +143,22 @@ class CompletionTest(unittest.TestCase):
     m = list(r.Matches('var=$v', STATUS))
     m = list(r.Matches('local var=$v', STATUS))
 
+  def testRootCompleterDestroysArena(self):
+    pool = alloc.Pool()
+    r = completion.RootCompleter(pool, _MakeTestEvaluator(),
+                                 completion.CompletionLookup(), V1)
+
+    def _Raise(*args):
+      raise RuntimeError('oops')
+
+    orig = completion._GetCompletionType
+    completion._GetCompletionType = _Raise
+    try:
+      self.assertRaises(RuntimeError, list, r.Matches('grep f', STATUS))
+    finally:
+      completion._GetCompletionType = orig
+    self.assertEqual([], pool.arenas)
+
 
 def _MakeTestEvaluator():
   mem = state.Mem('', [], {}, None)
@@ -13,11 +13,12 @@ import os
 import stat
 
 try:
-  import libc  # for fnmatch
+  import libc  # for regex_match
 except ImportError:
   from benchmarks import fake_libc as libc
 
 from core.id_kind import BOOL_OPS, OperandType, Id
+from core import glob_
 from core import util
 from core import runtime
 
@@ -589,10 +590,10 @@ class BoolEvaluator(_ExprEvaluator):
 
         if op_id in (Id.BoolBinary_GlobEqual, Id.BoolBinary_GlobDEqual):
           #log('Comparing %s and %s', s2, s1)
-          return libc.fnmatch(s2, s1)
+          return glob_.CompileGlob(s2).Matches(s1)
 
         if op_id == Id.BoolBinary_GlobNEqual:
-          return not libc.fnmatch(s2, s1)
+          return not glob_.CompileGlob(s2).Matches(s1)
 
         if op_id in (Id.BoolBinary_Equal, Id.BoolBinary_DEqual):
           return s1 == s2
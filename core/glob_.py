@@ -3,12 +3,10 @@
 glob_.py
 """
 
+import os
 import re
-
-try:
-  import libc
-except ImportError:
-  from benchmarks import fake_libc as libc
+import stat
+import time
 
 from core.util import log
 
@@ -77,59 +75,289 @@ def GlobToExtendedRegex(g):
   raise NotImplementedError
 
 
-def GlobToPythonRegex(s, greedy=True):
-  """Convert a glob to a libc extended regexp.
+# Character classes in the C locale, as the inside of a Python regex class.
+_CHAR_CLASSES = {
+    'alnum': 'a-zA-Z0-9',
+    'alpha': 'a-zA-Z',
+    'blank': ' \\t',
+    'cntrl': '\\x00-\\x1f\\x7f',
+    'digit': '0-9',
+    'graph': '!-~',
+    'lower': 'a-z',
+    'print': ' -~',
+    'punct': '!-/:-@\\[-`{-~',
+    'space': ' \\t\\n\\r\\f\\v',
+    'upper': 'A-Z',
+    'xdigit': '0-9A-Fa-f',
+}
 
-  Args:
-    greedy: whether * should be '.*' (greedy) or '.*?' (non-greedy)
 
-  NOTE: character classes aren't supported.
+def _ClassChar(c):
+  """Escape a character for use inside a Python regex class."""
+  if c in '\\]^-[':
+    return '\\' + c
+  return c
 
-  Returns:
-    A Python regex string, or None if it's the pattern is a constant string
-    rather than a glob.
 
-    regex, err?
+def _BracketToRegex(s, i):
+  """Convert a bracket expression like [a-z] or [![:space:]] at s[i].
+
+  Returns:
+    (regex, end_index, err).  regex is None if there's no closing bracket, in
+    which case [ is an ordinary character, like in fnmatch().
   """
-  star_pat = '.*' if greedy else '.*?'
+  n = len(s)
+  j = i + 1
+  negated = False
+  if j < n and s[j] in '!^':
+    negated = True
+    j += 1
+
+  items = []
+  err = None
+  first = True
+  while True:
+    if j >= n:
+      return None, i, None  # unterminated
+
+    c = s[j]
+    if c == ']' and not first:
+      j += 1
+      break
+    first = False
+
+    if s.startswith('[:', j):
+      end = s.find(':]', j + 2)
+      if end != -1:
+        name = s[j+2 : end]
+        if name in _CHAR_CLASSES:
+          items.append(_CHAR_CLASSES[name])
+        else:
+          err = True  # e.g. [[:foo:]]
+        j = end + 2
+        continue
+
+    if c == '\\' and j + 1 < n:
+      j += 1
+      c = s[j]
+    j += 1
+
+    # A - that's first or last is an ordinary character.
+    if j + 1 < n and s[j] == '-' and s[j+1] != ']':
+      hi = s[j+1]
+      j += 2
+      if hi == '\\' and j < n:
+        hi = s[j]
+        j += 1
+      if c <= hi:  # an empty range like [z-a] matches nothing
+        items.append(_ClassChar(c) + '-' + _ClassChar(hi))
+    else:
+      items.append(_ClassChar(c))
+
+  if items:
+    regex = '[%s%s]' % ('^' if negated else '', ''.join(items))
+  else:
+    regex = '.' if negated else '(?!)'
+  return regex, j, err
+
+
+def _GlobToAtoms(s):
+  """Split a glob into regex atoms that each match one character.
 
+  Returns:
+    (atoms, fixed, err).  A * is None in the atoms list.  fixed is the
+    unescaped string if the glob has no operators, and None otherwise.
+  """
+  atoms = []
+  literal = []
   is_glob = False
   err = None
 
   i = 0
   n = len(s)
-  out = []
   while i < n:
     c = s[i]
-    if c == '\\':  # glob escape like \* or \?
+    if c == '\\' and i + 1 < n:  # glob escape like \* or \?
       i += 1
-      out.append(s[i])
+      c = s[i]
     elif c == '*':
       is_glob = True
-      out.append(star_pat)
+      if not atoms or atoms[-1] is not None:  # ** is the same as *
+        atoms.append(None)
+      i += 1
+      continue
     elif c == '?':
       is_glob = True
-      out.append('.')
-    # TODO: Should we enter a different state and parse these?
+      atoms.append('.')
+      i += 1
+      continue
     elif c == '[':
-      err = True  # TODO: better error
-      break
-    elif c == ']':
-      err = True
-    else:
-      # e.g. . -> \.
-      out.append(re.escape(c))
-
+      regex, end, bracket_err = _BracketToRegex(s, i)
+      if regex is not None:
+        is_glob = True
+        err = err or bracket_err
+        atoms.append(regex)
+        i = end
+        continue
+
+    atoms.append(re.escape(c))
+    literal.append(c)
     i += 1
 
+  fixed = None if is_glob else ''.join(literal)
+  return atoms, fixed, err
+
+
+def _AtomsToRegex(atoms, greedy):
+  star_pat = '.*' if greedy else '.*?'
+  return ''.join(star_pat if a is None else a for a in atoms)
+
+
+def GlobToPythonRegex(s, greedy=True):
+  """Convert a glob to a Python regex.
+
+  Args:
+    greedy: whether * should be '.*' (greedy) or '.*?' (non-greedy)
+
+  Returns:
+    (regex, err).  regex is None if the pattern is a constant string rather
+    than a glob.  err is True for an unknown character class.
+  """
+  atoms, fixed, err = _GlobToAtoms(s)
   if err:
     return None, err
-  else:
-    if is_glob:
-      regex = ''.join(out)
+  if fixed is not None:
+    return None, None
+  return _AtomsToRegex(atoms, greedy), None
+
+
+class GlobMatcher(object):
+  """A glob that's compiled once, and used for case, [[ ==, ${x#pat} and
+  ${x/pat/replace}.
+
+  Prefix and suffix removal don't loop over every prefix or suffix.  The
+  longest prefix is found by searching the reversed string with the reversed
+  pattern, and the shortest suffix by a non-greedy match of the same.
+  """
+
+  def __init__(self, pat, ignore_case=False):
+    """
+    Args:
+      ignore_case: for nocaseglob.  Only Matches() respects it.
+    """
+    self.atoms, self.fixed, self.err = _GlobToAtoms(pat)
+    self.flags = re.DOTALL | (re.IGNORECASE if ignore_case else 0)
+    self.regexes = {}  # (reverse, greedy, anchored) -> compiled regex
+
+    # Compile the regex for case and [[ == eagerly, since it's the common one.
+    if self.err or (self.fixed is not None and not ignore_case):
+      self.full_match = None
     else:
-      regex = None
-    return regex, err
+      self.full_match = self._Regex(False, True, True).match
+
+  def _Regex(self, reverse, greedy, anchored):
+    key = (reverse, greedy, anchored)
+    try:
+      return self.regexes[key]
+    except KeyError:
+      pass
+    atoms = self.atoms[::-1] if reverse else self.atoms
+    regex = _AtomsToRegex(atoms, greedy)
+    if anchored:
+      regex += r'\Z'
+    r = re.compile(regex, self.flags)
+    self.regexes[key] = r
+    return r
+
+  def Matches(self, s):
+    if self.full_match:
+      return self.full_match(s) is not None
+    if self.err:
+      return False
+    return s == self.fixed
+
+  def ShortestPrefix(self, s):
+    """Returns the length of the shortest matching prefix, or -1."""
+    if self.err:
+      return -1
+    if self.fixed is not None:
+      return len(self.fixed) if s.startswith(self.fixed) else -1
+    m = self._Regex(False, False, False).match(s)
+    return m.end() if m else -1
+
+  def LongestPrefix(self, s):
+    """Returns the length of the longest matching prefix, or -1."""
+    if self.err:
+      return -1
+    if self.fixed is not None:
+      return len(self.fixed) if s.startswith(self.fixed) else -1
+    m = self._Regex(True, True, True).search(s[::-1])
+    return len(s) - m.start() if m else -1
+
+  def ShortestSuffix(self, s):
+    """Returns the start of the shortest matching suffix, or -1."""
+    if self.err:
+      return -1
+    if self.fixed is not None:
+      return len(s) - len(self.fixed) if s.endswith(self.fixed) else -1
+    m = self._Regex(True, False, False).match(s[::-1])
+    return len(s) - m.end() if m else -1
+
+  def LongestSuffix(self, s):
+    """Returns the start of the longest matching suffix, or -1."""
+    if self.err:
+      return -1
+    if self.fixed is not None:
+      return len(s) - len(self.fixed) if s.endswith(self.fixed) else -1
+    m = self._Regex(False, True, True).search(s)
+    return m.start() if m else -1
+
+  def Sub(self, replace_str, s, count):
+    """Replace the first count matches, or all of them if count is 0."""
+    if self.fixed is not None:
+      return s.replace(self.fixed, replace_str, count or -1)
+    # Use a function so backslashes in replace_str aren't interpreted.
+    return self._Regex(False, True, False).sub(lambda m: replace_str, s, count)
+
+
+class _MatcherCache(object):
+  """Compiled globs, keyed by pattern string, with LRU eviction."""
+
+  def __init__(self, max_size, ignore_case=False):
+    self.max_size = max_size
+    self.ignore_case = ignore_case
+    self.entries = {}  # pattern -> [GlobMatcher, last use]
+    self.clock = 0
+
+  def Get(self, pat):
+    self.clock += 1
+    try:
+      entry = self.entries[pat]
+    except KeyError:
+      if len(self.entries) >= self.max_size:
+        self._Evict()
+      entry = [GlobMatcher(pat, ignore_case=self.ignore_case), 0]
+      self.entries[pat] = entry
+    entry[1] = self.clock
+    return entry[0]
+
+  def _Evict(self):
+    # Drop the least recently used quarter at once, so a loop over more than
+    # max_size patterns doesn't sort on every miss.
+    by_age = sorted(self.entries.iteritems(), key=lambda item: item[1][1])
+    for pat, _ in by_age[:max(1, self.max_size // 4)]:
+      del self.entries[pat]
+
+
+_MATCHER_CACHE = _MatcherCache(1000)
+_NOCASE_MATCHER_CACHE = _MatcherCache(1000, ignore_case=True)
+
+
+def CompileGlob(pat, ignore_case=False):
+  """Returns a cached GlobMatcher for the pattern."""
+  if ignore_case:
+    return _NOCASE_MATCHER_CACHE.Get(pat)
+  return _MATCHER_CACHE.Get(pat)
 
 
 def _GlobUnescape(s):  # used by cmd_exec
@@ -161,23 +389,223 @@ def _GlobUnescape(s):  # used by cmd_exec
   return unescaped
 
 
-class Globber:
+class _DirListing(object):
+  """The names in one directory."""
+
+  def __init__(self, names, mtime, nlink, racy):
+    self.names = sorted(names)
+    self.mtime = mtime
+    self.nlink = nlink
+    # If the directory was modified just before we read it, another change in
+    # the same clock tick wouldn't update the mtime.  Don't reuse it.
+    self.racy = racy
+    self.subdirs = None  # set of names that are directories, for **
+    self.dir_links = None  # set of names that are symlinks to directories
+    self.matches = {}  # (pattern, ignore_case, hidden_ok) -> names
+
+  def Matching(self, pat, ignore_case, hidden_ok):
+    """Returns the names that match a glob component, in sorted order."""
+    key = (pat, ignore_case, hidden_ok)
+    try:
+      return self.matches[key]
+    except KeyError:
+      pass
+
+    names = self.names
+    # Like FNM_PERIOD: only a literal . matches a leading dot.
+    if pat.startswith('.') or pat.startswith('\\.'):
+      names = ['.', '..'] + names  # like libc glob()
+    elif not hidden_ok:
+      names = [name for name in names if not name.startswith('.')]
+
+    m = CompileGlob(pat, ignore_case=ignore_case)
+    result = filter(m.Matches, names)
+    self.matches[key] = result
+    return result
+
+  def SubDirs(self, dir_path):
+    """Names that are directories, not symlinks to them, like bash."""
+    if self.subdirs is None:
+      subdirs = set()
+      # Each subdirectory links back with .., so a directory with 2 links has
+      # none.  This is the same shortcut find uses.  Some file systems always
+      # report 1 instead, and then we have to lstat() everything.
+      names = [] if self.nlink == 2 else self.names
+      for name in names:
+        try:
+          st = os.lstat(os.path.join(dir_path, name))
+        except OSError:
+          continue
+        if stat.S_ISDIR(st.st_mode):
+          subdirs.add(name)
+      self.subdirs = subdirs
+    return self.subdirs
+
+  def DirLinks(self, dir_path):
+    """Names that are symlinks to directories, which **/ lists in bash."""
+    if self.dir_links is None:
+      # Unlike SubDirs(), the link count doesn't help here.
+      self.dir_links = set(
+          name for name in self.names
+          if os.path.islink(os.path.join(dir_path, name)) and
+             os.path.isdir(os.path.join(dir_path, name)))
+    return self.dir_links
+
+
+class DirCache(object):
+  """Directory listings for globbing, validated by the directory's mtime.
+
+  Keyed by (device, inode), so it's still valid after cd.
+  """
+  # A listing read less than this many seconds after the directory was
+  # modified is re-read next time.
+  RACY_SECONDS = 2.0
+
+  def __init__(self, max_size=10000):
+    self.max_size = max_size
+    self.listings = {}  # (st_dev, st_ino) -> _DirListing
+
+  def Get(self, dir_path):
+    """Returns a _DirListing, or None if dir_path isn't a readable directory."""
+    try:
+      st = os.stat(dir_path)
+    except OSError:
+      return None
+    if not stat.S_ISDIR(st.st_mode):
+      return None
+
+    key = (st.st_dev, st.st_ino)
+    listing = self.listings.get(key)
+    if listing and listing.mtime == st.st_mtime and not listing.racy:
+      return listing
+
+    try:
+      names = os.listdir(dir_path)
+    except OSError:  # e.g. permission denied
+      return None
+    racy = time.time() - st.st_mtime < self.RACY_SECONDS
+    listing = _DirListing(names, st.st_mtime, st.st_nlink, racy)
+
+    if len(self.listings) >= self.max_size:
+      self.listings.clear()
+    self.listings[key] = listing
+    return listing
+
+
+class Globber(object):
   def __init__(self, exec_opts):
     self.exec_opts = exec_opts
+    self.dir_cache = DirCache()
 
     # NOTE: Bash also respects the GLOBIGNORE variable, but no other shells
     # do.  Could a default GLOBIGNORE to ignore flags on the file system be
     # part of the security solution?  It doesn't seem totally sound.
 
-    # shopt: why the difference?  No command line switch I guess.
-    self.dotglob = False  # dotfiles are matched
-    self.globstar = False  # ** for directories
+    # Supported shopt options: dotglob, globstar, nocaseglob, nullglob,
+    # failglob.
     # globasciiranges - ascii or unicode char classes (unicode by default)
-    # nocaseglob
     # extglob: the !() syntax
 
-    # TODO: Figure out which ones are in other shells, and only support those?
-    # - Include globstar since I use it, and zsh has it.
+  def _Walk(self, prefix, parts, i):
+    """Yield paths under prefix that match the pattern components parts[i:].
+
+    Args:
+      prefix: '' for the current directory, or a path ending in /
+    """
+    comp = parts[i]
+    last = (i == len(parts) - 1)
+    dir_path = prefix or '.'
+
+    if comp == '':  # trailing slash, or a//b
+      if last:
+        if prefix and self.dir_cache.Get(dir_path):
+          yield prefix
+      else:
+        for p in self._Walk(prefix + '/', parts, i+1):
+          yield p
+      return
+
+    if comp == '**' and self.exec_opts.globstar:
+      if last:  # every file and directory, recursively
+        if prefix:
+          yield prefix  # like bash
+        for p in self._Descendants(prefix, False):
+          yield p
+      else:  # zero or more directories
+        for p in self._Walk(prefix, parts, i+1):
+          yield p
+        # Like bash, **/ lists symlinks to directories, but **/x doesn't look
+        # inside them.
+        dir_links = (parts[i+1:] == [''])
+        for d in self._Descendants(prefix, True, dir_links=dir_links):
+          for p in self._Walk(d, parts, i+1):
+            yield p
+      return
+
+    ignore_case = self.exec_opts.nocaseglob
+    m = CompileGlob(comp, ignore_case=ignore_case)
+    if m.fixed is not None:  # no need to list the directory
+      path = prefix + m.fixed
+      if last:
+        if os.path.lexists(path):
+          yield path
+      else:
+        for p in self._Walk(path + '/', parts, i+1):
+          yield p
+      return
+
+    listing = self.dir_cache.Get(dir_path)
+    if listing is None:
+      return
+
+    names = listing.Matching(comp, ignore_case, self.exec_opts.dotglob)
+    for name in names:
+      if last:
+        yield prefix + name
+      else:
+        for p in self._Walk(prefix + name + '/', parts, i+1):
+          yield p
+
+  def _Descendants(self, prefix, dirs_only, dir_links=False):
+    """Yield entries under prefix recursively, for **.
+
+    Directories end with / if dirs_only is set.  If dir_links is set, symlinks
+    to directories are yielded too, but never descended into.
+    """
+    dir_path = prefix or '.'
+    listing = self.dir_cache.Get(dir_path)
+    if listing is None:
+      return
+    subdirs = listing.SubDirs(dir_path)
+    links = listing.DirLinks(dir_path) if dir_links else ()
+    for name in listing.names:
+      if name.startswith('.') and not self.exec_opts.dotglob:
+        continue
+      is_dir = name in subdirs
+      if is_dir:
+        d = prefix + name + '/'
+        yield d if dirs_only else prefix + name
+        for p in self._Descendants(d, dirs_only, dir_links=dir_links):
+          yield p
+      elif name in links:
+        yield prefix + name + '/'
+      elif not dirs_only:
+        yield prefix + name
+
+  def _Glob(self, pat):
+    """Return the sorted paths that match a glob pattern."""
+    if pat.startswith('/'):
+      prefix = '/'
+      pat = pat.lstrip('/')
+    else:
+      prefix = ''
+    if not pat:
+      return [prefix]
+
+    # The walk yields matches one directory at a time.  A set removes
+    # duplicates from patterns like **/**, and the result is sorted like
+    # libc's glob().
+    return sorted(set(self._Walk(prefix, pat.split('/'), 0)))
 
   def Expand(self, arg):
     """Given a string that could be a glob, return a list of strings."""
@@ -188,16 +616,9 @@ class Globber:
     if self.exec_opts.noglob:
       return [arg]
 
-    try:
-      #g = glob.glob(arg)  # Bad Python glob
-      # PROBLEM: / is significant and can't be escaped!  Have to avoid
-      # globbing it.
-      g = libc.glob(arg)
-    except Exception as e:
-      # - [C\-D] is invalid in Python?  Regex compilation error.
-      # - [:punct:] not supported
-      print("Error expanding glob %r: %s" % (arg, e))
-      raise
+    # NOTE: / is significant and can't be escaped, so the pattern is split
+    # into path components before matching.
+    g = self._Glob(arg)
     #log('glob %r -> %r', arg, g)
 
     if g:
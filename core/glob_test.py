@@ -3,11 +3,16 @@
 glob_test.py: Tests for glob.py
 """
 
+import os
+import random
 import re
+import shutil
+import tempfile
 import unittest
 
 import libc
 from core import glob_
+from core import state
 
 
 class GlobEscapeTest(unittest.TestCase):
@@ -97,7 +102,12 @@ class GlobEscapeTest(unittest.TestCase):
         ('*.py', '.*\.py', None),
         ('*.?', '.*\..', None),
         ('abc', None, None),
-        ('[[:space:]]', None, True),
+        (r'\*.py', None, None),
+        ('[[:space:]]', '[ \\t\\n\\r\\f\\v]', None),
+        ('[!a-c]?', '[^a-c].', None),
+        ('[]]', '[\\]]', None),
+        ('[a', None, None),  # no closing bracket
+        ('[[:foo:]]', None, True),
     ]
     for glob, expected_regex, expected_err in CASES:
       regex, err = glob_.GlobToPythonRegex(glob)
@@ -117,5 +127,163 @@ class GlobEscapeTest(unittest.TestCase):
     # We have to keep advancing the string until there are no more matches.
 
 
+class GlobMatcherTest(unittest.TestCase):
+
+  def testMatches(self):
+    CASES = [
+        ('*.py', 'foo.py', True),
+        ('*.py', 'foo.pyc', False),
+        ('?', '\n', True),
+        (r'\*', '*', True),
+        (r'\*', 'a', False),
+        ('[[:digit:]]*', '1a', True),
+        ('[[:digit:]]*', 'a1', False),
+        ('[!/]', '/', False),
+        ('[^/]', 'a', True),
+        ('[a-]', '-', True),
+        ('[z-a]', 'b', False),
+        ('[a', '[a', True),
+        ('[[:foo:]]', 'f', False),
+    ]
+    for pat, s, expected in CASES:
+      m = glob_.GlobMatcher(pat)
+      self.assertEqual(expected, m.Matches(s), '%r %r' % (pat, s))
+      self.assertEqual(expected, bool(libc.fnmatch(pat, s)), '%r %r' % (pat, s))
+
+  def testPrefixSuffix(self):
+    m = glob_.GlobMatcher('*/')
+    s = 'a/b/c'
+    self.assertEqual(2, m.ShortestPrefix(s))  # ${s#*/}
+    self.assertEqual(4, m.LongestPrefix(s))  # ${s##*/}
+    m = glob_.GlobMatcher('/*')
+    self.assertEqual(3, m.ShortestSuffix(s))  # ${s%/*}
+    self.assertEqual(1, m.LongestSuffix(s))  # ${s%%/*}
+
+    m = glob_.GlobMatcher('x*')
+    self.assertEqual(-1, m.ShortestPrefix(s))
+    self.assertEqual(-1, m.LongestSuffix(s))
+
+    # The empty prefix matches *
+    m = glob_.GlobMatcher('*')
+    self.assertEqual(0, m.ShortestPrefix(s))
+    self.assertEqual(5, m.ShortestSuffix(s))
+
+  def testAgainstFnmatch(self):
+    # Compare with calling fnmatch() on every prefix and suffix.
+    r = random.Random(42)
+    atoms = ['a', 'b', '*', '?', '[ab]', '[!a]', r'\*', '[[:alpha:]]']
+    for _ in xrange(300):
+      pat = ''.join(r.choice(atoms) for _ in xrange(r.randint(1, 5)))
+      m = glob_.GlobMatcher(pat)
+      for _ in xrange(10):
+        s = ''.join(r.choice('ab*') for _ in xrange(r.randint(0, 8)))
+        n = len(s)
+        prefixes = [i for i in xrange(n+1) if libc.fnmatch(pat, s[:i])]
+        suffixes = [i for i in xrange(n+1) if libc.fnmatch(pat, s[i:])]
+
+        msg = '%r %r' % (pat, s)
+        self.assertEqual(n in prefixes, m.Matches(s), msg)
+        self.assertEqual(min(prefixes or [-1]), m.ShortestPrefix(s), msg)
+        self.assertEqual(max(prefixes or [-1]), m.LongestPrefix(s), msg)
+        self.assertEqual(max(suffixes or [-1]), m.ShortestSuffix(s), msg)
+        self.assertEqual(min(suffixes or [-1]), m.LongestSuffix(s), msg)
+
+  def testSub(self):
+    m = glob_.GlobMatcher('[ab]')
+    self.assertEqual('X-X-c', m.Sub('X', 'a-b-c', 0))
+    self.assertEqual('X-b-c', m.Sub('X', 'a-b-c', 1))
+    # Backslashes are not regex group references
+    self.assertEqual(r'\1-b-c', m.Sub(r'\1', 'a-b-c', 1))
+
+    m = glob_.GlobMatcher(r'\*')
+    self.assertEqual('a-a', m.Sub('-', 'a*a', 0))
+
+  def testCache(self):
+    cache = glob_._MatcherCache(4)
+    m = cache.Get('a*')
+    self.assertTrue(m is cache.Get('a*'))
+    for pat in ['b*', 'c*', 'd*']:
+      cache.Get(pat)
+    cache.Get('a*')  # most recently used
+    cache.Get('e*')  # evicts b*
+    self.assertEqual(['a*', 'c*', 'd*', 'e*'], sorted(cache.entries))
+
+
+class GlobberTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp = tempfile.mkdtemp()
+    for path in ['x.c', 'Y.C', '.hidden.c', 'a/y.c', 'a/b/z.c', 'a/.h/w.c']:
+      path = os.path.join(self.tmp, path)
+      if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+      open(path, 'w').close()
+    # Listed by **/, but not followed
+    os.symlink(os.path.join(self.tmp, 'a'), os.path.join(self.tmp, 'link'))
+
+    mem = state.Mem('', [], {}, None)
+    self.exec_opts = state.ExecOpts(mem)
+    self.globber = glob_.Globber(self.exec_opts)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp)
+
+  def _Expand(self, pat):
+    prefix = glob_.GlobEscape(self.tmp) + '/'
+    n = len(self.tmp) + 1
+    return [p[n:] for p in self.globber.Expand(prefix + pat)]
+
+  def testExpand(self):
+    self.assertEqual(['x.c'], self._Expand('*.c'))
+    self.assertEqual(['a/y.c', 'link/y.c'], self._Expand('*/*.c'))
+    self.assertEqual(['a/', 'link/'], self._Expand('*/'))
+    self.assertEqual(['.hidden.c'], self._Expand('.*.c'))
+    self.assertEqual(['a/b/z.c'], self._Expand('a/[b]/z.?'))
+
+    # No match
+    self.assertEqual(['*.zz'], self._Expand('*.zz'))
+    self.exec_opts.nullglob = True
+    self.assertEqual([], self._Expand('*.zz'))
+
+  def testOptions(self):
+    self.exec_opts.dotglob = True
+    self.assertEqual(['.hidden.c', 'x.c'], self._Expand('*.c'))
+    self.exec_opts.dotglob = False
+
+    self.exec_opts.nocaseglob = True
+    self.assertEqual(['Y.C', 'x.c'], self._Expand('*.c'))
+    self.exec_opts.nocaseglob = False
+
+    # Without globstar, ** is the same as *
+    self.assertEqual(['a/y.c', 'link/y.c'], self._Expand('**/*.c'))
+    self.exec_opts.globstar = True
+    self.assertEqual(
+        ['a/b/z.c', 'a/y.c', 'x.c'], self._Expand('**/*.c'))
+    # The directory itself is included, like bash
+    self.assertEqual(['', 'a/', 'a/b/', 'link/'], self._Expand('**/'))
+    self.assertEqual(['a/', 'a/b/', 'link/'], self._Expand('**/*/'))
+    self.assertEqual(['a/', 'a/b', 'a/b/z.c', 'a/y.c'], self._Expand('a/**'))
+    self.assertEqual(['a/b/z.c', 'a/y.c'], self._Expand('a/**/*.c'))
+
+  def testDirCache(self):
+    cache = glob_.DirCache()
+    d = os.path.join(self.tmp, 'a')
+    listing = cache.Get(d)
+    self.assertEqual(['.h', 'b', 'y.c'], listing.names)
+    # Modified just now, so it's read again
+    self.assertTrue(cache.Get(d) is not listing)
+
+    old = os.path.getmtime(d) - 60
+    os.utime(d, (old, old))
+    listing = cache.Get(d)
+    self.assertTrue(cache.Get(d) is listing)
+
+    open(os.path.join(d, 'new.c'), 'w').close()
+    self.assertEqual(['.h', 'b', 'new.c', 'y.c'], cache.Get(d).names)
+
+    self.assertEqual(None, cache.Get(os.path.join(d, 'y.c')))
+    self.assertEqual(None, cache.Get(os.path.join(d, 'nonexistent')))
+
+
 if __name__ == '__main__':
   unittest.main()
@@ -40,6 +40,11 @@ with SPLIT_REGEX = / digit+ / {
 from core import runtime
 from core import util
 
+try:
+  import fastsplit
+except ImportError:
+  fastsplit = None
+
 value_e = runtime.value_e
 span_e = runtime.span_e
 log = util.log
@@ -290,6 +295,10 @@ TRANSITIONS = {
 }
 
 
+# The span types native/fastsplit.c emits, in the order it expects.
+_SPAN_TYPES = (span_e.Black, span_e.Delim, span_e.Backslash)
+
+
 class IfsSplitter(_BaseSplitter):
   """Split a string when IFS has non-whitespace characters."""
 
@@ -299,6 +308,14 @@ class IfsSplitter(_BaseSplitter):
     self.ifs_other = ifs_other
 
   def Split(self, s, allow_escape):
+    """Split with the native state machine if it's available."""
+    if fastsplit:
+      return fastsplit.IfsSplit(s, self.ifs_whitespace, self.ifs_other,
+                                allow_escape, _SPAN_TYPES)
+    return self._SplitSlow(s, allow_escape)
+
+  def _SplitSlow(self, s, allow_escape):
+    """Pure Python version of Split().  native/fastsplit.c mirrors it."""
     ws_chars = self.ifs_whitespace
     other_chars = self.ifs_other
 
@@ -3,6 +3,7 @@
 legacy_test.py: Tests for legacy.py
 """
 
+import random
 import unittest
 
 from core import legacy  # module under test
@@ -26,6 +27,9 @@ def _RunSplitCases(test, sp, cases):
     test.assertEqual(expected_parts, parts,
         '%r: %s != %s' % (s, expected_parts, parts))
 
+    # The native splitter must agree with the Python one.
+    test.assertEqual(sp._SplitSlow(s, allow_escape), spans)
+
 
 class SplitTest(unittest.TestCase):
 
@@ -156,5 +160,20 @@ class SplitTest(unittest.TestCase):
     _RunSplitCases(self, sp, CASES)
 
 
+  def testNativeMatchesPython(self):
+    if not legacy.fastsplit:
+      return  # nothing to compare against
+
+    r = random.Random(42)
+    alphabet = 'ab _:\\\t\n'
+    for ws, other in [(' \t\n', ''), (' ', ':'), ('', ':_'), (' \n', '\\')]:
+      sp = legacy.IfsSplitter(ws, other)
+      for _ in xrange(500):
+        s = ''.join(r.choice(alphabet) for _ in xrange(r.randint(0, 12)))
+        for allow_escape in (True, False):
+          self.assertEqual(sp._SplitSlow(s, allow_escape),
+                           sp.Split(s, allow_escape), repr(s))
+
+
 if __name__ == '__main__':
   unittest.main()
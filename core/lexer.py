@@ -9,9 +9,11 @@
 lexer.py - Library for lexing.
 """
 
+import array
 import re
 
 from asdl import const
+from core import id_kind
 from core import util
 from core.id_kind import Id
 from osh import ast_ as ast
@@ -38,11 +40,33 @@ def CompileAll(pat_list):
   return result
 
 
+_EMPTY_BATCH = array.array('i')
+_ID_INSTANCE_LIST = id_kind.ID_INSTANCE_LIST
+_NO_FIXED_VALUES = [None] * len(_ID_INSTANCE_LIST)
+
+# Returned at the end of every line, and never stored in the LST, so it's
+# shared.
+_EOL_TOKEN = ast.token(Id.Eol_Tok, '', const.NO_INTEGER)
+
+
 class LineLexer(object):
-  def __init__(self, match_func, line, arena):
+  def __init__(self, match_func, line, arena, batch_func=None,
+               fixed_values=None):
+    """
+    Args:
+      match_func: (lex_mode, line, start_pos) -> (id, end_pos)
+      line: the initial line
+      arena: for line spans
+      batch_func: optional (lex_mode, line, start_pos) -> array of (id,
+        start_pos, end_pos) triples.  Lexes many tokens with one call.
+      fixed_values: optional list of Id enum_value -> the text of every token
+        with that Id, or None.  See osh/lex.py.
+    """
     # Compile all regexes
     self.match_func = match_func
+    self.batch_func = batch_func
     self.arena = arena
+    self.fixed_values = fixed_values or _NO_FIXED_VALUES
 
     self.arena_skip = False  # For MaybeUnreadOne
     self.last_span_id = const.NO_INTEGER  # For MaybeUnreadOne
@@ -55,6 +79,11 @@ class LineLexer(object):
     self.line_pos = 0
     self.line_id = line_id
 
+    # Tokens lexed ahead by batch_func, valid only for this line and mode.
+    self.batch = _EMPTY_BATCH
+    self.batch_mode = None
+    self.batch_index = 0
+
   def MaybeUnreadOne(self):
     """Return True if we can unread one character, or False otherwise.
 
@@ -70,8 +99,7 @@ class LineLexer(object):
   def GetSpanIdForEof(self):
     assert self.arena, self.arena  # This is mandatory now?
     # zero length is special!
-    line_span = ast.line_span(self.line_id, self.line_pos, 0)
-    return self.arena.AddLineSpan(line_span)
+    return self.arena.AddSpan(self.line_id, self.line_pos, 0)
 
   def LookAhead(self, lex_mode):
     """Look ahead for a non-space token, using the given lexer mode.
@@ -106,20 +134,43 @@ class LineLexer(object):
 
   def Read(self, lex_mode):
     #assert self.line_pos <= len(self.line), (self.line, self.line_pos)
-    tok_type, end_pos = self.match_func(lex_mode, self.line, self.line_pos)
+    if self.batch_func:
+      # Consume a token lexed ahead by batch_func.  The batch is only valid
+      # if the parser asks for the same lex_mode at the position it was lexed
+      # at; otherwise lex a new batch.  Lexing is deterministic, so this gives
+      # the same tokens as match_func.  (Inlined because it's hot.)
+      b = self.batch
+      i = self.batch_index
+      if (lex_mode is not self.batch_mode or i >= len(b) or
+          b[i+1] != self.line_pos):
+        b = self.batch_func(lex_mode, self.line, self.line_pos)
+        self.batch = b
+        self.batch_mode = lex_mode
+        i = 0
+      self.batch_index = i + 3
+      id_num = b[i]
+      tok_type = _ID_INSTANCE_LIST[id_num]
+      end_pos = b[i+2]
+    else:
+      tok_type, end_pos = self.match_func(lex_mode, self.line, self.line_pos)
+      id_num = tok_type.enum_value
     #assert end_pos <= len(self.line)
     if tok_type == Id.Eol_Tok:  # Do NOT add a span for this sentinel!
-      return ast.token(tok_type, '', const.NO_INTEGER)
-
-    tok_val = self.line[self.line_pos:end_pos]
+      return _EOL_TOKEN
 
     # NOTE: tok_val is redundant, but even in osh.asdl we have some separation
     # between data needed for formatting and data needed for execution.  Could
     # revisit this later.
+    #
+    # Operators and keywords always have the same text, so they share a
+    # string.  Other values are interned, so that the many copies of words
+    # like 'echo' and '$1' in the LST share one string.
+    tok_val = self.fixed_values[id_num]
+    if tok_val is None:
+      tok_val = intern(self.line[self.line_pos:end_pos])
 
     # TODO: Add this back once arena is threaded everywhere
     #assert self.line_id != -1
-    line_span = ast.line_span(self.line_id, self.line_pos, len(tok_val))
 
     # NOTE: We're putting the arena hook in LineLexer and not Lexer because we
     # want it to be "low level".  The only thing fabricated here is a newline
@@ -130,7 +181,8 @@ class LineLexer(object):
       span_id = self.last_span_id
       self.arena_skip = False
     else:
-      span_id = self.arena.AddLineSpan(line_span)
+      span_id = self.arena.AddSpan(self.line_id, self.line_pos,
+                                   end_pos - self.line_pos)
       self.last_span_id = span_id
 
     #log('LineLexer.Read() span ID %d for %s', span_id, tok_type)
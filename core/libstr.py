@@ -13,10 +13,6 @@ Or maybe:
 var y = x -> sub( g/a*/, 'b', :ALL)
 """
 
-import re
-
-import libc
-
 from core.id_kind import Id
 from core import glob_
 from core import util
@@ -24,23 +20,9 @@ from core import util
 log = util.log
 e_die = util.e_die
 
-# Implementation without Python regex:
-#
-# (1) PatSub: I think we fill in GlobToExtendedRegex, then use regcomp and
-# regexec.  in a loop.  fnmatch() does NOT given positions of matches.
-#
-# (2) Strip -- % %% # ## - 
-#
-# a. Fast path for constant strings.
-# b. Convert to POSIX extended regex, to see if it matches at ALL.  If it
-# doesn't match, short circuit out?  We can't do this with fnmatch.
-# c. If it does match, call fnmatch() iteratively over prefixes / suffixes.
-#
-# - # shortest prefix - [:1], [:2], [:3] until it matches
-# - ## longest prefix - [:-1] [:-2], [:3].  Works because fnmatch does not
-#                       match prefixes, it matches EXATLY.
-# - % shortest suffix - [-1:] [-2:] [-3:] ...
-# - %% longest suffix - [1:] [2:] [3:]
+# Both PatSub and the strip operators -- % %% # ## -- use a GlobMatcher from
+# glob_.CompileGlob(), which is cached by pattern.  fnmatch() doesn't give the
+# positions of matches, so calling it on every prefix or suffix is O(n^2).
 #
 # See remove_pattern() in subst.c for bash, and trimsub() in eval.c for
 # mksh.  Dash doesn't implement it.
@@ -54,107 +36,43 @@ e_die = util.e_die
 
 def DoUnarySuffixOp(s, op, arg):
   """Helper for ${x#prefix} and family."""
+  m = glob_.CompileGlob(arg)
 
-  # Fast path for constant strings.
-  if not glob_.LooksLikeGlob(arg):
-    if op.op_id in (Id.VOp1_Pound, Id.VOp1_DPound):  # const prefix
-      if s.startswith(arg):
-        return s[len(arg):]
-      else:
-        return s
-
-    elif op.op_id in (Id.VOp1_Percent, Id.VOp1_DPercent):  # const suffix
-      if s.endswith(arg):
-        # Mutate it so we preserve the flags.
-        return s[:-len(arg)]
-      else:
-        return s
-
-    else:  # e.g. ^ ^^ , ,,
-      raise AssertionError(op.op_id)
-
-  # For patterns, do fnmatch() in a loop.
-  #
-  # TODO: Check another fast path first?
-  #
-  # v=aabbccdd
-  # echo ${v#*b}  # strip shortest prefix
-  #
-  # If the whole thing doesn't match '*b*', then no test can succeed.  So we
-  # can fail early.  Conversely echo ${v%%c*} and '*c*'.
-
-  n = len(s)
   if op.op_id == Id.VOp1_Pound:  # shortest prefix
-    # 'abcd': match 'a', 'ab', 'abc', ...
-    for i in xrange(1, n+1):
-      #log('Matching pattern %r with %r', arg, s[:i])
-      if libc.fnmatch(arg, s[:i]):
-        return s[i:]
-    else:
-      return s
+    i = m.ShortestPrefix(s)
+    return s if i == -1 else s[i:]
 
   elif op.op_id == Id.VOp1_DPound:  # longest prefix
-    # 'abcd': match 'abc', 'ab', 'a'
-    for i in xrange(n, 0, -1):
-      #log('Matching pattern %r with %r', arg, s[:i])
-      if libc.fnmatch(arg, s[:i]):
-        return s[i:]
-    else:
-      return s
+    i = m.LongestPrefix(s)
+    return s if i == -1 else s[i:]
 
   elif op.op_id == Id.VOp1_Percent:  # shortest suffix
-    # 'abcd': match 'abc', 'ab', 'a'
-    for i in xrange(n-1, -1, -1):
-      #log('Matching pattern %r with %r', arg, s[:i])
-      if libc.fnmatch(arg, s[i:]):
-        return s[:i]
-    else:
-      return s
-    
+    i = m.ShortestSuffix(s)
+    return s if i == -1 else s[:i]
+
   elif op.op_id == Id.VOp1_DPercent:  # longest suffix
-    # 'abcd': match 'abc', 'bc', 'c', ...
-    for i in xrange(0, n):
-      #log('Matching pattern %r with %r', arg, s[:i])
-      if libc.fnmatch(arg, s[i:]):
-        return s[:i]
-    else:
-      return s
+    i = m.LongestSuffix(s)
+    return s if i == -1 else s[:i]
+
+  else:  # e.g. ^ ^^ , ,,
+    raise AssertionError(op.op_id)
 
 
 def PatSub(s, op, pat, replace_str):
   """Helper for ${x/pat/replace}."""
   #log('PAT %r REPLACE %r', pat, replace_str)
-  py_regex, err = glob_.GlobToPythonRegex(pat)
-  if err:
+  m = glob_.CompileGlob(pat)
+  if m.err:
     e_die("Can't convert glob to regex: %r", pat)
 
-  if py_regex is None:  # Simple/fast path for fixed strings
-    if op.do_all:
-      return s.replace(pat, replace_str)
-    elif op.do_prefix:
-      if s.startswith(pat):
-        n = len(pat)
-        return replace_str + s[n:]
-      else:
-        return s
-    elif op.do_suffix:
-      if s.endswith(pat):
-        n = len(pat)
-        return s[:-n] + replace_str
-      else:
-        return s
-    else:
-      return s.replace(pat, replace_str, 1)  # just the first one
+  if op.do_prefix:
+    i = m.LongestPrefix(s)
+    return s if i == -1 else replace_str + s[i:]
 
-  else:
-    count = 1  # replace first occurrence only
-    if op.do_all:
-      count = 0  # replace all
-    elif op.do_prefix:
-      py_regex = '^' + py_regex
-    elif op.do_suffix:
-      py_regex = py_regex + '$'
-
-    pat_re = re.compile(py_regex)
-    return pat_re.sub(replace_str, s, count)
+  elif op.do_suffix:
+    i = m.LongestSuffix(s)
+    return s if i == -1 else s[:i] + replace_str
 
+  else:
+    count = 0 if op.do_all else 1  # 0 means replace all
+    return m.Sub(replace_str, s, count)
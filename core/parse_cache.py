@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+"""
+parse_cache.py - Cache the LST of scripts and sourced files on disk.
+
+Like .pyc files, but in one directory.  Each entry is keyed by the absolute
+path of the file, its mtime, and a hash of its contents.  It holds the spans
+of the file in the arena, and its LST encoded in the OHeap format.
+
+The lines aren't stored, because the file on disk has the same contents.
+
+The entry is mmapped and decoded lazily, so a function body in a sourced file
+is only decoded if the function is called.
+"""
+
+import array
+import cStringIO
+import hashlib
+import marshal
+import os
+import stat
+
+from asdl import decode
+from asdl import encode
+from core import id_kind
+from core import util
+from osh import ast_ as ast
+
+# Bump when the parser produces a different LST for the same source, e.g.
+# when brace detection changes.  Changes to the schema in osh.asdl are
+# detected by hashing it.
+_PARSER_VERSION = 3
+
+_version = None  # Computed on first use by _Version()
+
+
+def _Version():
+  """Identifies the encoding of the LST and the parser that produced it."""
+  global _version
+  if _version is None:
+    f = util.GetResourceLoader().open('osh/osh.asdl')
+    try:
+      schema_digest = hashlib.sha1(f.read()).hexdigest()
+    finally:
+      f.close()
+    _version = (_PARSER_VERSION, schema_digest)
+  return _version
+
+
+def _IntArray(s):
+  a = array.array('i')
+  a.fromstring(s)
+  return a
+
+
+class CacheKey(object):
+  """Identifies a version of a file.  Returned by ParseCache.MakeKey()."""
+
+  def __init__(self, path, st, digest, contents):
+    self.path = path  # absolute
+    self.st = st
+    self.digest = digest
+    self.contents = contents
+
+  def Header(self):
+    return (_Version(), self.path, self.st.st_mtime, self.st.st_size,
+            self.digest)
+
+
+class ParseCache(object):
+  """A directory of parsed files."""
+
+  def __init__(self, cache_dir):
+    self.cache_dir = cache_dir
+    self.decoder = None  # Created on first use; compiling it takes time.
+
+  def MakeKey(self, f, path):
+    """Read a file to compute its key.
+
+    Args:
+      f: file object opened from path, which is left at the beginning
+      path: path of the file
+
+    Returns:
+      A CacheKey, or None if it's not a regular file.
+    """
+    st = os.fstat(f.fileno())
+    if not stat.S_ISREG(st.st_mode):
+      return None
+    f.seek(0)
+    contents = f.read()
+    f.seek(0)
+    digest = hashlib.sha1(contents).hexdigest()
+    return CacheKey(os.path.abspath(path), st, digest, contents)
+
+  def _EntryPath(self, key):
+    name = hashlib.sha1(key.path).hexdigest()
+    return os.path.join(self.cache_dir, name + '.oshc')
+
+  def Load(self, key, arena):
+    """Add the lines and spans of a cached file to the arena.
+
+    Returns:
+      The LST, or None if the file isn't in the cache.
+    """
+    try:
+      f = open(self._EntryPath(key), 'rb')
+    except IOError:
+      return None
+    with f:
+      try:
+        if marshal.load(f) != key.Header():
+          return None
+        num_lines, span_base, line_ids, cols, lengths = marshal.load(f)
+      except (EOFError, ValueError, TypeError):
+        return None  # Corrupt entry
+      heap_offset = f.tell()
+      try:
+        # Entries are replaced with rename(), so the mapping stays valid.
+        buf = decode.MapFile(f)
+      except (ValueError, EnvironmentError):
+        return None
+
+    lines = cStringIO.StringIO(key.contents).readlines()
+    if len(lines) != num_lines:
+      return None
+
+    line_base = arena.next_line_id
+    if arena.lazy_lines:
+      file_id = arena.AddLazyFile(key.path, key.st)
+      offset = 0
+      for i, line in enumerate(lines):
+        arena.AddLazyLine(file_id, offset, i + 1)
+        offset += len(line)
+    else:
+      for i, line in enumerate(lines):
+        arena.AddLine(line, i + 1)
+
+    first_span_id = arena.AddSpanColumns(
+        _IntArray(line_ids), _IntArray(cols), _IntArray(lengths),
+        line_delta=line_base)
+
+    if self.decoder is None:
+      self.decoder = decode.Decoder(ast, {id_kind.Id: id_kind.IdInstance},
+                                    lazy=True)
+    return self.decoder.DecodeRoot(
+        buf, ast.command.ASDL_TYPE, span_delta=first_span_id - span_base,
+        offset=heap_offset)
+
+  def Save(self, key, arena, mark, node):
+    """Write the LST of a file that was parsed into the arena after Mark().
+
+    Errors are ignored, because the cache is only an optimization.
+    """
+    line_base, span_base = mark[:2]
+    num_lines = arena.next_line_id - line_base
+    line_ids, cols, lengths = arena.GetSpanColumns(span_base,
+                                                   line_delta=-line_base)
+    out = cStringIO.StringIO()
+    try:
+      encode.EncodeRoot(node, encode.Params(), encode.BinOutput(out))
+    except encode.EncodeError:
+      return  # e.g. negative numbers in {-1..1}
+
+    entry_path = self._EntryPath(key)
+    tmp_path = '%s.%d' % (entry_path, os.getpid())
+    try:
+      if not os.path.isdir(self.cache_dir):
+        os.makedirs(self.cache_dir)
+      with open(tmp_path, 'wb') as f:
+        marshal.dump(key.Header(), f)
+        marshal.dump((num_lines, span_base, line_ids.tostring(),
+                      cols.tostring(), lengths.tostring()), f)
+        f.write(out.getvalue())
+      os.rename(tmp_path, entry_path)  # Atomic for concurrent readers
+    except (IOError, OSError):
+      try:
+        os.remove(tmp_path)
+      except OSError:
+        pass
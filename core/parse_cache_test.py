@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+parse_cache_test.py: Tests for parse_cache.py
+"""
+
+import os
+import shutil
+import unittest
+
+from core import alloc
+from core import reader
+from core import parse_cache  # module under test
+from osh import parse_lib
+
+
+def _Parse(path, arena):
+  with open(path) as f:
+    line_reader = reader.FileLineReader(f, arena, path=path)
+    _, c_parser = parse_lib.MakeParser(line_reader, arena)
+    return c_parser.ParseWholeFile()
+
+
+def _FirstToken(node):
+  """The token of the argument to the first echo command."""
+  return node.children[0].words[1].parts[0].token
+
+
+class ParseCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.cache_dir = '_tmp/parse_cache_test'
+    self._ClearCache()
+
+    self.path = '_tmp/parse_cache_test.sh'
+    with open(self.path, 'w') as f:
+      f.write('echo one\nf() {\n  echo two\n}\n')
+
+  def _ClearCache(self):
+    if os.path.isdir(self.cache_dir):
+      shutil.rmtree(self.cache_dir)
+
+  def _MakeKey(self, cache):
+    with open(self.path) as f:
+      return cache.MakeKey(f, self.path)
+
+  def testSaveAndLoad(self):
+    for compact in (False, True):
+      self._ClearCache()
+      cache = parse_cache.ParseCache(self.cache_dir)
+      pool = alloc.Pool(compact=compact, lazy_lines=True)
+      arena = pool.NewArena()
+      arena.PushSource(self.path)
+
+      key = self._MakeKey(cache)
+      self.assertEqual(None, cache.Load(key, arena))  # miss
+
+      mark = arena.Mark()
+      node = _Parse(self.path, arena)
+      cache.Save(key, arena, mark, node)
+
+      # Load it after the first copy, so span IDs have to be relocated.
+      node2 = cache.Load(self._MakeKey(cache), arena)
+      self.assertEqual(len(node.children), len(node2.children))
+      self.assertEqual('f', node2.children[1].name)
+
+      tok = _FirstToken(node2)
+      self.assertEqual('one', tok.val)
+      self.assertNotEqual(_FirstToken(node).span_id, tok.span_id)
+      span = arena.GetLineSpan(tok.span_id)
+      line = arena.GetLine(span.line_id)
+      self.assertEqual('echo one\n', line)
+      self.assertEqual('one', line[span.col : span.col + span.length])
+      self.assertEqual((self.path, 1), arena.GetDebugInfo(span.line_id))
+
+  def testInvalidation(self):
+    cache = parse_cache.ParseCache(self.cache_dir)
+    arena = alloc.Pool(lazy_lines=True).NewArena()
+    arena.PushSource(self.path)
+
+    key = self._MakeKey(cache)
+    mark = arena.Mark()
+    cache.Save(key, arena, mark, _Parse(self.path, arena))
+
+    # Same size, different contents
+    with open(self.path, 'w') as f:
+      f.write('echo ONE\nf() {\n  echo two\n}\n')
+    self.assertEqual(None, cache.Load(self._MakeKey(cache), arena))
+
+  def testVersion(self):
+    cache = parse_cache.ParseCache(self.cache_dir)
+    arena = alloc.Pool(lazy_lines=True).NewArena()
+    arena.PushSource(self.path)
+
+    mark = arena.Mark()
+    cache.Save(self._MakeKey(cache), arena, mark, _Parse(self.path, arena))
+    self.assertNotEqual(None, cache.Load(self._MakeKey(cache), arena))
+
+    # An entry written by another parser or schema isn't used.
+    parser_version, schema_digest = parse_cache._Version()
+    try:
+      parse_cache._version = (parser_version, 'other schema')
+      self.assertEqual(None, cache.Load(self._MakeKey(cache), arena))
+    finally:
+      parse_cache._version = None
+    self.assertEqual(schema_digest, parse_cache._Version()[1])
+
+
+if __name__ == '__main__':
+  unittest.main()
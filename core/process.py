@@ -11,19 +11,170 @@ process.py - Runtime library for launching processes and manipulating file
 descriptors.
 """
 
+import atexit
 import errno
 import fcntl
 import os
+import signal
 import sys
 
 from core import runtime
 from core import util
 from core.id_kind import Id, REDIR_DEFAULT_FD
 
+try:
+  import libc  # for spawn
+except ImportError:
+  from benchmarks import fake_libc as libc
+
 redirect_e = runtime.redirect_e
 e_die = util.e_die
 log = util.log
 
+# Set this to compare against always starting external programs with fork().
+_ALWAYS_FORK = bool(os.getenv('OSH_ALWAYS_FORK'))
+
+_OUTPUT_BUFFER_SIZE = 8192
+
+
+class OutputBuffer(object):
+  """A file-like object that buffers writes to a descriptor.
+
+  It replaces sys.stdout, so the output of builtins like echo is buffered the
+  same way whether Python's stdout is unbuffered (python -u or
+  PYTHONUNBUFFERED), line buffered, or fully buffered.
+
+  We're responsible for calling flush() before the descriptor changes or
+  another process writes to it: in FdState.Push() and Pop(), before fork() and
+  exec(), and before blocking in Waiter.Wait().
+
+  Because the output is written after the command that produced it returns,
+  flush() doesn't raise.  It records the error, and the executor makes the
+  command that's running fail.  See TakeStdoutError().
+  """
+  def __init__(self, fd):
+    self.fd = fd
+    self.chunks = []
+    self.num_bytes = 0
+    # Like stdio, flush every line when writing to a terminal.
+    self.line_buffered = os.isatty(fd)
+    self.errno = 0  # of the first failed write since TakeError()
+
+  def write(self, s):
+    self.chunks.append(s)
+    self.num_bytes += len(s)
+    if (self.num_bytes >= _OUTPUT_BUFFER_SIZE or
+        self.line_buffered and '\n' in s):
+      self.flush()
+
+  def flush(self):
+    if not self.chunks:
+      return
+    s = ''.join(self.chunks)
+    del self.chunks[:]
+    self.num_bytes = 0
+
+    try:
+      while s:
+        n = os.write(self.fd, s)
+        s = s[n:]
+    except OSError as e:  # e.g. EPIPE or ENOSPC.  The output is dropped.
+      if not self.errno:
+        self.errno = e.errno
+    # The descriptor may have been redirected since the last flush.
+    self.line_buffered = os.isatty(self.fd)
+
+  def TakeError(self):
+    """Return the errno of a failed write, or 0, and clear it."""
+    err = self.errno
+    self.errno = 0
+    return err
+
+  def fileno(self):
+    return self.fd
+
+  def isatty(self):
+    return os.isatty(self.fd)
+
+
+class _StderrWriter(object):
+  """Wraps sys.stderr, and flushes buffered stdout before each write.
+
+  That keeps output in order when stdout and stderr are the same file, e.g.
+  osh foo.sh >log.txt 2>&1.
+  """
+  def __init__(self, f, stdout):
+    self.f = f
+    self.stdout = stdout
+
+  def write(self, s):
+    self.stdout.flush()  # Records an error rather than raising it
+    try:
+      self.f.write(s)
+    except IOError:
+      pass  # There's nowhere to report it.
+
+  def flush(self):
+    self.f.flush()
+
+  def fileno(self):
+    return self.f.fileno()
+
+  def isatty(self):
+    return self.f.isatty()
+
+
+def InitOutputBuffer():
+  """Replace sys.stdout with an OutputBuffer for descriptor 1.
+
+  Called once by the shell's main().
+  """
+  sys.stdout.flush()
+  stdout = OutputBuffer(1)
+  sys.stdout = stdout
+  sys.stderr = _StderrWriter(sys.stderr, stdout)
+  atexit.register(_FlushAtExit, stdout)  # also runs in forked children
+  return stdout
+
+
+def _FlushAtExit(stdout):
+  """For exits that don't call FlushBeforeExit(), e.g. the exit builtin."""
+  stdout.flush()
+  err = stdout.TakeError()
+  if err:
+    util.error('write error: %s', os.strerror(err))
+    sys.stderr.flush()
+    # Raising SystemExit here would finalize the interpreter twice.
+    os._exit(1)
+
+
+def CheckWriteError(status):
+  """Make a command fail if buffered stdout couldn't be written.
+
+  e.g. echo hi > /dev/full.  The output of builtins is written later, e.g.
+  when the redirect is undone, so the executor checks after every command.
+
+  Returns:
+    The new status.
+  """
+  take_error = getattr(sys.stdout, 'TakeError', None)  # None in unit tests
+  err = take_error() if take_error else 0
+  if err:
+    util.error('write error: %s', os.strerror(err))
+    if status == 0:
+      status = 1
+  return status
+
+
+def FlushBeforeExit(status):
+  """Flush stdout at the end of the shell or a subshell.
+
+  Returns:
+    The exit status, which is nonzero if the last output couldn't be written.
+  """
+  sys.stdout.flush()
+  return CheckWriteError(status)
+
 
 class _FdFrame:
   def __init__(self):
@@ -41,6 +192,34 @@ class _FdFrame:
     return '<_FdFrame %s %s>' % (self.saved, self.need_close)
 
 
+_CAPTURE_FD_MIN = 100
+
+
+def _OpenCaptureFile(depth):
+  """Return a descriptor for an anonymous temp file.
+
+  The tempfile module isn't used because it opens /dev/urandom and leaves it
+  open, which may take a descriptor that FdState saves to.
+  """
+  tmp_dir = os.getenv('TMPDIR') or '/tmp'
+  for i in xrange(100):
+    name = 'osh-capture-%d-%d-%d' % (os.getpid(), depth, i)
+    path = os.path.join(tmp_dir, name)
+    try:
+      fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0600)
+    except OSError as e:
+      if e.errno == errno.EEXIST:
+        continue
+      raise
+    os.unlink(path)
+    # Far from the descriptors that Push() saves to, and not inherited.
+    new_fd = fcntl.fcntl(fd, fcntl.F_DUPFD, _CAPTURE_FD_MIN)
+    fcntl.fcntl(new_fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+    os.close(fd)
+    return new_fd
+  raise OSError(errno.EEXIST, "Couldn't create a temp file in %s" % tmp_dir)
+
+
 class FdState:
   """This is for the current process, as opposed to child processes.
 
@@ -51,6 +230,11 @@ class FdState:
     self.cur_frame = _FdFrame()  # for the top level
     self.stack = [self.cur_frame]
 
+    # Temp files that stdout is redirected to by PushCapture(), one per level
+    # of nesting.  They're reused, so they're only created once.
+    self.capture_fds = []
+    self.capture_depth = 0
+
   def Open(self, path):
     """Opens a path for read, but moves it out of the reserved 3-9 fd range.
 
@@ -75,7 +259,9 @@ class FdState:
     need_restore = True
     try:
       #log('DUPFD %s %s', fd2, self.next_fd)
-      fcntl.fcntl(fd2, fcntl.F_DUPFD, self.next_fd)
+      # This is next_fd unless the process already has it open, e.g. Python
+      # keeps /dev/urandom open.
+      saved_fd = fcntl.fcntl(fd2, fcntl.F_DUPFD, self.next_fd)
     except IOError as e:
       # Example program that causes this error: exec 4>&1.  Descriptor 4 isn't
       # open.
@@ -87,7 +273,7 @@ class FdState:
         raise
     else:
       os.close(fd2)
-      fcntl.fcntl(self.next_fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+      fcntl.fcntl(saved_fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
 
     #log('==== dup %s %s\n' % (fd1, fd2))
     try:
@@ -96,13 +282,14 @@ class FdState:
       # bash/dash give this error too, e.g. for 'echo hi 1>&3'
       util.error('%d: %s', fd1, os.strerror(e.errno))
       # Restore and return error
-      os.dup2(self.next_fd, fd2)
-      os.close(self.next_fd)
+      if need_restore:
+        os.dup2(saved_fd, fd2)
+        os.close(saved_fd)
       # Undo it
       return False
 
     if need_restore:
-      self.cur_frame.saved.append((self.next_fd, fd2))
+      self.cur_frame.saved.append((saved_fd, fd2))
     self.next_fd += 1
     return True
 
@@ -198,6 +385,10 @@ class FdState:
 
   def Push(self, redirects, waiter):
     #log('> fd_state.Push %s', redirects)
+    # Builtins write to the sys.stdout buffer, and we don't flush it after
+    # each one.  Output before the redirect belongs to the old descriptor.
+    sys.stdout.flush()
+
     new_frame = _FdFrame()
     self.stack.append(new_frame)
     self.cur_frame = new_frame
@@ -210,10 +401,49 @@ class FdState:
     #log('done applying %d redirects', len(redirects))
     return True
 
+  def PushCapture(self, waiter):
+    """Redirect stdout to a temp file, for a command sub run in this process.
+
+    Returns:
+      Whether it succeeded.  Either way, PopCapture() must be called.
+    """
+    depth = self.capture_depth
+    if depth == len(self.capture_fds):
+      self.capture_fds.append(_OpenCaptureFile(depth))
+    self.capture_depth += 1
+
+    sys.stdout.flush()  # Earlier output isn't captured
+    r = runtime.DescRedirect(Id.Redir_GreatAnd, 1, self.capture_fds[depth])
+    return self.Push([r], waiter)
+
+  def PopCapture(self):
+    """Restore stdout.
+
+    Returns:
+      What was written to it since PushCapture().
+    """
+    sys.stdout.flush()
+    self.Pop()
+    self.capture_depth -= 1
+    fd = self.capture_fds[self.capture_depth]
+
+    os.lseek(fd, 0, os.SEEK_SET)
+    chunks = []
+    while True:
+      byte_str = os.read(fd, 4096)
+      if not byte_str:
+        break
+      chunks.append(byte_str)
+    os.ftruncate(fd, 0)
+    os.lseek(fd, 0, os.SEEK_SET)
+    return ''.join(chunks)
+
   def MakePermanent(self):
     self.cur_frame.Forget()
 
   def Pop(self):
+    sys.stdout.flush()  # Output so far belongs to the redirected descriptor
+
     frame = self.stack.pop()
     #log('< Pop %s', frame)
     for saved, orig in reversed(frame.saved):
@@ -246,6 +476,15 @@ class ChildStateChange:
   def Apply(self):
     raise NotImplementedError
 
+  def SpawnActions(self):
+    """Returns the change as a list of libc.spawn() file actions.
+
+    Returns:
+      A list of (fd, new_fd) pairs, or None if the change can't be expressed
+      that way, and the child must be started with fork().
+    """
+    return None
+
 
 class StdinFromPipe(ChildStateChange):
   def __init__(self, pipe_read_fd, w):
@@ -262,6 +501,9 @@ class StdinFromPipe(ChildStateChange):
     os.close(self.w)  # we're reading from the pipe, not writing
     #log('child CLOSE w %d pid=%d', self.w, os.getpid())
 
+  def SpawnActions(self):
+    return [(self.r, 0), (self.r, -1), (self.w, -1)]
+
 
 class StdoutToPipe(ChildStateChange):
   def __init__(self, r, pipe_write_fd):
@@ -278,6 +520,9 @@ class StdoutToPipe(ChildStateChange):
     os.close(self.r)  # we're writing to the pipe, not reading
     #log('child CLOSE r %d pid=%d', self.r, os.getpid())
 
+  def SpawnActions(self):
+    return [(self.w, 1), (self.w, -1), (self.r, -1)]
+
 
 class Thunk(object):
   """Abstract base class for things runnable in another process."""
@@ -287,11 +532,25 @@ class Thunk(object):
     raise NotImplementedError
 
 
-def ExecExternalProgram(argv, environ):
+def ExecExternalProgram(argv, environ, full_path=None):
   """
+  Args:
+    argv: command and arguments
+    environ: dict of exported variables
+    full_path: where the command was found by CommandHash, or None to search
+      $PATH
   """
   # TODO: If there is an error, like the file isn't executable, then we should
   # exit, and the parent will reap it.  Should it capture stderr?
+  sys.stdout.flush()  # exec() throws away buffered output
+  if full_path is not None:
+    try:
+      os.execve(full_path, argv, environ)
+    except OSError:
+      # e.g. the file was removed after it was hashed.  Search $PATH, which
+      # also reports the error.
+      pass
+
   try:
     os.execvpe(argv[0], argv, environ)
   except OSError as e:
@@ -304,15 +563,34 @@ def ExecExternalProgram(argv, environ):
 class ExternalThunk:
   """An external executable."""
 
-  def __init__(self, argv, environ):
+  def __init__(self, argv, environ, full_path=None):
     self.argv = argv
     self.environ = environ
+    self.full_path = full_path
 
   def Run(self):
     """
     An ExternalThunk is run in parent for the exec builtin.
     """
-    ExecExternalProgram(self.argv, self.environ)
+    ExecExternalProgram(self.argv, self.environ, full_path=self.full_path)
+
+  def Spawn(self, actions):
+    """Start the program without forking the shell.
+
+    Args:
+      actions: list of libc.spawn() file actions
+
+    Returns:
+      The PID, or -1 if it couldn't be started.  Then the caller should fork()
+      so the child reports the error.
+    """
+    if self.full_path is None:  # not found in $PATH
+      return -1
+    envp = ['%s=%s' % pair for pair in self.environ.iteritems()]
+    try:
+      return libc.spawn(self.full_path, self.argv, envp, actions)
+    except OSError:
+      return -1
 
 
 class SubProgramThunk:
@@ -328,7 +606,7 @@ class SubProgramThunk:
     if self.disable_errexit:
       self.ex.exec_opts.errexit.Disable()
     status = self.ex.Execute(self.node, fork_external=False)
-    sys.exit(status)  # Must exit!
+    sys.exit(FlushBeforeExit(status))  # Must exit!
 
 
 class _HereDocWriterThunk(Thunk):
@@ -414,8 +692,40 @@ class Process(Job):
       os.close(self.close_r)
       os.close(self.close_w)
 
+  def _Spawn(self):
+    """Start an external program with posix_spawn(), if possible.
+
+    This avoids copying the page tables of the shell, which is slow when the
+    heap is large.  It works when the thunk is an external program, and the
+    state changes are just dup2() and close().
+
+    Returns:
+      The PID, or -1 if the process must be started with fork().
+    """
+    if _ALWAYS_FORK or not hasattr(libc, 'spawn'):
+      return -1
+    if not isinstance(self.thunk, ExternalThunk):
+      return -1
+
+    actions = []
+    for st in self.state_changes:
+      a = st.SpawnActions()
+      if a is None:
+        return -1
+      actions.extend(a)
+    return self.thunk.Spawn(actions)
+
   def Start(self):
     """Start this process with fork(), haandling redirects."""
+    # Otherwise the child would write buffered output a second time, and the
+    # parent's output could come after the child's.
+    sys.stdout.flush()
+
+    pid = self._Spawn()
+    if pid != -1:
+      self.pid = pid
+      return pid
+
     pid = os.fork()
     if pid < 0:
       # When does this happen?
@@ -435,12 +745,11 @@ class Process(Job):
     return pid
 
   def WaitUntilDone(self, waiter):
-    while True:
+    # It may have been reaped already, e.g. by Waiter.Reap().
+    while self.state != ProcessState.Done:
       #log('WAITING')
       if not waiter.Wait():
         break
-      if self.state == ProcessState.Done:
-        break
     return self.status
 
   def WhenDone(self, pid, status):
@@ -485,6 +794,10 @@ class Pipeline(Job):
     self.pipe_status = []  # status in order
     self.status = -1  # for 'wait' jobs
 
+    # For shopt -s lastpipe
+    self.last_thunk = None
+    self.last_pipe = None
+
   def __repr__(self):
     return '<Pipeline %s>' % ' '.join(repr(p) for p in self.procs)
 
@@ -509,6 +822,19 @@ class Pipeline(Job):
 
     self.procs.append(p)
 
+  def AddLast(self, thunk):
+    """Append the last part of the pipeline, which is run in this process.
+
+    This is for shopt -s lastpipe.  It must be called after Add().
+
+    Args:
+      thunk: (Executor, node) pair
+    """
+    r, w = os.pipe()
+    self.procs[-1].AddStateChange(StdoutToPipe(r, w))
+    self.last_pipe = (r, w)
+    self.last_thunk = thunk
+
   def Start(self, waiter):
     for i, proc in enumerate(self.procs):
       pid = proc.Start()
@@ -522,20 +848,46 @@ class Pipeline(Job):
     return self.pids[-1]  # the last PID is the job ID
 
   def WaitUntilDone(self, waiter):
-    while True:
+    while self.state != ProcessState.Done:
       #log('WAIT pipeline')
       if not waiter.Wait():
         break
-      if self.state == ProcessState.Done:
-        #log('Pipeline DONE')
-        break
 
     return self.pipe_status
 
-  def Run(self, waiter):
-    """Run this pipeline synchronously."""
+  def Run(self, waiter, fd_state=None):
+    """Run this pipeline synchronously.
+
+    Args:
+      waiter: Waiter
+      fd_state: FdState, to redirect stdin for the last part if AddLast() was
+        called
+    """
     self.Start(waiter)
-    return self.WaitUntilDone(waiter)
+    if self.last_thunk is None:
+      return self.WaitUntilDone(waiter)
+
+    self.pipe_status.append(-1)  # for the last part
+    r, w = self.last_pipe
+    fd_state.Push([runtime.DescRedirect(Id.Redir_LessAnd, 0, r)], waiter)
+    # Close both ends so we get EOF when the previous process exits.
+    os.close(r)
+    os.close(w)
+
+    ex, node = self.last_thunk
+    try:
+      self.pipe_status[-1] = ex._Execute(node)
+    finally:
+      fd_state.Pop()
+      # Wait for the other processes, even if the last part raised an
+      # exception, e.g. 'return' in a function.
+      while any(st == -1 for st in self.pipe_status[:-1]):
+        if not waiter.Wait():
+          break
+
+    self.status = self.pipe_status[-1]
+    self.state = ProcessState.Done
+    return self.pipe_status
 
   def WhenDone(self, pid, status):
     #log('Pipeline WhenDone %d %d', pid, status)
@@ -546,7 +898,7 @@ class Pipeline(Job):
       self.status = self.pipe_status[-1]  # last one
       self.state = ProcessState.Done
       if self.job_state:
-        self.job_state.WhenDone(self.pipe_status[-1])
+        self.job_state.WhenDone(self.pids[-1])  # the job ID
 
 
 class JobState:
@@ -557,10 +909,38 @@ class JobState:
     # A pipeline that is backgrounded is always run in a SubProgramThunk?  So
     # you can wait for it once?
     self.jobs = {}
+    self.done = []  # job IDs that finished, and haven't been reported
+    self.not_waited = []  # job IDs that finished, for wait -n
+    self.num_running = 0
+    self.limit = 0  # for parallel-limit.  0 means no limit.
 
   def Register(self, pid, job):
     """ Used by 'sleep 1 &' """
     self.jobs[pid] = job
+    self.num_running += 1
+
+  def AtLimit(self):
+    """Whether starting another job has to wait, because of parallel-limit."""
+    return self.limit != 0 and self.num_running >= self.limit
+
+  def PopNotWaited(self, pid=None):
+    """Remove a job that finished from the list for wait -n.
+
+    Args:
+      pid: the job to remove, or None for the one that finished first
+
+    Returns:
+      The job ID, or -1 if there isn't one.
+    """
+    if pid is None:
+      if not self.not_waited:
+        return -1
+      return self.not_waited.pop(0)
+    try:
+      self.not_waited.remove(pid)
+    except ValueError:
+      return -1
+    return pid
 
   def List(self):
     """Used by the 'jobs' builtin."""
@@ -590,8 +970,24 @@ class JobState:
 
   def WhenDone(self, pid):
     """Process and Pipeline can call this."""
-    log('JobState WhenDone %d', pid)
-    # TODO: Update the list
+    self.done.append(pid)
+    self.not_waited.append(pid)
+    self.num_running -= 1
+
+  def ReportDone(self):
+    """Print the jobs that finished since the last call.
+
+    The interactive loop calls this before each prompt.
+    """
+    for pid in self.done:
+      job = self.jobs[pid]
+      status = job.status
+      if status == 0:
+        msg = 'Done'
+      else:
+        msg = 'Exit %d' % status
+      print('[%d] %s' % (pid, msg), file=sys.stderr)
+    del self.done[:]
 
 
 class Waiter:
@@ -623,10 +1019,63 @@ class Waiter:
     self.callbacks = {}  # pid -> callback
     self.last_status = 127  # wait -n error code
 
+    self.sigchld_installed = False
+    self.sigchld_pending = False
+
   def Register(self, pid, callback):
     self.callbacks[pid] = callback
 
+  def InstallSigChld(self):
+    """Note SIGCHLD, so that Reap() only calls waitpid() when necessary.
+
+    This is done when the first background job is started.
+    """
+    if self.sigchld_installed:
+      return
+    signal.signal(signal.SIGCHLD, self._OnSigChld)
+    # Restart system calls like read() rather than failing with EINTR.
+    signal.siginterrupt(signal.SIGCHLD, False)
+    self.sigchld_installed = True
+    self.sigchld_pending = True  # a child may have exited already
+
+  def _OnSigChld(self, unused_signum, unused_frame):
+    # Only set a flag.  It's not safe to run callbacks here, because the
+    # handler may run in the middle of Wait() or Register().
+    self.sigchld_pending = True
+
+  def Reap(self):
+    """Reap every child process that has exited, without blocking.
+
+    It's called at points where job state is consistent, e.g. before starting
+    a background job, so that thousands of jobs don't leave zombies.
+
+    Returns:
+      The number of processes reaped.
+    """
+    if not self.sigchld_pending:
+      return 0
+    # Clear it first, so a SIGCHLD that arrives while draining isn't lost.
+    self.sigchld_pending = False
+
+    n = 0
+    while True:
+      try:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+      except OSError as e:
+        if e.errno == errno.ECHILD:
+          break
+        raise
+      if pid == 0:  # children exist, but none have exited
+        break
+      self._Dispatch(pid, status)
+      n += 1
+    return n
+
   def Wait(self):
+    # Flush before blocking, so our output comes before that of background
+    # jobs.  e.g. { sleep 1; echo b; } & echo a; wait
+    sys.stdout.flush()
+
     # This is a list of async jobs
     try:
       pid, status = os.wait()
@@ -639,7 +1088,11 @@ class Waiter:
         raise
 
     #log('WAIT got %s %s', pid, status)
+    self._Dispatch(pid, status)
+    return True  # caller should keep waiting
 
+  def _Dispatch(self, pid, status):
+    """Call the callback for a process that exited."""
     # TODO: change status in more cases.
     if os.WIFSIGNALED(status):
       pass
@@ -654,10 +1107,8 @@ class Waiter:
     # processes, so print a warning.
     if pid not in self.callbacks:
       util.warn("PID %d stopped, but osh didn't start it", pid)
-      return True  # caller should keep waiting
+      return
 
     callback = self.callbacks.pop(pid)
     callback(pid, status)
     self.last_status = status  # for wait -n
-
-    return True  # caller should keep waiting
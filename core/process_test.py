@@ -3,6 +3,7 @@
 process_test.py: Tests for process.py
 """
 
+import errno
 import os
 import sys
 import unittest
@@ -34,6 +35,38 @@ def _ExtProc(argv):
   return Process(ExternalThunk(argv, {}))
 
 
+class OutputBufferTest(unittest.TestCase):
+
+  def testBuffering(self):
+    r, w = os.pipe()
+    buf = process.OutputBuffer(w)
+    buf.write('one\n')
+    buf.write('two\n')
+    self.assertEqual(8, buf.num_bytes)  # not written yet
+    buf.flush()
+    self.assertEqual('one\ntwo\n', os.read(r, 100))
+
+    # It's written when the buffer is full.
+    buf.write('x' * 10000)
+    self.assertEqual(0, buf.num_bytes)
+    self.assertEqual(10000, len(os.read(r, 20000)))
+
+    os.close(r)
+    os.close(w)
+
+  def testWriteError(self):
+    r, w = os.pipe()
+    os.close(r)
+    buf = process.OutputBuffer(w)
+    buf.write('one\n')
+    buf.flush()  # Doesn't raise
+    buf.write('two\n')
+    buf.flush()
+    self.assertEqual(errno.EPIPE, buf.TakeError())  # First error wins
+    self.assertEqual(0, buf.TakeError())
+    os.close(w)
+
+
 class ProcessTest(unittest.TestCase):
 
   def testStdinRedirect(self):
@@ -95,6 +128,69 @@ class ProcessTest(unittest.TestCase):
 
     print('AFTER', os.listdir('/dev/fd'))
 
+  def testSpawn(self):
+    p = Process(ExternalThunk(['true'], {}, full_path='/bin/true'))
+    pid = p._Spawn()
+    self.assertNotEqual(-1, pid)
+    _, status = os.waitpid(pid, 0)
+    self.assertEqual(0, status)
+
+    # Not hashed, so fork() reports the error
+    p = _ExtProc(['does-not-exist'])
+    self.assertEqual(-1, p._Spawn())
+
+    p = process.Pipeline()
+    p.Add(Process(ExternalThunk(
+        ['sh', '-c', 'echo hi'], {}, full_path='/bin/sh')))
+    p.Add(Process(ExternalThunk(
+        ['sh', '-c', 'read x && test "$x" = hi && exit 3'], {},
+        full_path='/bin/sh')))
+    self.assertEqual([0, 3], p.Run(_WAITER))
+
+  def testReap(self):
+    waiter = process.Waiter()
+    waiter.InstallSigChld()
+    job_state = process.JobState()
+
+    procs = []
+    for i in xrange(20):
+      p = Process(ExternalThunk(['true'], {}, full_path='/bin/true'),
+                  job_state=job_state)
+      pid = p.Start()
+      job_state.Register(pid, p)
+      waiter.Register(pid, p.WhenDone)
+      procs.append(p)
+
+    # Reap() doesn't block, so call it until they've all exited.
+    n = 0
+    while n < 20:
+      n += waiter.Reap()
+    self.assertEqual(0, waiter.Reap())
+    self.assertEqual(True, job_state.AllDone())
+    self.assertEqual(20, len(job_state.done))
+    # Already reaped, so this doesn't block.
+    self.assertEqual(0, procs[0].WaitUntilDone(waiter))
+
+  def testJobState(self):
+    job_state = process.JobState()
+    job_state.limit = 2
+    for pid in (101, 102):
+      job_state.Register(pid, _ExtProc(['true']))
+    self.assertEqual(True, job_state.AtLimit())
+
+    job_state.WhenDone(102)
+    self.assertEqual(False, job_state.AtLimit())
+    job_state.Register(103, _ExtProc(['true']))
+    job_state.WhenDone(101)
+    job_state.WhenDone(103)
+
+    # wait -n gets them in the order they finished
+    self.assertEqual(103, job_state.PopNotWaited(pid=103))
+    self.assertEqual(102, job_state.PopNotWaited())
+    self.assertEqual(101, job_state.PopNotWaited())
+    self.assertEqual(-1, job_state.PopNotWaited())
+    self.assertEqual(0, job_state.num_running)
+
   def testPipeline2(self):
     Banner('ls | cut -d . -f 1 | head')
     p = process.Pipeline()
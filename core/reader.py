@@ -10,6 +10,8 @@ reader.py - Read lines of input.
 """
 
 import cStringIO
+import os
+import stat
 
 from core import util
 
@@ -64,14 +66,39 @@ class InteractiveLineReader(_Reader):
 class FileLineReader(_Reader):
   """For -c and stdin?"""
 
-  def __init__(self, f, arena):
+  def __init__(self, f, arena, path=None):
     """
     Args:
-      lines: List of (line_id, line) pairs
+      f: file object to read lines from
+      arena: where lines are added
+      path: The path f was opened from.  If it's a regular file and the arena
+        has lazy_lines set, the arena re-reads lines from disk instead of
+        keeping them.
     """
     _Reader.__init__(self, arena)
     self.f = f
 
+    self.file_id = -1
+    self.offset = 0  # byte offset of the next line, for the arena
+    if path is not None and arena and arena.lazy_lines:
+      st = os.fstat(f.fileno())
+      if stat.S_ISREG(st.st_mode):
+        self.file_id = arena.AddLazyFile(os.path.abspath(path), st)
+        self.offset = f.tell()
+
+  def GetLine(self):
+    if self.file_id == -1:
+      return _Reader.GetLine(self)
+
+    line = self.f.readline()
+    if not line:
+      return -1, None
+
+    line_id = self.arena.AddLazyLine(self.file_id, self.offset, self.line_num)
+    self.offset += len(line)
+    self.line_num += 1
+    return line_id, line
+
   def _GetLine(self):
     line = self.f.readline()
     if not line:
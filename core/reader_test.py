@@ -47,6 +47,33 @@ class ReaderTest(unittest.TestCase):
       self.assertEqual((1, 'two'), r.GetLine())
       self.assertEqual((-1, None), r.GetLine())
 
+  def testLazyLines(self):
+    path = '_tmp/reader_test_lazy.sh'
+    with open(path, 'w') as f:
+      f.write('echo one\necho two\nlast')
+
+    pool = alloc.Pool(lazy_lines=True)
+    arena = pool.NewArena()
+    arena.PushSource(path)
+    with open(path) as f:
+      r = reader.FileLineReader(f, arena, path=path)
+      self.assertEqual((0, 'echo one\n'), r.GetLine())
+      self.assertEqual((1, 'echo two\n'), r.GetLine())
+      self.assertEqual((2, 'last'), r.GetLine())
+      self.assertEqual((-1, None), r.GetLine())
+
+    # The arena doesn't keep the lines, but it can read them again.
+    self.assertEqual([None, None, None], arena.lines)
+    self.assertEqual('echo two\n', arena.GetLine(1))
+    self.assertEqual('last', arena.GetLine(2))
+    self.assertEqual((path, 2), arena.GetDebugInfo(1))
+
+    # Lines from strings are kept in memory.
+    r = reader.StringLineReader('echo three\n', arena)
+    self.assertEqual((3, 'echo three\n'), r.GetLine())
+    self.assertEqual('echo three\n', arena.lines[3])
+    self.assertEqual('echo three\n', arena.GetLine(3))
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -29,7 +29,7 @@ f = util.GetResourceLoader().open('core/runtime.asdl')
 root = sys.modules[__name__]
 module, type_lookup = _LoadSchema(f)
 
-if 0:
+if py_meta.DEBUG_TYPES:
   py_meta.MakeTypes(module, root, type_lookup)
 else:
   # Exported for the generated code to use
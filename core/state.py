@@ -143,6 +143,10 @@ class ExecOpts(object):
     # shopt -s / -u.  NOTE: bash uses $BASHOPTS rather than $SHELLOPTS for these.
     self.nullglob = False 
     self.failglob = False 
+    self.dotglob = False  # globs match names that start with .
+    self.globstar = False  # ** matches zero or more directories
+    self.nocaseglob = False
+    self.lastpipe = False  # run the last part of a pipeline in this process
 
     #
     # OSH-specific options that are not yet implemented.
@@ -223,7 +227,8 @@ class ExecOpts(object):
         new_val = runtime.Str(':'.join(names))
         self.mem.InternalSetGlobal('SHELLOPTS', new_val)
 
-  SHOPT_OPTIONS = ('nullglob', 'failglob')
+  SHOPT_OPTIONS = (
+      'nullglob', 'failglob', 'dotglob', 'globstar', 'nocaseglob', 'lastpipe')
 
   def SetShoptOption(self, opt_name, b):
     """ For shopt -s/-u. """
@@ -280,8 +285,9 @@ class _ArgFrame(object):
 
 
 class _StackFrame(object):
-  def __init__(self, readonly=False):
+  def __init__(self, depth, readonly=False):
     self.vars = {}  # string -> runtime.cell
+    self.depth = depth  # index in Mem.var_stack
     self.readonly = readonly
 
   def __repr__(self):
@@ -318,6 +324,78 @@ class DirStack(object):
     return reversed(self.stack)
 
 
+class CommandHash(object):
+  """Remembers where commands were found in $PATH, for the 'hash' builtin.
+
+  The table is cleared when PATH is assigned.  It's also cleared when the value
+  of PATH changes without an assignment, e.g. when a function with 'local PATH'
+  returns.
+  """
+
+  def __init__(self, mem):
+    self.mem = mem
+    self.path_str = None  # the PATH the table was filled for
+    self.path_generation = -1
+    self.table = {}  # name -> absolute path
+    self.hits = {}  # name -> number of times it was run
+
+  def _Sync(self):
+    val = self.mem.GetVar('PATH')
+    path_str = val.s if val.tag == value_e.Str else ''
+    if (path_str != self.path_str or
+        self.mem.path_generation != self.path_generation):
+      self.Clear()
+      self.path_str = path_str
+      self.path_generation = self.mem.path_generation
+
+  def _Search(self, name):
+    for path_dir in self.path_str.split(':'):
+      full_path = os.path.join(path_dir, name)
+      if os.path.isfile(full_path) and os.access(full_path, os.X_OK):
+        return full_path
+    return None
+
+  def Lookup(self, name, count_hit=False):
+    """Find an external command.
+
+    Args:
+      name: argv[0], which doesn't contain a slash
+      count_hit: whether it's about to be run, for the listing
+
+    Returns:
+      The path to execute, or None if it's not in $PATH.
+    """
+    self._Sync()
+    full_path = self.table.get(name)
+    if full_path is None:
+      full_path = self._Search(name)
+      if full_path is None:
+        return None
+      # Relative entries in $PATH depend on the current directory.
+      if os.path.isabs(full_path):
+        self.table[name] = full_path
+        self.hits[name] = 0
+    if count_hit and name in self.hits:
+      self.hits[name] += 1
+    return full_path
+
+  def Remember(self, name, full_path):
+    """For hash -p."""
+    self._Sync()
+    self.table[name] = full_path
+    self.hits[name] = 0
+
+  def Clear(self):
+    self.table.clear()
+    self.hits.clear()
+
+  def Items(self):
+    """Return a sorted list of (name, path, hits)."""
+    self._Sync()
+    return [(name, self.table[name], self.hits[name])
+            for name in sorted(self.table)]
+
+
 def _FormatStack(var_stack):
   """Temporary debugging.
 
@@ -345,8 +423,11 @@ class Mem(object):
   """
 
   def __init__(self, argv0, argv, environ, arena):
-    top = _StackFrame()
+    top = _StackFrame(0)
     self.var_stack = [top]
+    # For dynamic scope lookup in O(1) rather than O(stack depth).
+    # name -> list of frames where it's defined, from the bottom of the stack.
+    self.bindings = {}
     self.argv0 = argv0
     self.argv_stack = [_ArgFrame(argv)]
     # NOTE: could use deque and appendleft/popleft, but:
@@ -361,6 +442,18 @@ class Mem(object):
 
     self.last_status = 0  # Mutable public variable
     self.last_job_id = -1  # Uninitialized value mutable public variable
+    # Incremented when PATH is assigned, even to the same value, which clears
+    # the 'hash' table like bash.
+    self.path_generation = 0
+
+    # The environment for external commands: name -> string.  It's updated
+    # whenever an exported cell changes, rather than built on every command.
+    self.exported = {}
+
+    # While a command sub runs in this process, changes to variables are
+    # recorded here so they can be undone.  See PushUndoLog().
+    self.undo_log = None
+    self.undo_stack = []
 
     # Done ONCE on initialization
     self.root_pid = os.getpid()
@@ -431,24 +524,112 @@ class Mem(object):
     # bash uses this order: top of stack first.
     self.func_name_stack.append(func_name)
 
-    self.var_stack.append(_StackFrame())
+    self.var_stack.append(_StackFrame(len(self.var_stack)))
     self.argv_stack.append(_ArgFrame(argv))
 
   def PopCall(self):
     self.func_name_stack.pop()
 
-    self.var_stack.pop()
+    self._PopFrame()
     self.argv_stack.pop()
 
   def PushTemp(self):
     """For the temporary scope in 'FOO=bar BAR=baz echo'."""
     # We don't want the 'read' builtin to write to this frame!
-    self.var_stack.append(_StackFrame(readonly=True))
+    self.var_stack.append(_StackFrame(len(self.var_stack), readonly=True))
 
   def PopTemp(self):
-    self.var_stack.pop()
+    self._PopFrame()
     #util.log('**** PopTemp()')
 
+  def _PopFrame(self):
+    frame = self.var_stack.pop()
+    for name, cell in frame.vars.iteritems():
+      frames = self.bindings[name]
+      frames.pop()  # the top frame is always last
+      if not frames:
+        del self.bindings[name]
+      if cell.exported:  # may have shadowed a cell in a lower frame
+        self._UpdateExported(name)
+
+  def _Bind(self, frame, name, cell):
+    """Add a new variable to a frame."""
+    if self.undo_log is not None:
+      self.undo_log.append(('bind', name, frame))
+    frame.vars[name] = cell
+    frames = self.bindings.get(name)
+    if frames is None:
+      self.bindings[name] = [frame]
+      return
+    # Usually the frame is the top one, e.g. for 'local'.  But declare -g can
+    # add a global below it.
+    i = len(frames)
+    while i > 0 and frames[i - 1].depth > frame.depth:
+      i -= 1
+    frames.insert(i, frame)
+
+  def _Unbind(self, frame, name):
+    if self.undo_log is not None:
+      self.undo_log.append(('unbind', name, frame, frame.vars[name]))
+    del frame.vars[name]
+    frames = self.bindings[name]
+    frames.remove(frame)
+    if not frames:
+      del self.bindings[name]
+
+  def _LogCell(self, name, cell):
+    """Save the fields of a cell before it's changed."""
+    self.undo_log.append(('cell', name, cell, cell.val, cell.exported,
+                          cell.readonly))
+
+  def PushUndoLog(self):
+    """Start recording changes, to emulate a subshell without forking.
+
+    PopUndoLog() restores variables, $?, and the argv of the current frame.
+    The caller must balance any frames it pushes.
+    """
+    argv_frame = self.argv_stack[-1]
+    self.undo_stack.append(
+        (self.undo_log, self.last_status, argv_frame, argv_frame.argv,
+         argv_frame.num_shifted))
+    self.undo_log = []
+
+  def PopUndoLog(self):
+    """Undo the changes recorded since the matching PushUndoLog()."""
+    log, last_status, argv_frame, argv, num_shifted = self.undo_stack[-1]
+    changes = self.undo_log
+    self.undo_log = None  # don't record the undoing
+
+    names = set()
+    for entry in reversed(changes):
+      kind, name = entry[0], entry[1]
+      names.add(name)
+      if kind == 'cell':
+        _, _, cell, cell.val, cell.exported, cell.readonly = entry
+      elif kind == 'strs':
+        entry[2][:] = entry[3]
+      else:
+        frame = entry[2]
+        # Skip frames that were pushed after PushUndoLog() and popped.
+        if (frame.depth >= len(self.var_stack) or
+            self.var_stack[frame.depth] is not frame):
+          continue
+        if kind == 'bind':
+          self._Unbind(frame, name)
+        else:  # unbind
+          self._Bind(frame, name, entry[3])
+
+    for name in names:
+      self._UpdateExported(name)
+    if 'PATH' in names:
+      self.path_generation += 1
+
+    self.last_status = last_status
+    argv_frame.argv = argv
+    argv_frame.num_shifted = num_shifted
+    self.undo_stack.pop()
+    self.undo_log = log
+
   #
   # Argv
   #
@@ -508,7 +689,7 @@ class Mem(object):
   # Named Vars
   #
 
-  def _FindCellAndNamespace(self, name, lookup_mode, is_read=False):
+  def _FindCellAndFrame(self, name, lookup_mode, is_read=False):
     """Helper for getting and setting variable.
 
     Need a mode to skip Temp scopes.  For Setting.
@@ -520,19 +701,17 @@ class Mem(object):
     Returns:
       cell: The cell corresponding to looking up 'name' with the given mode, or
         None if it's not found.
-      namespace: The namespace it should be set to or deleted from.
+      frame: The frame it should be set in or deleted from.
     """
     if lookup_mode == scope_e.Dynamic:
-      found = False
-      for i in range(len(self.var_stack) - 1, -1, -1):
-        frame = self.var_stack[i]
-        if frame.readonly and not is_read:
-          continue
-        namespace = frame.vars
-        if name in namespace:
-          cell = namespace[name]
-          return cell, namespace
-      return None, self.var_stack[0].vars  # set in global namespace
+      frames = self.bindings.get(name)
+      if frames:
+        # The top one, unless it's a temp frame and we're setting.
+        for frame in reversed(frames):
+          if frame.readonly and not is_read:
+            continue
+          return frame.vars[name], frame
+      return None, self.var_stack[0]  # set in global namespace
 
     elif lookup_mode == scope_e.LocalOnly:
       frame = self.var_stack[-1]
@@ -541,17 +720,15 @@ class Mem(object):
         # The frame below a readonly one shouldn't be readonly.
         assert not frame.readonly, frame
         #assert not frame.readonly, self._Format(self.var_stack)
-      namespace = frame.vars
-      return namespace.get(name), namespace
+      return frame.vars.get(name), frame
 
     elif lookup_mode == scope_e.TempEnv:
       frame = self.var_stack[-1]
-      namespace = frame.vars
-      return namespace.get(name), namespace
+      return frame.vars.get(name), frame
 
     elif lookup_mode == scope_e.GlobalOnly:
-      namespace = self.var_stack[0].vars
-      return namespace.get(name), namespace
+      frame = self.var_stack[0]
+      return frame.vars.get(name), frame
 
     else: 
       raise AssertionError(lookup_mode)
@@ -582,6 +759,9 @@ class Mem(object):
     assert new_flags is not None
 
     if lval.tag == lvalue_e.LhsName:
+      if lval.name == 'PATH' and value is not None:
+        self.path_generation += 1
+
       #if lval.name == 'ldflags':
       # TODO: Turn this into a tracing feature.  Like osh --tracevar ldflags
       # --tracevar foo.  Has to respect environment variables too.
@@ -604,12 +784,14 @@ class Mem(object):
       # scope to put it in?
       # _FindCellOrScope
 
-      cell, namespace = self._FindCellAndNamespace(lval.name, lookup_mode)
+      cell, frame = self._FindCellAndFrame(lval.name, lookup_mode)
       if cell:
+        if value is not None and cell.readonly:
+          # TODO: error context
+          e_die("Can't assign to readonly value %r", lval.name)
+        if self.undo_log is not None:
+          self._LogCell(lval.name, cell)
         if value is not None:
-          if cell.readonly:
-            # TODO: error context
-            e_die("Can't assign to readonly value %r", lval.name)
           cell.val = value
         if var_flags_e.Exported in new_flags:
           cell.exported = True
@@ -621,7 +803,10 @@ class Mem(object):
         cell = runtime.cell(value,
                             var_flags_e.Exported in new_flags ,
                             var_flags_e.ReadOnly in new_flags )
-        namespace[lval.name] = cell
+        self._Bind(frame, lval.name, cell)
+
+      if cell.exported:
+        self._UpdateExported(lval.name)
 
       if (cell.val is not None and cell.val.tag == value_e.StrArray and
           cell.exported):
@@ -632,7 +817,7 @@ class Mem(object):
       if value.tag == value_e.StrArray:
         e_die("Can't assign array to array member")  # TODO: error context
 
-      cell, namespace = self._FindCellAndNamespace(lval.name, lookup_mode)
+      cell, frame = self._FindCellAndFrame(lval.name, lookup_mode)
       if cell:
         if cell.val.tag != value_e.StrArray:
           # s=x
@@ -643,6 +828,8 @@ class Mem(object):
           e_die("Can't assign to readonly value")
 
         strs = cell.val.strs
+        if self.undo_log is not None:
+          self.undo_log.append(('strs', lval.name, strs, list(strs)))
         try:
           strs[lval.index] = value.s
         except IndexError:
@@ -684,7 +871,7 @@ class Mem(object):
         # arrays can't be exported
         cell = runtime.cell(new_value, False,
                             var_flags_e.ReadOnly in new_flags)
-        namespace[lval.name] = cell
+        self._Bind(frame, lval.name, cell)
 
     else:
       raise AssertionError
@@ -701,7 +888,11 @@ class Mem(object):
     Use case: SHELLOPTS.
     """
     cell = self.var_stack[0].vars[name]
+    if self.undo_log is not None:
+      self._LogCell(name, cell)
     cell.val = new_val
+    if cell.exported:
+      self._UpdateExported(name)
 
   # NOTE: Have a default for convenience
   def GetVar(self, name, lookup_mode=scope_e.Dynamic):
@@ -724,7 +915,7 @@ class Mem(object):
     if name == 'SOURCE_NAME':
       return self.source_name
 
-    cell, _ = self._FindCellAndNamespace(name, lookup_mode, is_read=True)
+    cell, _ = self._FindCellAndFrame(name, lookup_mode, is_read=True)
 
     if cell:
       return cell.val
@@ -740,12 +931,14 @@ class Mem(object):
       found is false if the name is not there.
     """
     if lval.tag == lvalue_e.LhsName:  # unset x
-      cell, namespace = self._FindCellAndNamespace(lval.name, lookup_mode)
+      cell, frame = self._FindCellAndFrame(lval.name, lookup_mode)
       if cell:
         found = True
         if cell.readonly:
           return False, found
-        del namespace[lval.name]  # it must be here
+        self._Unbind(frame, lval.name)  # it must be here
+        if cell.exported:
+          self._UpdateExported(lval.name)
         return True, found # found
       else:
         return True, False
@@ -757,31 +950,38 @@ class Mem(object):
       raise AssertionError
 
   def ClearFlag(self, name, flag, lookup_mode):
-    cell, namespace = self._FindCellAndNamespace(name, lookup_mode)
+    cell, _ = self._FindCellAndFrame(name, lookup_mode)
     if cell:
       if flag == var_flags_e.Exported:
-        cell.exported = False
+        if cell.exported:
+          if self.undo_log is not None:
+            self._LogCell(name, cell)
+          cell.exported = False
+          self._UpdateExported(name)
       else:
         raise AssertionError
       return True
     else:
       return False
 
+  def _UpdateExported(self, name):
+    """Called after an exported cell for 'name' is changed or removed."""
+    # The highest exported string cell wins.  An unexported cell doesn't hide
+    # one lower on the stack.
+    for frame in reversed(self.bindings.get(name, ())):
+      cell = frame.vars[name]
+      if cell.exported and cell.val.tag == value_e.Str:
+        self.exported[name] = cell.val.s
+        return
+    self.exported.pop(name, None)
+
   def GetExported(self):
-    """Get all the variables that are marked exported."""
-    # TODO: This is run on every SimpleCommand.  Should we have a dirty flag?
-    # We have to notice these things:
-    # - If an exported variable is changed.
-    # - If the set of exported variables changes.  
-
-    exported = {}
-    # Search from globals up.  Names higher on the stack will overwrite names
-    # lower on the stack.
-    for scope in self.var_stack:
-      for name, cell in scope.vars.items():
-        if cell.exported and cell.val.tag == value_e.Str:
-          exported[name] = cell.val.s
-    return exported
+    """Get all the variables that are marked exported.
+
+    This is run on every SimpleCommand, so the dict is shared.  Don't modify
+    it.
+    """
+    return self.exported
 
 
 def SetLocalString(mem, name, s):
@@ -247,6 +247,108 @@ class MemTest(unittest.TestCase):
     e = mem.GetExported()
     self.assertEqual({'U': 'u'}, e)
 
+  def testGetExported(self):
+    mem = state.Mem('', [], {'E': 'e', 'F': 'f'}, None)
+    exported = {'E': 'e', 'F': 'f'}
+    self.assertEqual(exported, mem.GetExported())
+
+    def SetVar(name, s, flags=(), lookup_mode=scope_e.Dynamic):
+      mem.SetVar(runtime.LhsName(name), runtime.Str(s), flags, lookup_mode)
+
+    # F=temp myfunc, which has 'local F=local'
+    mem.PushTemp()
+    SetVar('F', 'temp', (var_flags_e.Exported,), scope_e.TempEnv)
+    self.assertEqual({'E': 'e', 'F': 'temp'}, mem.GetExported())
+    mem.PushCall('myfunc', [])
+    SetVar('F', 'local', (), scope_e.LocalOnly)  # not exported
+    self.assertEqual({'E': 'e', 'F': 'temp'}, mem.GetExported())
+    SetVar('E', 'e2')
+    self.assertEqual({'E': 'e2', 'F': 'temp'}, mem.GetExported())
+    mem.ClearFlag('F', var_flags_e.Exported, scope_e.Dynamic)  # the local
+    self.assertEqual({'E': 'e2', 'F': 'temp'}, mem.GetExported())
+    mem.PopCall()
+    mem.PopTemp()
+    self.assertEqual({'E': 'e2', 'F': 'f'}, mem.GetExported())
+
+    mem.ClearFlag('F', var_flags_e.Exported, scope_e.Dynamic)
+    self.assertEqual({'E': 'e2'}, mem.GetExported())
+    mem.Unset(runtime.LhsName('E'), scope_e.Dynamic)
+    self.assertEqual({}, mem.GetExported())
+
+    SetVar('G', 'g', (var_flags_e.Exported,))
+    self.assertEqual({'G': 'g'}, mem.GetExported())
+
+  def testDynamicScope(self):
+    mem = _InitMem()
+
+    def SetVar(name, s, lookup_mode=scope_e.Dynamic):
+      mem.SetVar(runtime.LhsName(name), runtime.Str(s), (), lookup_mode)
+
+    def Get(name):
+      val = mem.GetVar(name)
+      return val.s if val.tag == value_e.Str else None
+
+    SetVar('x', 'global')
+    for i in xrange(20):
+      mem.PushCall('f%d' % i, [])
+      if i == 5:
+        SetVar('x', 'local', scope_e.LocalOnly)
+    self.assertEqual('local', Get('x'))
+
+    # declare -g adds a global below the local.
+    SetVar('y', 'global', scope_e.GlobalOnly)
+    self.assertEqual('global', Get('y'))
+    SetVar('y', 'y2')  # found dynamically
+    self.assertEqual('y2', mem.var_stack[0].vars['y'].val.s)
+
+    # A temp frame is read, but not written.
+    mem.PushTemp()
+    SetVar('x', 'temp', scope_e.TempEnv)
+    self.assertEqual('temp', Get('x'))
+    SetVar('x', 'local2')
+    self.assertEqual('local2', mem.var_stack[6].vars['x'].val.s)
+    mem.PopTemp()
+    self.assertEqual('local2', Get('x'))
+
+    mem.Unset(runtime.LhsName('x'), scope_e.Dynamic)  # the local
+    self.assertEqual('global', Get('x'))
+
+    for i in xrange(20):
+      mem.PopCall()
+    self.assertEqual('global', Get('x'))
+    self.assertEqual('y2', Get('y'))
+    mem.Unset(runtime.LhsName('x'), scope_e.Dynamic)
+    self.assertEqual(None, Get('x'))
+    self.assertEqual(None, mem.bindings.get('x'))
+
+  def testUndoLog(self):
+    mem = _InitMem()
+    state.SetGlobalString(mem, 'x', 'x1')
+    state.SetGlobalArray(mem, 'a', ['1', '2'])
+    mem.SetVar(runtime.LhsName('e'), runtime.Str('e1'),
+               (var_flags_e.Exported,), scope_e.GlobalOnly)
+
+    mem.PushUndoLog()
+    state.SetGlobalString(mem, 'x', 'x2')
+    state.SetGlobalString(mem, 'new', 'n')
+    mem.SetVar(runtime.LhsIndexedName('a', 0), runtime.Str('A'), (),
+               scope_e.Dynamic)
+    mem.Unset(runtime.LhsName('e'), scope_e.Dynamic)
+    mem.SetVar(runtime.LhsName('x'), None, (var_flags_e.ReadOnly,),
+               scope_e.Dynamic)
+    mem.PushCall('f', [])
+    state.SetLocalString(mem, 'local', 'l')
+    mem.PopCall()
+    mem.last_status = 1
+    mem.PopUndoLog()
+
+    self.assertEqual('x1', mem.GetVar('x').s)
+    self.assertEqual(False, mem.var_stack[0].vars['x'].readonly)
+    self.assertEqual(value_e.Undef, mem.GetVar('new').tag)
+    self.assertEqual(['1', '2'], mem.GetVar('a').strs)
+    self.assertEqual({'e': 'e1'}, mem.GetExported())
+    self.assertEqual(0, mem.last_status)
+
   def testUnset(self):
     mem = _InitMem()
     # unset a
@@ -290,5 +392,35 @@ class MemTest(unittest.TestCase):
     self.assertEqual(['i', 'j', 'k'], mem.GetArgv())
 
 
+class CommandHashTest(unittest.TestCase):
+
+  def testLookup(self):
+    mem = _InitMem()
+    state.SetGlobalString(mem, 'PATH', '/nonexistent:/bin')
+    cmd_hash = state.CommandHash(mem)
+
+    self.assertEqual('/bin/sh', cmd_hash.Lookup('sh', count_hit=True))
+    self.assertEqual('/bin/sh', cmd_hash.Lookup('sh', count_hit=True))
+    self.assertEqual([('sh', '/bin/sh', 2)], cmd_hash.Items())
+    self.assertEqual(None, cmd_hash.Lookup('nonexistent-command'))
+
+    # Not rescanned while PATH is the same
+    cmd_hash.Remember('sh', '/other/sh')
+    self.assertEqual('/other/sh', cmd_hash.Lookup('sh'))
+
+    # Assigning PATH clears the table
+    state.SetGlobalString(mem, 'PATH', '/bin')
+    self.assertEqual([], cmd_hash.Items())
+    self.assertEqual('/bin/sh', cmd_hash.Lookup('sh'))
+
+    # Even to the same value
+    cmd_hash.Remember('sh', '/other/sh')
+    state.SetGlobalString(mem, 'PATH', '/bin')
+    self.assertEqual('/bin/sh', cmd_hash.Lookup('sh'))
+
+    cmd_hash.Clear()
+    self.assertEqual([], cmd_hash.Items())
+
+
 if __name__ == '__main__':
   unittest.main()
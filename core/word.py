@@ -158,6 +158,10 @@ def LeftMostSpanForPart(part):
   elif part.tag == word_part_e.BracedAltPart:
     return const.NO_INTEGER
 
+  elif part.tag in (
+      word_part_e.BracedIntRangePart, word_part_e.BracedCharRangePart):
+    return part.spids[0] if part.spids else const.NO_INTEGER
+
   else:
     raise AssertionError(part.__class__.__name__)
 
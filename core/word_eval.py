@@ -14,6 +14,7 @@ from core import runtime
 from core import state
 from core import word_compile
 from core import util
+from core import word
 from osh import ast_ as ast
 
 part_value_e = runtime.part_value_e
@@ -914,6 +915,40 @@ class _WordEvaluator:
     # TODO: Remove this stub
     return self._EvalWordSequence(words)
 
+  def EvalWordSequenceIter(self, words):
+    """Like EvalWordSequence, but streams the strings of static words.
+
+    Used in ForEach, so that 'for i in {1..1000000}' doesn't build a list of a
+    million strings.  Words with substitutions or globs are still evaluated
+    up front, in order, because the loop body could change variables or files.
+
+    Args:
+      words: list of CompoundWord or BracedWordTree, not yet brace expanded
+
+    Returns:
+      An iterator of strings.
+    """
+    chunks = []
+    for w in words:
+      if braces.IsStaticWord(w):
+        chunks.append((True, w))  # evaluated lazily
+      else:
+        expanded = braces.BraceExpandWords([w])
+        chunks.append((False, self._EvalWordSequence(expanded)))
+    return self._IterChunks(chunks)
+
+  def _IterChunks(self, chunks):
+    for is_static, chunk in chunks:
+      if is_static:
+        for w in braces.BraceExpandWords([chunk]):
+          ok, s, quoted = word.StaticEval(w)
+          assert ok, w
+          if s or quoted:  # unquoted empty words are elided, e.g. {a,}
+            yield s
+      else:
+        for s in chunk:
+          yield s
+
 
 class NormalWordEvaluator(_WordEvaluator):
 
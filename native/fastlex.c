@@ -65,6 +65,69 @@ fastlex_MatchToken(PyObject *self, PyObject *args) {
   return Py_BuildValue("(ii)", id, end_pos);
 }
 
+// Lex tokens in a single lex_mode until the end of the line, or until a token
+// whose ID is marked in stop_ids, which is a string of 0/1 bytes indexed by ID.
+// The parser usually changes lex_mode after such tokens, e.g. Left_DoubleQuote.
+//
+// Returns a string of packed native ints: (id, start_pos, end_pos) triples.
+// The caller wraps it in array.array('i').
+static PyObject *
+fastlex_MatchTokens(PyObject *self, PyObject *args) {
+  int lex_mode;
+  unsigned char* line;
+  int line_len;
+  int start_pos;
+  unsigned char* stop_ids;
+  int num_stop_ids;
+  if (!PyArg_ParseTuple(args, "is#is#",
+                        &lex_mode, &line, &line_len, &start_pos,
+                        &stop_ids, &num_stop_ids)) {
+    return NULL;
+  }
+
+  if (start_pos > line_len) {
+    PyErr_Format(PyExc_ValueError,
+                 "Invalid MatchTokens call (start_pos = %d, line_len =%d)",
+                 start_pos, line_len);
+    return NULL;
+  }
+
+  // Every token except Eol_Tok consumes at least one byte, so this is an upper
+  // bound on the number of tokens.
+  int max_tokens = line_len - start_pos + 1;
+  PyObject* result = PyString_FromStringAndSize(
+      NULL, max_tokens * 3 * sizeof(int));
+  if (result == NULL) {
+    return NULL;
+  }
+  int* out = (int*)PyString_AS_STRING(result);
+
+  int n = 0;
+  int pos = start_pos;
+  while (n < max_tokens) {
+    int id;
+    int end_pos;
+    MatchToken(lex_mode, line, line_len, pos, &id, &end_pos);
+    out[n*3] = id;
+    out[n*3 + 1] = pos;
+    out[n*3 + 2] = end_pos;
+    n++;
+
+    if (id == id__Eol_Tok || end_pos == pos) {
+      break;  // end of line, or an empty match we can't advance past
+    }
+    if (id < num_stop_ids && stop_ids[id]) {
+      break;
+    }
+    pos = end_pos;
+  }
+
+  if (_PyString_Resize(&result, n * 3 * sizeof(int)) < 0) {
+    return NULL;
+  }
+  return result;
+}
+
 // Rename to TokenMatcher?
 // LineLexer holds CharMatcher?  or TokenMatcher?
 // SlowTokenMatcher
@@ -73,6 +136,8 @@ fastlex_MatchToken(PyObject *self, PyObject *args) {
 static PyMethodDef methods[] = {
   {"MatchToken", fastlex_MatchToken, METH_VARARGS,
    "(lexer mode, line, start_pos) -> (id, end_pos)."},
+  {"MatchTokens", fastlex_MatchTokens, METH_VARARGS,
+   "(lexer mode, line, start_pos, stop_ids) -> packed (id, start, end) ints."},
   {NULL, NULL},
 };
 
@@ -9,6 +9,7 @@
 libc_test.py: Tests for libc.py
 """
 
+import array
 import unittest
 
 from core import id_kind
@@ -58,6 +59,30 @@ class LexTest(unittest.TestCase):
     print MatchToken(lex_mode_e.OUTER, 'line', 4)
     print MatchToken(lex_mode_e.OUTER, 'line', 5)
 
+  def testMatchTokens(self):
+    line = 'echo "hi" >out\n'
+    no_stop = '\0' * 256
+    buf = fastlex.MatchTokens(lex_mode_e.OUTER.enum_id, line, 0, no_stop)
+    a = array.array('i', buf)
+
+    # Same tokens as calling MatchToken repeatedly.
+    pos = 0
+    for i in xrange(0, len(a), 3):
+      tok_type, end_pos = MatchToken(lex_mode_e.OUTER, line, pos)
+      self.assertEqual(tok_type.enum_value, a[i])
+      self.assertEqual(pos, a[i+1])
+      self.assertEqual(end_pos, a[i+2])
+      pos = end_pos
+    self.assertEqual(Id.Eol_Tok.enum_value, a[-3])
+
+    # Stop after the opening double quote.
+    stop = bytearray(256)
+    stop[Id.Left_DoubleQuote.enum_value] = 1
+    buf = fastlex.MatchTokens(lex_mode_e.OUTER.enum_id, line, 0, str(stop))
+    a = array.array('i', buf)
+    self.assertEqual(Id.Left_DoubleQuote.enum_value, a[-3])
+    self.assertEqual(6, a[-1])
+
   def testBug(self):
     code_str = '-n'
     expected = Id.BoolUnary_n
@@ -0,0 +1,207 @@
+/*
+ * Fast IFS splitting.  This is a port of the state machine in
+ * core/legacy.py, IfsSplitter.Split(), and must return identical spans.
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+// Kinds of characters (edge labels).  Same values as legacy.py.
+enum { CH_DE_WHITE, CH_DE_GRAY, CH_BLACK, CH_BACKSLASH, NUM_CH };
+
+// States (node labels).
+enum {
+  ST_INVALID, ST_START, ST_DE_WHITE1, ST_DE_GRAY, ST_DE_WHITE2, ST_BLACK,
+  ST_BACKSLASH, NUM_ST
+};
+
+// Actions control what spans to emit.
+enum { EMIT_PART, EMIT_DE, EMIT_EMPTY, EMIT_ESCAPE, NO_EMIT };
+
+typedef struct {
+  unsigned char new_state;
+  unsigned char action;
+} Transition;
+
+// Indexed by [state][char kind].  See TRANSITIONS in legacy.py.
+static const Transition kTransitions[NUM_ST][NUM_CH] = {
+  // ST_INVALID
+  { {ST_INVALID, NO_EMIT}, {ST_INVALID, NO_EMIT},
+    {ST_INVALID, NO_EMIT}, {ST_INVALID, NO_EMIT} },
+  // ST_START
+  { {ST_INVALID, NO_EMIT}, {ST_DE_GRAY, EMIT_EMPTY},
+    {ST_BLACK, NO_EMIT}, {ST_BACKSLASH, NO_EMIT} },
+  // ST_DE_WHITE1
+  { {ST_DE_WHITE1, NO_EMIT}, {ST_DE_GRAY, NO_EMIT},
+    {ST_BLACK, EMIT_DE}, {ST_BACKSLASH, EMIT_DE} },
+  // ST_DE_GRAY
+  { {ST_DE_WHITE2, NO_EMIT}, {ST_DE_GRAY, EMIT_EMPTY},
+    {ST_BLACK, EMIT_DE}, {ST_BLACK, EMIT_DE} },
+  // ST_DE_WHITE2
+  { {ST_DE_WHITE2, NO_EMIT}, {ST_DE_GRAY, EMIT_EMPTY},
+    {ST_BLACK, EMIT_DE}, {ST_BACKSLASH, EMIT_DE} },
+  // ST_BLACK
+  { {ST_DE_WHITE1, EMIT_PART}, {ST_DE_GRAY, EMIT_PART},
+    {ST_BLACK, NO_EMIT}, {ST_BACKSLASH, EMIT_PART} },
+  // ST_BACKSLASH
+  { {ST_BLACK, EMIT_ESCAPE}, {ST_BLACK, EMIT_ESCAPE},
+    {ST_BLACK, EMIT_ESCAPE}, {ST_BLACK, EMIT_ESCAPE} },
+};
+
+// Append a (span_type, end_index) tuple to the list.  Returns -1 on error.
+static int append_span(PyObject* spans, PyObject* span_type, Py_ssize_t i) {
+  PyObject* index = PyInt_FromSsize_t(i);
+  if (index == NULL) {
+    return -1;
+  }
+  PyObject* span = PyTuple_Pack(2, span_type, index);
+  Py_DECREF(index);
+  if (span == NULL) {
+    return -1;
+  }
+  int result = PyList_Append(spans, span);
+  Py_DECREF(span);
+  return result;
+}
+
+static PyObject *
+fastsplit_IfsSplit(PyObject *self, PyObject *args) {
+  const unsigned char* s;
+  Py_ssize_t n;
+  const unsigned char* ws_chars;
+  Py_ssize_t ws_len;
+  const unsigned char* other_chars;
+  Py_ssize_t other_len;
+  int allow_escape;
+  PyObject* span_types;
+
+  if (!PyArg_ParseTuple(args, "s#s#s#iO!",
+                        &s, &n, &ws_chars, &ws_len, &other_chars, &other_len,
+                        &allow_escape, &PyTuple_Type, &span_types)) {
+    return NULL;
+  }
+  if (PyTuple_GET_SIZE(span_types) != 3) {
+    PyErr_SetString(PyExc_ValueError,
+                    "span_types should be (Black, Delim, Backslash)");
+    return NULL;
+  }
+  PyObject* black = PyTuple_GET_ITEM(span_types, 0);
+  PyObject* delim = PyTuple_GET_ITEM(span_types, 1);
+  PyObject* backslash = PyTuple_GET_ITEM(span_types, 2);
+
+  // Classify every byte up front.  Whitespace takes precedence over other
+  // IFS chars, which take precedence over backslash, like in legacy.py.
+  unsigned char kinds[256];
+  memset(kinds, CH_BLACK, sizeof(kinds));
+  if (allow_escape) {
+    kinds['\\'] = CH_BACKSLASH;
+  }
+  Py_ssize_t j;
+  for (j = 0; j < other_len; ++j) {
+    kinds[other_chars[j]] = CH_DE_GRAY;
+  }
+  for (j = 0; j < ws_len; ++j) {
+    kinds[ws_chars[j]] = CH_DE_WHITE;
+  }
+
+  PyObject* spans = PyList_New(0);
+  if (spans == NULL) {
+    return NULL;
+  }
+  if (n == 0) {
+    return spans;  // empty
+  }
+
+  // Ignore leading and trailing whitespace.
+  Py_ssize_t i = 0;
+  while (i < n && kinds[s[i]] == CH_DE_WHITE) {
+    i++;
+  }
+  if (i != 0) {
+    if (append_span(spans, delim, i) < 0) {
+      goto error;
+    }
+  }
+  if (i == n) {
+    return spans;
+  }
+  while (kinds[s[n-1]] == CH_DE_WHITE) {
+    n--;
+  }
+
+  int state = ST_START;
+  for (; i < n; ++i) {
+    int ch = kinds[s[i]];
+    Transition t = kTransitions[state][ch];
+    if (t.new_state == ST_INVALID) {
+      PyErr_Format(PyExc_AssertionError,
+                   "Invalid transition from %d with %d", state, ch);
+      goto error;
+    }
+
+    switch (t.action) {
+    case EMIT_PART:
+      if (append_span(spans, black, i) < 0) {
+        goto error;
+      }
+      break;
+    case EMIT_DE:
+      if (append_span(spans, delim, i) < 0) {
+        goto error;
+      }
+      break;
+    case EMIT_EMPTY:
+      if (append_span(spans, delim, i) < 0 ||
+          append_span(spans, black, i) < 0) {
+        goto error;
+      }
+      break;
+    case EMIT_ESCAPE:
+      if (append_span(spans, backslash, i) < 0) {
+        goto error;
+      }
+      break;
+    default:
+      break;  // Emit nothing
+    }
+    state = t.new_state;
+  }
+
+  // Last span.
+  PyObject* span_type;
+  switch (state) {
+  case ST_BLACK:
+    span_type = black;
+    break;
+  case ST_BACKSLASH:
+    span_type = backslash;
+    break;
+  case ST_DE_WHITE1:
+  case ST_DE_GRAY:
+  case ST_DE_WHITE2:
+    span_type = delim;
+    break;
+  default:
+    PyErr_Format(PyExc_AssertionError, "%d", state);
+    goto error;
+  }
+  if (append_span(spans, span_type, n) < 0) {
+    goto error;
+  }
+  return spans;
+
+error:
+  Py_DECREF(spans);
+  return NULL;
+}
+
+static PyMethodDef methods[] = {
+  {"IfsSplit", fastsplit_IfsSplit, METH_VARARGS,
+   "(s, ifs_whitespace, ifs_other, allow_escape, span_types) -> "
+   "list of (span_type, end_index)."},
+  {NULL, NULL},
+};
+
+void initfastsplit(void) {
+  Py_InitModule("fastsplit", methods);
+}
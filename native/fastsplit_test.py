@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+fastsplit_test.py: Tests for fastsplit.c
+"""
+
+import unittest
+
+from core import runtime
+
+import fastsplit  # module under test
+
+span_e = runtime.span_e
+
+SPAN_TYPES = (span_e.Black, span_e.Delim, span_e.Backslash)
+
+
+class FastSplitTest(unittest.TestCase):
+
+  def testIfsSplit(self):
+    def Split(s, ws=' \t\n', other='', allow_escape=True):
+      return fastsplit.IfsSplit(s, ws, other, allow_escape, SPAN_TYPES)
+
+    self.assertEqual([], Split(''))
+    self.assertEqual([(span_e.Delim, 2)], Split('  '))
+    self.assertEqual(
+        [(span_e.Delim, 1), (span_e.Black, 2), (span_e.Delim, 3),
+         (span_e.Black, 4)],
+        Split(' a b '))
+    self.assertEqual(
+        [(span_e.Black, 1), (span_e.Delim, 2), (span_e.Black, 2),
+         (span_e.Delim, 3), (span_e.Black, 4)],
+        Split('a::b', ws='', other=':'))
+
+    # Backslash escapes only when allowed
+    self.assertEqual(
+        [(span_e.Black, 1), (span_e.Backslash, 2), (span_e.Black, 4)],
+        Split('a\\ b'))
+    self.assertEqual(
+        [(span_e.Black, 2), (span_e.Delim, 3), (span_e.Black, 4)],
+        Split('a\\ b', allow_escape=False))
+
+    # NUL bytes are ordinary characters
+    self.assertEqual([(span_e.Black, 3)], Split('a\0b'))
+
+  def testBadArgs(self):
+    self.assertRaises(ValueError, fastsplit.IfsSplit, 'a', ' ', '', True, ())
+    self.assertRaises(TypeError, fastsplit.IfsSplit, 'a', ' ', '', True, [])
+
+
+if __name__ == '__main__':
+  unittest.main()
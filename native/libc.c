@@ -5,8 +5,11 @@
 #include <stdarg.h>  // va_list, etc.
 #include <stdio.h>  // printf
 
+#include <errno.h>
 #include <fnmatch.h>
 #include <glob.h>
+#include <spawn.h>
+#include <stdlib.h>  // malloc, free
 #ifdef __FreeBSD__
 #include <gnu/posix/regex.h>
 #else
@@ -269,6 +272,103 @@ func_regex_match(PyObject *self, PyObject *args) {
   }
 }
 
+// Convert a list of Python strings to a NULL-terminated array, for argv and
+// envp.  The strings are borrowed from the list.  Returns NULL and sets an
+// exception on error.
+static char** list_to_strs(PyObject* list) {
+  Py_ssize_t n = PyList_Size(list);
+  char** strs = malloc((n + 1) * sizeof(char*));
+  if (strs == NULL) {
+    PyErr_NoMemory();
+    return NULL;
+  }
+  Py_ssize_t i;
+  for (i = 0; i < n; ++i) {
+    strs[i] = PyString_AsString(PyList_GET_ITEM(list, i));
+    if (strs[i] == NULL) {
+      free(strs);
+      return NULL;
+    }
+  }
+  strs[n] = NULL;
+  return strs;
+}
+
+// spawn(path, argv, envp, actions) -> pid
+//
+// Start a program with posix_spawn(), which uses vfork() or clone(CLONE_VM)
+// rather than copying the page tables of the shell.
+//
+// actions is a list of (fd, new_fd) pairs, applied in order in the child:
+// dup2(fd, new_fd) if new_fd >= 0, otherwise close(fd).
+static PyObject *
+func_spawn(PyObject *self, PyObject *args) {
+  const char* path;
+  PyObject* argv_list;
+  PyObject* envp_list;
+  PyObject* actions_list;
+
+  if (!PyArg_ParseTuple(args, "sO!O!O!", &path, &PyList_Type, &argv_list,
+                        &PyList_Type, &envp_list, &PyList_Type,
+                        &actions_list)) {
+    return NULL;
+  }
+
+  posix_spawn_file_actions_t actions;
+  if (posix_spawn_file_actions_init(&actions) != 0) {
+    return PyErr_NoMemory();
+  }
+
+  char** argv = NULL;
+  char** envp = NULL;
+  PyObject* result = NULL;
+
+  Py_ssize_t n = PyList_Size(actions_list);
+  Py_ssize_t i;
+  for (i = 0; i < n; ++i) {
+    int fd, new_fd;
+    if (!PyArg_ParseTuple(PyList_GET_ITEM(actions_list, i), "ii", &fd,
+                          &new_fd)) {
+      goto done;
+    }
+    int ret;
+    if (new_fd >= 0) {
+      ret = posix_spawn_file_actions_adddup2(&actions, fd, new_fd);
+    } else {
+      ret = posix_spawn_file_actions_addclose(&actions, fd);
+    }
+    if (ret != 0) {
+      errno = ret;
+      PyErr_SetFromErrno(PyExc_OSError);
+      goto done;
+    }
+  }
+
+  argv = list_to_strs(argv_list);
+  if (argv == NULL) {
+    goto done;
+  }
+  envp = list_to_strs(envp_list);
+  if (envp == NULL) {
+    goto done;
+  }
+
+  pid_t pid;
+  int ret = posix_spawn(&pid, path, &actions, NULL, argv, envp);
+  if (ret != 0) {
+    errno = ret;
+    PyErr_SetFromErrnoWithFilename(PyExc_OSError, (char*)path);
+    goto done;
+  }
+  result = PyInt_FromLong(pid);
+
+done:
+  free(argv);
+  free(envp);
+  posix_spawn_file_actions_destroy(&actions);
+  return result;
+}
+
 static PyMethodDef methods[] = {
   {"fnmatch", func_fnmatch, METH_VARARGS,
    "Return whether a string matches a pattern."},
@@ -280,6 +380,8 @@ static PyMethodDef methods[] = {
    "Compile a regex in ERE syntax, returning whether it is valid"},
   {"regex_match", func_regex_match, METH_VARARGS,
    "Match regex against a string, returning a list of matches"},
+  {"spawn", func_spawn, METH_VARARGS,
+   "Start a program with posix_spawn(), returning its PID."},
   {NULL, NULL},
 };
 
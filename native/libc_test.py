@@ -9,6 +9,7 @@
 libc_test.py: Tests for libc.py
 """
 
+import os
 import unittest
 
 import libc  # module under test
@@ -89,6 +90,22 @@ class LibcTest(unittest.TestCase):
       actual = libc.regex_replace(pat, replace, s, do_all)
       self.assertEqual(expected, actual)
 
+  def testSpawn(self):
+    r, w = os.pipe()
+    argv = ['sh', '-c', 'echo "$FOO"; exit 3']
+    # Write stdout to the pipe, and close both ends in the child.
+    actions = [(w, 1), (w, -1), (r, -1)]
+    pid = libc.spawn('/bin/sh', argv, ['FOO=bar'], actions)
+    os.close(w)
+
+    out = os.read(r, 100)
+    os.close(r)
+    _, status = os.waitpid(pid, 0)
+    self.assertEqual('bar\n', out)
+    self.assertEqual(3, os.WEXITSTATUS(status))
+
+    self.assertRaises(OSError, libc.spawn, '/nonexistent', ['x'], [], [])
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -130,7 +130,7 @@ f = util.GetResourceLoader().open('osh/osh.asdl')
 asdl_module, type_lookup = LoadSchema(f)
 
 root = sys.modules[__name__]
-if 0:
+if py_meta.DEBUG_TYPES:
   py_meta.MakeTypes(asdl_module, root, type_lookup)
 else:
   # Exported for the generated code to use
@@ -102,7 +102,7 @@ Indexed array and Associative array literals:
 
 import re
 
-from core.id_kind import Id, Kind, ID_SPEC
+from core.id_kind import Id, Kind, ID_SPEC, ID_INSTANCE_LIST
 from core import util
 from core.lexer import C, R
 
@@ -521,3 +521,29 @@ LEXER_DEF[lex_mode_e.ARITH] = \
 # them with regcomp.  I've only seen constant regexes.
 #
 # From code: ( | ) are treated special.
+
+
+def _FixedTokenValues(lexer_def):
+  """For each Id, find the text that every token with that Id has, if any.
+
+  Returns:
+    A list indexed by Id enum_value.  The item is None if the Id is matched
+    by a regex, or by constant patterns with different text.
+  """
+  vals = {}  # Id -> text, or None
+  for pat_list in lexer_def.itervalues():
+    for is_regex, pat, id_ in pat_list:
+      if is_regex or vals.get(id_, pat) != pat:
+        vals[id_] = None
+      else:
+        vals[id_] = pat
+
+  result = [None] * len(ID_INSTANCE_LIST)
+  for id_, val in vals.iteritems():
+    result[id_.enum_value] = val
+  return result
+
+
+# LineLexer uses these constant strings instead of slicing the line, so tokens
+# for operators and keywords don't allocate a new string.
+FIXED_TOKEN_VALUES = _FixedTokenValues(LEXER_DEF)
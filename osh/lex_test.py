@@ -10,6 +10,7 @@ from core.id_kind import Id, Kind, LookupKind
 from core.lexer import CompileAll, Lexer, LineLexer
 from core import test_lib
 
+from osh import lex
 from osh import parse_lib
 from osh import ast_ as ast
 from osh.lex import LEXER_DEF
@@ -226,6 +227,49 @@ class LineLexerTest(unittest.TestCase):
     self.assertTokensEqual(
         ast.token(Id.Op_LParen, '('), l.LookAhead(lex_mode_e.OUTER))
 
+  def testReadBatched(self):
+    batch_func = parse_lib._MakeBatchMatcher()
+    if not batch_func:
+      return  # fastlex isn't built
+
+    line = 'echo "hi $x" ${y:-z} $(( 1 + 2 ))\n'
+    modes = [lex_mode_e.OUTER, lex_mode_e.DQ, lex_mode_e.VS_1, lex_mode_e.ARITH]
+
+    # Mix lex modes at arbitrary positions.  The batched lexer must give the
+    # same tokens as the lexer that matches one token at a time.
+    for i in xrange(len(modes)):
+      slow = LineLexer(parse_lib._MakeMatcher(), line, self.arena)
+      fast = LineLexer(parse_lib._MakeMatcher(), line, self.arena,
+                       batch_func=batch_func)
+      j = i
+      while True:
+        mode = modes[j % len(modes)] if j % 3 == 0 else lex_mode_e.OUTER
+        expected = slow.Read(mode)
+        self.assertTokensEqual(expected, fast.Read(mode))
+        if expected.id == Id.Eol_Tok:
+          break
+        j += 1
+
+  def testFixedValues(self):
+    line = 'if true; then echo "$x" && echo $x; fi\n'
+    slow = LineLexer(parse_lib._MakeMatcher(), line, self.arena)
+    fast = LineLexer(parse_lib._MakeMatcher(), line, self.arena,
+                     fixed_values=lex.FIXED_TOKEN_VALUES)
+    vals = []
+    while True:
+      expected = slow.Read(lex_mode_e.OUTER)
+      t = fast.Read(lex_mode_e.OUTER)
+      self.assertTokensEqual(expected, t)
+      if t.id == Id.Eol_Tok:
+        break
+      vals.append(t.val)
+
+    # Operators and keywords use the same string; other values are interned.
+    self.assertEqual(['if', ' ', 'true', ';', ' ', 'then'], vals[:6])
+    self.assertTrue(vals[0] is lex.FIXED_TOKEN_VALUES[Id.KW_If.enum_value])
+    first, second = [v for v in vals if v == 'echo']
+    self.assertTrue(first is second)
+
 
 OUTER_RE = CompileAll(LEXER_DEF[lex_mode_e.OUTER])
 DOUBLE_QUOTED_RE = CompileAll(LEXER_DEF[lex_mode_e.DQ])
@@ -2,6 +2,8 @@
 parse_lib.py - Consolidate various parser instantiations here.
 """
 
+import array
+import os
 import sys
 
 from core import lexer
@@ -55,8 +57,35 @@ def MatchToken_Fast(lex_mode, line, start_pos):
   return id_kind.IdInstance(tok_type), end_pos
 
 
+def _MakeStopIds():
+  """Returns a string of 0/1 bytes, indexed by Id.
+
+  A batch of tokens ends after a token with one of these IDs, because the
+  parser usually switches lex_mode there.
+  """
+  stop_kinds = (id_kind.Kind.Left, id_kind.Kind.Right, id_kind.Kind.Eof)
+  stop_ids = (Id.Op_LParen, Id.Op_RParen, Id.Op_DLeftParen, Id.Op_DRightParen,
+              Id.Lit_Pound)
+
+  b = bytearray(len(id_kind.ID_INSTANCE_LIST))
+  for i, id_ in enumerate(id_kind.ID_INSTANCE_LIST):
+    if id_ is None:
+      continue
+    if id_kind.LookupKind(id_) in stop_kinds or id_ in stop_ids:
+      b[i] = 1
+  return str(b)
+
+
+_STOP_IDS = _MakeStopIds()
+
+
+def MatchTokens_Fast(lex_mode, line, start_pos):
+  """Returns array of (id, start_pos, end_pos) triples, as integers."""
+  buf = fastlex.MatchTokens(lex_mode.enum_id, line, start_pos, _STOP_IDS)
+  return array.array('i', buf)
+
+
 def _MakeMatcher():
-  # NOTE: Could have an environment variable to control this for speed?
   #return MatchToken_Slow(lex.LEXER_DEF)
 
   if fastlex:
@@ -65,10 +94,27 @@ def _MakeMatcher():
     return MatchToken_Slow(lex.LEXER_DEF)
 
 
+def _MakeBatchMatcher():
+  """Returns a function to lex many tokens per call, or None.
+
+  Set OSH_NO_BATCH_LEX=1 to lex one token per call, e.g. to compare speed in
+  benchmarks/osh-parser.sh.
+  """
+  if fastlex and not os.getenv('OSH_NO_BATCH_LEX'):
+    return MatchTokens_Fast
+  else:
+    return None
+
+
+def _MakeLineLexer(arena):
+  return lexer.LineLexer(_MakeMatcher(), '', arena,
+                         batch_func=_MakeBatchMatcher(),
+                         fixed_values=lex.FIXED_TOKEN_VALUES)
+
+
 def InitLexer(s, arena):
   """For tests only."""
-  match_func = _MakeMatcher()
-  line_lexer = lexer.LineLexer(match_func, '', arena)
+  line_lexer = _MakeLineLexer(arena)
   line_reader = reader.StringLineReader(s, arena)
   lx = lexer.Lexer(line_lexer, line_reader)
   return line_reader, lx
@@ -93,7 +139,7 @@ def InitLexer(s, arena):
 
 def MakeParser(line_reader, arena):
   """Top level parser."""
-  line_lexer = lexer.LineLexer(_MakeMatcher(), '', arena)
+  line_lexer = _MakeLineLexer(arena)
   lx = lexer.Lexer(line_lexer, line_reader)
   w_parser = word_parse.WordParser(lx, line_reader)
   c_parser = cmd_parse.CommandParser(w_parser, lx, line_reader, arena)
@@ -112,7 +158,7 @@ def MakeParserForCompletion(code_str, arena):
   # NOTE: We don't need to use a arena here?  Or we need a "scratch arena" that
   # doesn't interfere with the rest of the program.
   line_reader = reader.StringLineReader(code_str, arena)
-  line_lexer = lexer.LineLexer(_MakeMatcher(), '', arena)  # AtEnd() is true
+  line_lexer = _MakeLineLexer(arena)  # AtEnd() is true
   lx = lexer.Lexer(line_lexer, line_reader)
   w_parser = word_parse.WordParser(lx, line_reader)
   c_parser = cmd_parse.CommandParser(w_parser, lx, line_reader, arena)
@@ -121,14 +167,14 @@ def MakeParserForCompletion(code_str, arena):
 
 def MakeWordParserForHereDoc(lines, arena):
   line_reader = reader.VirtualLineReader(lines, arena)
-  line_lexer = lexer.LineLexer(_MakeMatcher(), '', arena)
+  line_lexer = _MakeLineLexer(arena)
   lx = lexer.Lexer(line_lexer, line_reader)
   return word_parse.WordParser(lx, line_reader)
 
 
 def MakeWordParserForPlugin(code_str, arena):
   line_reader = reader.StringLineReader(code_str, arena)
-  line_lexer = lexer.LineLexer(_MakeMatcher(), '', arena)
+  line_lexer = _MakeLineLexer(arena)
   lx = lexer.Lexer(line_lexer, line_reader)
   return word_parse.WordParser(lx, line_reader)
 
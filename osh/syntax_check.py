@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""
+syntax_check.py - Parse many files in one process, for 'osh -n --batch'.
+
+Starting an interpreter per file dominates the time to parse thousands of
+small scripts, e.g. in test/wild.sh.  Files are parsed by a pool of worker
+processes, and a CSV row is written for each one:
+
+  status,elapsed_secs,num_spans,num_nodes,path
+
+status is 0 for success, 2 for a parse error, and 1 if the file couldn't be
+read, like 'osh -n'.  The columns match the times.csv files of
+benchmarks/osh-parser.sh, so benchmarks/report.R can join them on path.
+"""
+
+import cStringIO
+import csv
+import multiprocessing
+import sys
+import time
+import traceback
+
+from asdl import py_meta
+from core import alloc
+from core import reader
+from core import ui
+from core import util
+from osh import parse_lib
+
+CSV_HEADER = ('status', 'elapsed_secs', 'num_spans', 'num_nodes', 'path')
+
+
+def CountNodes(node):
+  """Return the number of ASDL objects in a tree, including tokens."""
+  n = 0
+  stack = [node]
+  while stack:
+    obj = stack.pop()
+    n += 1
+    for name in obj.ASDL_TYPE.GetFieldNames():
+      val = getattr(obj, name)
+      if isinstance(val, py_meta.CompoundObj):
+        stack.append(val)
+      elif isinstance(val, list):
+        stack.extend(v for v in val if isinstance(v, py_meta.CompoundObj))
+  return n
+
+
+def CheckFile(path):
+  """Parse a file.
+
+  Returns:
+    A tuple of (row, error message).  The message is empty on success.
+  """
+  # A new arena for each file, so its memory is freed afterward.
+  arena = alloc.Pool(compact=True).NewArena()
+  arena.PushSource(path)
+  err = cStringIO.StringIO()
+
+  start_time = time.time()
+  try:
+    f = open(path)
+  except IOError as e:
+    return (1, '0.0', 0, 0, path), '%s: %s\n' % (path, e.strerror)
+
+  with f:
+    line_reader = reader.FileLineReader(f, arena, path=path)
+    _, c_parser = parse_lib.MakeParser(line_reader, arena)
+    try:
+      node = c_parser.ParseWholeFile()
+    except util.ParseError as e:
+      ui.PrettyPrintError(e, arena, err)
+      err.write('parse error: %s\n' % e.UserErrorString())
+      node = None
+    except Exception:
+      # A bug in the parser shouldn't stop the other files from being checked.
+      return (1, '0.0', 0, 0, path), '%s: %s' % (path, traceback.format_exc())
+    else:
+      if not node:
+        ui.PrintErrorStack(c_parser.Error(), arena, err)
+  elapsed = time.time() - start_time
+
+  if node is None:
+    return (2, '%.4f' % elapsed, 0, 0, path), err.getvalue()
+  row = (0, '%.4f' % elapsed, arena.next_span_id, CountNodes(node), path)
+  return row, ''
+
+
+def ReadManifest(f):
+  """Return the paths in a file like benchmarks/osh-parser-files.txt."""
+  paths = []
+  for line in f:
+    line = line.strip()
+    if line and not line.startswith('#'):
+      paths.append(line)
+  return paths
+
+
+def CheckFiles(paths, out_f, err_f=sys.stderr, jobs=None):
+  """Parse files in parallel and write a CSV row for each one, in order.
+
+  Args:
+    paths: list of file paths
+    out_f: the CSV is written here
+    err_f: parse errors are written here
+    jobs: number of worker processes; defaults to the number of CPUs
+
+  Returns:
+    0 if all files parsed, or the status of the first one that didn't.
+  """
+  out = csv.writer(out_f)
+  out.writerow(CSV_HEADER)
+
+  jobs = jobs or multiprocessing.cpu_count()
+  if jobs == 1 or len(paths) <= 1:
+    pool = None
+    results = (CheckFile(p) for p in paths)
+  else:
+    pool = multiprocessing.Pool(jobs)
+    results = pool.imap(CheckFile, paths, chunksize=4)
+
+  status = 0
+  try:
+    for row, err in results:
+      out.writerow(row)
+      if err:
+        err_f.write(err)
+      if row[0] != 0 and status == 0:
+        status = row[0]
+  finally:
+    if pool:
+      pool.terminate()
+  return status
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+syntax_check_test.py: Tests for syntax_check.py
+"""
+
+import cStringIO
+import csv
+import unittest
+
+from osh import syntax_check  # module under test
+
+
+class SyntaxCheckTest(unittest.TestCase):
+
+  def setUp(self):
+    self.ok_path = '_tmp/syntax_check_ok.sh'
+    with open(self.ok_path, 'w') as f:
+      f.write('echo hi\n')
+    self.bad_path = '_tmp/syntax_check_bad.sh'
+    with open(self.bad_path, 'w') as f:
+      f.write('echo (\n')
+
+  def testCheckFile(self):
+    row, err = syntax_check.CheckFile(self.ok_path)
+    status, _, num_spans, num_nodes, path = row
+    self.assertEqual(0, status)
+    self.assertEqual('', err)
+    self.assertEqual(self.ok_path, path)
+    self.assertTrue(num_spans > 0)
+    # CommandList, SimpleCommand, 2 x (CompoundWord, LiteralPart, token)
+    self.assertEqual(8, num_nodes)
+
+    row, err = syntax_check.CheckFile(self.bad_path)
+    self.assertEqual(2, row[0])
+    self.assertTrue(self.bad_path in err, err)
+
+    row, err = syntax_check.CheckFile('_tmp/nonexistent.sh')
+    self.assertEqual(1, row[0])
+
+  def testReadManifest(self):
+    f = cStringIO.StringIO('# comment\na.sh\n\nb.sh\n')
+    self.assertEqual(['a.sh', 'b.sh'], syntax_check.ReadManifest(f))
+
+  def testCheckFiles(self):
+    paths = [self.ok_path, self.bad_path, self.ok_path]
+    for jobs in (1, 2):
+      out = cStringIO.StringIO()
+      err = cStringIO.StringIO()
+      status = syntax_check.CheckFiles(paths, out, err_f=err, jobs=jobs)
+      self.assertEqual(2, status)
+
+      rows = list(csv.reader(cStringIO.StringIO(out.getvalue())))
+      self.assertEqual(list(syntax_check.CSV_HEADER), rows[0])
+      self.assertEqual(paths, [r[-1] for r in rows[1:]])  # in order
+      self.assertEqual(['0', '2', '0'], [r[0] for r in rows[1:]])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -108,6 +108,36 @@ wait
 # stdout-json: "1\n2\n3\n"
 # status: 0
 
+### Many background jobs
+for i in $(seq 1000); do
+  /bin/true &
+done
+wait
+echo status=$?
+# stdout: status=0
+
+### parallel-limit makes & wait for a job to finish
+parallel-limit 1
+for i in 3 2 1; do
+  { sleep 0.0$i; echo $i; } &
+done
+wait
+# stdout-json: "3\n2\n1\n"
+# N-I dash/bash/mksh stdout-json: "1\n2\n3\n"
+
+### wait -n returns jobs in the order they finish
+# The gaps are large so the order survives a loaded machine.
+for i in 3 2 1; do
+  { sleep 0.$((2 * i - 1)); exit $i; } &
+done
+for i in 1 2 3 4; do
+  wait -n
+  echo status=$?
+done
+# stdout-json: "status=1\nstatus=2\nstatus=3\nstatus=127\n"
+# N-I dash stdout-json: "status=2\nstatus=2\nstatus=2\nstatus=2\n"
+# N-I mksh stdout-json: "status=1\nstatus=1\nstatus=1\nstatus=1\n"
+
 ### Background process doesn't affect parent
 echo ${foo=1}
 echo $foo
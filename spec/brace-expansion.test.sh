@@ -17,7 +17,6 @@ echo }_{a,b}
 ### partial leading expansion 2
 echo {x}_{a,b}
 # stdout: {x}_a {x}_b
-# OK osh stdout: {x}_{a,b}
 
 ### } in expansion
 # hm they treat this the SAME.  Leftmost { is matched by first }, and then
@@ -234,6 +233,14 @@ echo -{01..3}-
 # stdout: -01- -02- -03-
 # N-I mksh stdout: -{01..3}-
 
+### Number range that's too big is literal
+echo {1..99999999999999999999}
+for i in {1..3..99999999999999999999}; do echo $i; done
+## STDOUT:
+{1..99999999999999999999}
+{1..3..99999999999999999999}
+## END
+
 ### Side effect in expansion
 # bash is the only one that does it first.  I guess since this is
 # non-POSIX anyway, follow bash?
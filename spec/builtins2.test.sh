@@ -56,3 +56,22 @@ echo
 myfunc
 status=1
 ## END
+
+### hash -p and hash -r
+hash -p /bin/echo myecho
+myecho hi
+hash -r
+myecho hi 2>/dev/null || echo status=$?
+## STDOUT:
+hi
+status=127
+## END
+## N-I dash/mksh STDOUT:
+status=127
+## END
+
+### hash is cleared when PATH changes
+hash -p /bin/echo myecho
+PATH=$PATH
+myecho hi 2>/dev/null || echo status=$?
+## stdout: status=127
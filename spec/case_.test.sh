@@ -72,3 +72,73 @@ case "$x" in
 esac
 echo $result
 # stdout: - X
+
+### Character classes in patterns
+for x in a1 B- '*' 7; do
+  case "$x" in
+    [[:lower:]][0-9]) echo "$x lower-digit" ;;
+    [!a-z][[:punct:]]) echo "$x upper-punct" ;;
+    \*) echo "$x star" ;;
+    *) echo "$x other" ;;
+  esac
+done
+## STDOUT:
+a1 lower-digit
+B- upper-punct
+* star
+7 other
+## END
+
+### First match wins between literal and glob patterns
+f() {
+  case "$1" in
+    --verbose) echo "$1 first" ;;
+    --v*|-v) echo "$1 glob" ;;
+    --version|--verbose) echo "$1 literal" ;;
+    -v) echo "$1 never" ;;
+    *) echo "$1 default" ;;
+  esac
+}
+f --verbose; f --version; f -v; f --help
+## STDOUT:
+--verbose first
+--version glob
+-v glob
+--help default
+## END
+
+### Patterns are evaluated in order until one matches
+pat='b*'
+n=0
+for x in a bc d; do
+  case $x in
+    a) echo lit-a ;;
+    $((n+=1))) echo arith ;;
+    $pat) echo var-b ;;
+    d) echo lit-d ;;
+    $((n+=10))) echo never ;;
+  esac
+done
+echo n=$n
+## STDOUT:
+lit-a
+var-b
+lit-d
+n=2
+## END
+
+### Dynamic pattern before a literal in the same arm
+n=0
+for x in a a b; do
+  case $x in
+    $((n+=1))|a) echo A ;;
+    b) echo B ;;
+  esac
+done
+echo n=$n
+## STDOUT:
+A
+A
+B
+n=3
+## END
@@ -90,6 +90,11 @@ x
 33
 ## END
 
+### Command Sub that exits with ${undef?}
+y=$(echo ${undef?boom}) || echo failed
+echo after
+# stdout-json: "failed\nafter\n"
+
 ### Command Sub in local sets exit code
 # A command resets the exit code, but an assignment doesn't.
 f() {
@@ -10,6 +10,12 @@
 # note that the pattern arg to fnmatch should be '*.\*'
 # stdout: true
 
+### [[ glob matching with character classes
+[[ a1 == [[:alpha:]][[:digit:]] ]] && echo true
+[[ a1 != [![:alpha:]]* ]] && echo true
+[[ '[a' == [a ]] && echo true
+# stdout-json: "true\ntrue\ntrue\n"
+
 ### equality
 [[ '*.py' == '*.py' ]] && echo true
 [[ foo.py == '*.py' ]] || echo false
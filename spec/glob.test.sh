@@ -187,3 +187,63 @@ f 'void *'
 # stdout: void *
 # BUG dash stdout-json: ""
 # BUG dash status: 2
+
+### shopt -s dotglob
+mkdir -p _tmp/dotglob && cd _tmp/dotglob && touch .a b
+echo *
+shopt -s dotglob
+echo *
+## STDOUT:
+b
+.a b
+## END
+## N-I dash/mksh/ash STDOUT:
+b
+b
+## END
+
+### shopt -s globstar
+mkdir -p _tmp/globstar/a/b && cd _tmp/globstar && touch x.c a/y.c a/b/z.c
+echo **/*.c
+shopt -s globstar
+echo **/*.c
+echo a/**/
+## STDOUT:
+a/y.c
+a/b/z.c a/y.c x.c
+a/ a/b/
+## END
+## N-I dash/mksh/ash STDOUT:
+a/y.c
+a/y.c
+a/b/
+## END
+
+### globstar lists symlinks to directories, but doesn't follow them
+mkdir -p _tmp/globstar-link/a _tmp/globstar-link/t
+cd _tmp/globstar-link && touch t/z.c && rm -f link && ln -s t link
+shopt -s globstar
+echo **/
+echo **/*.c
+## STDOUT:
+a/ link/ t/
+t/z.c
+## END
+## N-I dash/mksh/ash STDOUT:
+a/ link/ t/
+link/z.c t/z.c
+## END
+
+### shopt -s nocaseglob
+mkdir -p _tmp/nocaseglob && cd _tmp/nocaseglob && touch a.C b.c
+echo *.c
+shopt -s nocaseglob
+echo *.c
+## STDOUT:
+b.c
+a.C b.c
+## END
+## N-I dash/mksh/ash STDOUT:
+b.c
+b.c
+## END
@@ -40,6 +40,25 @@ for i in -{a,b} {c,d}-; do
 # stdout-json: "-a\n-b\nc-\nd-\n"
 # N-I dash stdout-json: "-{a,b}\n{c,d}-\n"
 
+### Range in for loop, with break
+for i in {1..1000000}; do
+  if test $i = 3; then
+    break
+  fi
+done
+echo $i
+# stdout: 3
+# N-I dash stdout: {1..1000000}
+
+### Words after a range are evaluated before the loop
+i=0
+for x in {1..2} $i {a,} "$((i+1))"; do
+  i=9
+  echo $x
+done
+# stdout-json: "1\n2\n0\na\n1\n"
+# N-I dash stdout-json: "{1..2}\n0\n{a,}\n1\n"
+
 ### using loop var outside loop
 func() {
   for i in a b c; do
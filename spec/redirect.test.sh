@@ -277,3 +277,30 @@ echo second 1>&8
 echo CONTENTS
 cat $TMP/rw.txt
 # stdout-json: "line=first\nCONTENTS\nfirst\nsecond\n"
+
+### Output of a builtin goes to the redirected file
+shopt -p nullglob > $TMP/shopt.txt
+echo ---
+cat $TMP/shopt.txt
+# stdout-json: "---\nshopt -u nullglob\n"
+# N-I dash/mksh stdout-json: "---\n"
+
+### Output of echo comes before output of a background job
+{ sleep 0.05; echo b; } &
+echo a
+wait
+# stdout-json: "a\nb\n"
+
+### Failed write of buffered output is the subshell's status
+# bash exits 141 from SIGPIPE, or 1 if SIGPIPE is ignored.  osh exits 1.
+set -o pipefail
+(sleep 0.3; echo a) | true
+test $? -ne 0 && echo failed
+# stdout: failed
+# N-I dash stdout-json: ""
+# N-I dash status: 2
+
+### Failed write of echo to a full device
+echo hi > /dev/full
+echo status=$?
+# stdout: status=1
@@ -97,6 +97,13 @@ echo ${s//[[:alpha:]]/y} ${s//[^[:alpha:]]/-}
 # N-I dash status: 2
 # N-I dash stdout-json: ""
 
+### Replace escaped glob chars
+s='a*b*c'
+echo ${s//\*/-} "${s/#a\*/X}" ${s/%[bc]/X}
+# stdout: a-b-c Xb*c a*b*X
+# N-I dash status: 2
+# N-I dash stdout-json: ""
+
 ### Pattern replacement ${v/} is not valid
 v=abcde
 echo -${v/}-
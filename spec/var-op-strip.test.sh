@@ -87,3 +87,17 @@ argv "${s%%abcde}" "${s%abcde}" "${s#abcde}" "${s##abcde}"
 
 
 
+
+### Strip with character classes and escaped glob chars
+s='ab12*cd'
+argv.py "${s##*[[:digit:]]}" "${s%%[![:alpha:]]*}" "${s#*\*}" "${s%[b-d]}"
+## STDOUT:
+['*cd', 'ab', 'cd', 'ab12*c']
+## END
+
+### Strip the empty prefix and suffix
+s='abc'
+argv.py "${s#*}" "${s%*}" "${s##*}" "${s%%*}"
+## STDOUT:
+['abc', 'abc', '', '']
+## END
@@ -75,12 +75,45 @@ EOF
 # TODO: test while loop
 }
 
+# Commands from a script or stdin run as they're parsed, so the first one
+# shouldn't wait for the rest of the input.
+osh-stdin-streaming() {
+  { echo 'echo first'
+    sleep 1
+    echo 'echo second'
+  } | $OSH | while read line; do
+    echo "$(date +%s) $line"
+  done > _tmp/streaming.txt
+
+  cat _tmp/streaming.txt
+  local first second
+  read first _ < <(sed -n 1p _tmp/streaming.txt)
+  read second _ < <(sed -n 2p _tmp/streaming.txt)
+  assert $second -gt $first
+}
+
 osh-interactive() {
   echo 'echo hi' | $OSH -i
 
   echo 'exit' | $OSH -i
 }
 
+# The arena is released after each interactive command, unless it defines a
+# function, so its size should be the same after every iteration.
+osh-interactive-arena() {
+  local n=${1:-100000}
+
+  { echo 'f() { echo "$1"; }'
+    for i in $(seq $n); do
+      echo "x=\$((x+1)); f \$x > /dev/null"
+    done
+  } | $OSH -i --print-status | grep '^ARENA' | sort | uniq -c > _tmp/arena.txt
+
+  cat _tmp/arena.txt
+  # The size after the function definition is the size after every command.
+  assert $(wc -l < _tmp/arena.txt) -eq 1
+}
+
 die() {
   echo 1>&2 "$@"
   exit 1
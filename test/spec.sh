@@ -340,7 +340,7 @@ command_() {
 }
 
 pipeline() {
-  sh-spec spec/pipeline.test.sh --osh-failures-allowed 3 \
+  sh-spec spec/pipeline.test.sh --osh-failures-allowed 1 \
     ${REF_SHELLS[@]} $ZSH $OSH "$@"
 }
 
@@ -397,7 +397,7 @@ var-op-test() {
 }
 
 var-op-other() {
-  sh-spec spec/var-op-other.test.sh --osh-failures-allowed 2 \
+  sh-spec spec/var-op-other.test.sh --osh-failures-allowed 1 \
     ${REF_SHELLS[@]} $OSH "$@"
 }
 
@@ -502,8 +502,8 @@ dparen() {
 }
 
 brace-expansion() {
-  # TODO for osh: implement num ranges, mark char ranges unimplemented?
-  sh-spec spec/brace-expansion.test.sh --osh-failures-allowed 12 \
+  # TODO for osh: tilde expansion inside braces
+  sh-spec spec/brace-expansion.test.sh --osh-failures-allowed 2 \
     $BASH $MKSH $ZSH $OSH "$@"
 }
 